@@ -1,2 +1,4 @@
 from .matches import MatchSet, Match
-from .orders import OrderSet, BuyOrder, SellOrder
\ No newline at end of file
+from .orders import OrderSet, BuyOrder, SellOrder
+from .storage import save_orderset, load_orderset, save_matchset, load_matchset
+from .messages import parse_order, parse_orders_message
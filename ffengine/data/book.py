@@ -0,0 +1,203 @@
+import heapq
+from dataclasses import replace
+from typing import Dict, Iterator, List, Union
+
+from .orders import BuyOrder, SellOrder, OrderSet
+from .matches import MatchSet
+
+
+class OrderBook:
+    '''A long lived set of orders that carries unmatched orders over from round to round.
+
+    Unlike `OrderSet`, orders can be removed (explicitly, when they expire or when they are filled), so int order ids
+    are handed out monotonically and never reused rather than being positions. Every change is logged until the
+    consumer (e.g. `IncrementalOMMEngine`) collects it with `pop_changes`, so work per round can follow the churn
+    instead of the book size.
+    '''
+
+    def __init__(self):
+        self._buy_orders = {}  # int_order_id -> BuyOrder
+        self._sell_orders = {} # int_order_id -> SellOrder
+        self._all_orders = {}  # order_id -> order
+
+        self._buyers = {}
+        self._sellers = {}
+        self._products = {}
+
+        # int_product_id -> {int_order_id}, candidates for new orders of the same product
+        self._buys_by_product = {}
+        self._sells_by_product = {}
+
+        # (time_expiry, order_id), entries of removed orders are skipped lazily
+        self._expiry_heap = []
+
+        self._next_buy_id = 0
+        self._next_sell_id = 0
+
+        self._reset_changes()
+
+    def _reset_changes(self):
+        self._changes = {
+            'added_buy': set(), 'added_sell': set(),
+            'removed_buy': set(), 'removed_sell': set(),
+            'changed_sell': set(),
+        }
+
+    @property
+    def n_buy_orders(self):
+        return len(self._buy_orders)
+
+    @property
+    def n_sell_orders(self):
+        return len(self._sell_orders)
+
+    @property
+    def total_orders(self):
+        return self.n_buy_orders + self.n_sell_orders
+
+    def _intern(self, table: dict, key: str) -> int:
+        if key not in table:
+            table[key] = len(table)
+        return table[key]
+
+    def add_buy_order(self, order: BuyOrder):
+        if order.order_id in self._all_orders:
+            raise ValueError(f"Buy Order: {order.order_id} already exists in orderbook")
+
+        order.int_order_id = self._next_buy_id
+        order.int_buyer_id = self._intern(self._buyers, order.buyer_id)
+        order.int_product_id = self._intern(self._products, order.product_id)
+        self._next_buy_id += 1
+
+        self._buy_orders[order.int_order_id] = order
+        self._all_orders[order.order_id] = order
+        self._buys_by_product.setdefault(order.int_product_id, set()).add(order.int_order_id)
+        heapq.heappush(self._expiry_heap, (order.time_expiry, order.order_id))
+
+        self._changes['added_buy'].add(order.int_order_id)
+
+    def add_sell_order(self, order: SellOrder):
+        if order.order_id in self._all_orders:
+            raise ValueError(f"Sell Order: {order.order_id} already exists in orderbook")
+
+        order.int_order_id = self._next_sell_id
+        order.int_seller_id = self._intern(self._sellers, order.seller_id)
+        order.int_product_id = self._intern(self._products, order.product_id)
+        self._next_sell_id += 1
+
+        self._sell_orders[order.int_order_id] = order
+        self._all_orders[order.order_id] = order
+        self._sells_by_product.setdefault(order.int_product_id, set()).add(order.int_order_id)
+        heapq.heappush(self._expiry_heap, (order.time_expiry, order.order_id))
+
+        self._changes['added_sell'].add(order.int_order_id)
+
+    def remove_order(self, order_id: str) -> Union[BuyOrder, SellOrder]:
+        order = self._all_orders.pop(order_id)
+
+        if isinstance(order, BuyOrder):
+            self._buy_orders.pop(order.int_order_id)
+            self._buys_by_product[order.int_product_id].discard(order.int_order_id)
+            self._log_removal('buy', order.int_order_id)
+        else:
+            self._sell_orders.pop(order.int_order_id)
+            self._sells_by_product[order.int_product_id].discard(order.int_order_id)
+            self._log_removal('sell', order.int_order_id)
+
+        return order
+
+    def _log_removal(self, side: str, int_order_id: int):
+        # an order added and removed between two `pop_changes` never reaches the consumer
+        if int_order_id in self._changes[f'added_{side}']:
+            self._changes[f'added_{side}'].discard(int_order_id)
+        else:
+            self._changes[f'removed_{side}'].add(int_order_id)
+
+        if side == 'sell':
+            self._changes['changed_sell'].discard(int_order_id)
+
+    def expire(self, now: int) -> List[Union[BuyOrder, SellOrder]]:
+        '''remove every order with `time_expiry` < `now`, O(k log n) for k expired orders'''
+        expired = []
+        while self._expiry_heap and self._expiry_heap[0][0] < now:
+            time_expiry, order_id = heapq.heappop(self._expiry_heap)
+            order = self._all_orders.get(order_id)
+
+            # stale entry: order already removed (or re-added with another expiry)
+            if order is None or order.time_expiry != time_expiry:
+                continue
+            expired.append(self.remove_order(order_id))
+
+        return expired
+
+    def apply_matches(self, matchset: MatchSet):
+        '''carry the book over to the next round: matched buy orders are filled completely (all or nothing) and
+        removed, matched sell orders keep their remaining quantity'''
+        filled = {}
+        for match in matchset.iter_matches():
+            filled[match.sell_order.order_id] = filled.get(match.sell_order.order_id, 0) + match.quantity
+            if match.buy_order.order_id in self._all_orders:
+                self.remove_order(match.buy_order.order_id)
+
+        for order_id, quantity in filled.items():
+            order = self._all_orders.get(order_id)
+            if order is None:
+                continue
+
+            remaining = order.quantity - quantity
+            if remaining <= 0:
+                self.remove_order(order_id)
+            else:
+                # replace rather than mutate, matches keep pointing at the order as it was matched
+                order = replace(order, quantity=remaining)
+                self._sell_orders[order.int_order_id] = order
+                self._all_orders[order_id] = order
+                if order.int_order_id not in self._changes['added_sell']:
+                    self._changes['changed_sell'].add(order.int_order_id)
+
+    def pop_changes(self) -> Dict[str, set]:
+        '''int order ids added, removed or changed (sell quantity) since the last call'''
+        changes = self._changes
+        self._reset_changes()
+        return changes
+
+    def get_buy_order(self, int_order_id: int) -> BuyOrder:
+        return self._buy_orders[int_order_id]
+
+    def get_sell_order(self, int_order_id: int) -> SellOrder:
+        return self._sell_orders[int_order_id]
+
+    def get_buy_candidates(self, int_product_id: int) -> set:
+        '''int ids of the buy orders for a product'''
+        return self._buys_by_product.get(int_product_id, set())
+
+    def get_sell_candidates(self, int_product_id: int) -> set:
+        '''int ids of the sell orders for a product'''
+        return self._sells_by_product.get(int_product_id, set())
+
+    def iter_buy_orders(self) -> Iterator[BuyOrder]:
+        for u in self._buy_orders.values():
+            yield u
+
+    def iter_sell_orders(self) -> Iterator[SellOrder]:
+        for v in self._sell_orders.values():
+            yield v
+
+    def to_orderset(self) -> OrderSet:
+        '''snapshot of the book as an OrderSet, for engines without an incremental mode. Orders are copied since
+        OrderSet assigns its own int ids'''
+        orderset = OrderSet()
+        for u in self.iter_buy_orders():
+            orderset.add_buy_order(replace(u))
+        for v in self.iter_sell_orders():
+            orderset.add_sell_order(replace(v))
+        return orderset
+
+    def __len__(self):
+        return self.total_orders
+
+    def __contains__(self, order_id):
+        return order_id in self._all_orders
+
+    def __getitem__(self, order_id):
+        return self._all_orders[order_id]
@@ -1,10 +1,20 @@
+import json
 from dataclasses import dataclass
-from typing import Iterator
+from typing import Dict, Iterator, List
 
-from typing import List
+import numpy as np
 
 from .orders import BuyOrder, SellOrder
 
+# column layout of `MatchSet.to_columns` {column: dtype}, rows are indexed by `match_id`
+MATCH_COLUMNS = {
+    "match_id": np.int64,
+    "int_buy_order_id": np.int64,
+    "int_sell_order_id": np.int64,
+    "price_cents": np.float64,
+    "quantity": np.int64,
+}
+
 @dataclass
 class Match:
     buy_order: BuyOrder
@@ -24,27 +34,137 @@ class Match:
 
 
 class MatchSet:
-    def __init__(self):
-        self._matches = []
+    '''Matches held as columns (see `MATCH_COLUMNS`): int order ids, price and quantity, no object per match.
+
+    Engines add whole solutions at once with `add_matches` (or `MatchSet.from_arrays`), orders are then resolved in
+    `orderset` by `int_order_id`. `add_match` still takes single `Match`es, their orders are kept as they were when
+    matched (needed when the orders change afterwards, e.g. in an `OrderBook`).
+
+    `iter_matches` builds `Match` views on the fly for existing callers, `to_records`/`to_json`/`to_arrow` export in
+    bulk, looking up the string order ids in one vectorized step.
+    '''
+
+    def __init__(self, orderset=None):
+        self.orderset = orderset
         self.n_matches = 0
-        self._matched_buyers = set()
-        self._matched_sellers = set()
-    
+
+        # column chunks, concatenated on demand
+        self._chunks = {col: [] for col in MATCH_COLUMNS}
+        self._pending = {col: [] for col in MATCH_COLUMNS} # single matches not yet in a chunk
+        self._columns = None
+
+        # int_order_id -> order, for matches added with `add_match`
+        self._buy_orders = {}
+        self._sell_orders = {}
+
+    @classmethod
+    def from_arrays(cls, orderset, int_buy_order_id, int_sell_order_id, price_cents, quantity) -> "MatchSet":
+        matches = cls(orderset)
+        matches.add_matches(int_buy_order_id, int_sell_order_id, price_cents, quantity)
+        return matches
+
+    def add_matches(self, int_buy_order_id, int_sell_order_id, price_cents, quantity):
+        '''add many matches of orders in `self.orderset`, given as arrays of int order ids, prices and quantities'''
+        assert self.orderset is not None, "add_matches needs the OrderSet the matches were made on"
+        n = len(int_buy_order_id)
+        assert len(int_sell_order_id) == len(price_cents) == len(quantity) == n, "match columns have different lengths"
+
+        self._flush()
+        for col, values in zip(MATCH_COLUMNS, (np.arange(self.n_matches, self.n_matches + n), int_buy_order_id, int_sell_order_id, price_cents, quantity)):
+            self._chunks[col].append(np.asarray(values, dtype=MATCH_COLUMNS[col]))
+        self.n_matches += n
+        self._columns = None
+
     def add_match(self, match: Match):
         match.match_id = self.n_matches
-        self._matches.append(match)
+        self._buy_orders[match.buy_order.int_order_id] = match.buy_order
+        self._sell_orders[match.sell_order.int_order_id] = match.sell_order
+
+        for col, value in zip(MATCH_COLUMNS, (match.match_id, match.buy_order.int_order_id, match.sell_order.int_order_id, match.price_cents, match.quantity)):
+            self._pending[col].append(value)
         self.n_matches += 1
+        self._columns = None
+
+    def _flush(self):
+        if self._pending['match_id']:
+            for col, dtype in MATCH_COLUMNS.items():
+                self._chunks[col].append(np.array(self._pending[col], dtype=dtype))
+                self._pending[col] = []
 
-        self._matched_buyers.add(match.buy_order.int_buyer_id)
-        self._matched_sellers.add(match.sell_order.int_seller_id)
+    def to_columns(self) -> Dict[str, np.ndarray]:
+        '''the matches as arrays (see `MATCH_COLUMNS`)'''
+        if self._columns is None:
+            self._flush()
+            self._columns = {
+                col: np.concatenate(self._chunks[col]) if self._chunks[col] else np.zeros(0, dtype=dtype)
+                for col, dtype in MATCH_COLUMNS.items()
+            }
+            self._chunks = {col: [arr] for col, arr in self._columns.items()}
+        return self._columns
 
-    def iter_matches(self) -> Iterator:
-        for m in self._matches:
-            yield m
+    def get_buy_order(self, int_order_id: int) -> BuyOrder:
+        if int_order_id in self._buy_orders:
+            return self._buy_orders[int_order_id]
+        return self.orderset.get_buy_order(int_order_id)
+
+    def get_sell_order(self, int_order_id: int) -> SellOrder:
+        if int_order_id in self._sell_orders:
+            return self._sell_orders[int_order_id]
+        return self.orderset.get_sell_order(int_order_id)
+
+    def iter_matches(self) -> Iterator[Match]:
+        col = self.to_columns()
+        for i, u, v, price, quantity in zip(*(col[c].tolist() for c in MATCH_COLUMNS)):
+            yield Match(buy_order=self.get_buy_order(u), sell_order=self.get_sell_order(v), price_cents=price, quantity=quantity, match_id=i)
+
+    def _order_ids(self, side: str) -> List[str]:
+        '''string order ids of every match's buy/sell orders'''
+        ids = self.to_columns()[f'int_{side}_order_id']
+        orders = self._buy_orders if side == 'buy' else self._sell_orders
+        if len(ids) == 0:
+            return []
+        if not orders:
+            # one fancy indexing step on the OrderSet's columns
+            columns = self.orderset.get_buy_columns() if side == 'buy' else self.orderset.get_sell_columns()
+            return columns['order_id'][ids].tolist()
+
+        get_order = self.get_buy_order if side == 'buy' else self.get_sell_order
+        return [get_order(i).order_id for i in ids.tolist()]
+
+    def _agent_ids(self, side: str) -> set:
+        ids = self.to_columns()[f'int_{side}_order_id']
+        orders = self._buy_orders if side == 'buy' else self._sell_orders
+        agent = 'int_buyer_id' if side == 'buy' else 'int_seller_id'
+        if len(ids) == 0:
+            return set()
+        if not orders:
+            columns = self.orderset.get_buy_columns() if side == 'buy' else self.orderset.get_sell_columns()
+            return set(np.unique(columns[agent][ids]).tolist())
+
+        get_order = self.get_buy_order if side == 'buy' else self.get_sell_order
+        return {getattr(get_order(i), agent) for i in ids.tolist()}
+
+    def to_records(self) -> List[dict]:
+        '''every match in the `Match.to_dict` shape'''
+        col = self.to_columns()
+        return [
+            {"matchId": i, "buyOrder": u, "sellOrder": v, "volume": quantity, "priceCents": price}
+            for i, u, v, quantity, price in zip(
+                col['match_id'].tolist(), self._order_ids('buy'), self._order_ids('sell'), col['quantity'].tolist(), col['price_cents'].tolist()
+            )
+        ]
+
+    def to_json(self) -> str:
+        return json.dumps(self.to_records())
+
+    def to_arrow(self):
+        '''the columns plus the string order ids as a `pyarrow.Table` (pyarrow is optional)'''
+        import pyarrow as pa
+
+        return pa.table({**self.to_columns(), "buy_order_id": self._order_ids('buy'), "sell_order_id": self._order_ids('sell')})
 
     def get_matched_buyers(self) -> List[int]:
-        return self._matched_buyers.copy()
+        return self._agent_ids('buy')
 
     def get_matched_sellers(self) -> List[int]:
-        return self._matched_sellers.copy()
-
+        return self._agent_ids('sell')
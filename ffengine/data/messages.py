@@ -0,0 +1,72 @@
+from typing import List, Tuple, Union
+
+from .orders import BuyOrder, SellOrder
+
+# order-created messages, as the FieldFresh API sends them to the matching service and as `ffengine.stream` reads them:
+# v1: one order per message {"type": "buyOrder.created", "message": {"totalMessageCount", "batchId", "message": {order}}}
+#     totalMessageCount is the number of orders of the message's type (buy or sell) in the batch
+# v2: many orders per message {"version": PROTOCOL_VERSION, "type": "orders.batch",
+#         "message": {"totalBuyOrders", "totalSellOrders", "batchId", "messages": [{"type": "buyOrder.created", "message": {order}}, ...]}}
+# both: an optional "allowPartialFill": true next to "batchId" lets the batch's buy orders be partially filled,
+#       an optional "marketId" names the market the batch belongs to
+PROTOCOL_VERSION = "custom-order-json--2.0.0"
+SINGLE_ORDER_PROTOCOL_VERSION = "custom-order-json--1.0.0"
+ORDER_BATCH_TYPE = "orders.batch"
+BUY_ORDER_TYPE, SELL_ORDER_TYPE = "buyOrder.created", "sellOrder.created"
+
+
+def parse_order(order_type: str, order_info: dict) -> Union[BuyOrder, SellOrder]:
+    order_id = order_info["id"]
+    agent_id = order_info["proxyId"]
+    product_id = order_info["productId"]
+    quantity = int(order_info["volume"])
+    activ_time = order_info["earliestDate"]["seconds"]
+    expir_time = order_info["latestDate"]["seconds"]
+    lat, long = order_info["lat"], order_info["long"]
+
+    order=None
+    if order_type == BUY_ORDER_TYPE:
+        price = int(order_info["maxPriceCents"])
+
+        order = BuyOrder(
+            order_id=order_id, buyer_id=agent_id, product_id=product_id,
+            max_price_cents=price, quantity=quantity,
+            time_activation=activ_time, time_expiry=expir_time,
+            lat=lat, long=long
+        )
+
+    elif order_type == SELL_ORDER_TYPE:
+        price = int(order_info["minPriceCents"])
+        service_range = order_info["serviceRadius"]
+
+        order = SellOrder(
+            order_id=order_id, seller_id=agent_id, product_id=product_id,
+            min_price_cents=price, quantity=quantity,
+            time_activation=activ_time, time_expiry=expir_time,
+            lat=lat, long=long, service_range=service_range
+        )
+
+    return order
+
+
+def parse_orders_message(data: dict) -> Tuple[List[Tuple[str, Union[BuyOrder, SellOrder]]], dict]:
+    '''a decoded message of either protocol version -> (orders, batch_info): `orders` is a list of (order_type, order),
+    `batch_info` has the batch's "batchId", "totalOrders" (order_type -> number of orders of that type in the batch),
+    "allowPartialFill" and "marketId". Raises ValueError on a message (or an order in it) of another type'''
+    if data["type"] == ORDER_BATCH_TYPE:
+        orders = [(m["type"], parse_order(m["type"], m["message"])) for m in data["message"]["messages"]]
+        totals = {BUY_ORDER_TYPE: data["message"]["totalBuyOrders"], SELL_ORDER_TYPE: data["message"]["totalSellOrders"]}
+    else:
+        orders = [(data["type"], parse_order(data["type"], data["message"]["message"]))]
+        totals = {data["type"]: data["message"]["totalMessageCount"]}
+
+    for order_type, _ in orders:
+        if order_type not in (BUY_ORDER_TYPE, SELL_ORDER_TYPE):
+            raise ValueError(f"unknown order message type {order_type!r}")
+
+    return orders, {
+        "totalOrders": totals,
+        "batchId": data["message"]["batchId"],
+        "allowPartialFill": bool(data["message"].get("allowPartialFill", False)),
+        "marketId": data["message"].get("marketId", "default"),
+    }
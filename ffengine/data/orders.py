@@ -1,5 +1,94 @@
+import sys
 from dataclasses import dataclass
-from typing import List, Iterator 
+from typing import List, Iterator, Dict, Hashable, Tuple
+
+import numpy as np
+
+# column layout of `OrderSet.get_buy_columns` / `OrderSet.get_sell_columns` {column: dtype}, rows are indexed by `int_order_id`
+BUY_COLUMNS = {
+    "order_id": str,
+    "int_buyer_id": np.int64,
+    "int_product_id": np.int64,
+    "max_price_cents": np.int64,
+    "quantity": np.int64,
+    "time_activation": np.int64,
+    "time_expiry": np.int64,
+    "lat": np.float64,
+    "long": np.float64,
+}
+
+SELL_COLUMNS = {
+    "order_id": str,
+    "int_seller_id": np.int64,
+    "int_product_id": np.int64,
+    "min_price_cents": np.int64,
+    "quantity": np.int64,
+    "time_activation": np.int64,
+    "time_expiry": np.int64,
+    "service_range": np.float64,
+    "lat": np.float64,
+    "long": np.float64,
+}
+
+# width of the time buckets of the secondary indexes (see `OrderSet.get_buy_ids_by_time_bucket`)
+TIME_BUCKET_SECONDS = 3600
+
+def build_columns(orders: Iterator, layout: Dict[str, type]) -> Dict[str, np.ndarray]:
+    '''turn an iterable of orders into a dict of arrays following `layout`'''
+    orders = list(orders)
+    return {
+        col: np.array([getattr(o, col) for o in orders], dtype=dtype) if orders else np.zeros(0, dtype=dtype)
+        for col, dtype in layout.items()
+    }
+
+def _intern(s):
+    '''one shared object per distinct agent/product id string instead of one per parsed order'''
+    return sys.intern(s) if type(s) is str else s
+
+
+class IdIndex:
+    '''Secondary index: key -> the int order ids with that key, ascending, each key's ids in one contiguous array
+    that grows by doubling (amortized O(1) per added id). `get` returns a view, no copy'''
+
+    def __init__(self):
+        self._ids: Dict[Hashable, np.ndarray] = {}
+        self._n: Dict[Hashable, int] = {}
+
+    @classmethod
+    def from_keys(cls, keys: np.ndarray) -> "IdIndex":
+        '''bulk build from the key of every id (`keys[i]` is id i's key), one stable sort'''
+        index = cls()
+        keys = np.asarray(keys)
+        order = np.argsort(keys, kind="stable")
+        unique, starts = np.unique(keys[order], return_index=True)
+        for key, ids in zip(unique.tolist(), np.split(order, starts[1:])):
+            index._ids[key], index._n[key] = ids.astype(np.int64), len(ids)
+        return index
+
+    def add(self, key: Hashable, int_id: int):
+        n = self._n.get(key, 0)
+        ids = self._ids.get(key)
+        if ids is None:
+            ids = self._ids[key] = np.zeros(4, dtype=np.int64)
+        elif n == len(ids):
+            ids = self._ids[key] = np.resize(ids, 2*n)
+        ids[n] = int_id
+        self._n[key] = n + 1
+
+    def get(self, key: Hashable) -> np.ndarray:
+        n = self._n.get(key, 0)
+        return self._ids[key][:n] if n else np.zeros(0, dtype=np.int64)
+
+    def keys(self) -> List[Hashable]:
+        return list(self._ids)
+
+    def __len__(self):
+        return len(self._ids)
+
+
+def time_bucket(t: int) -> int:
+    return int(t) // TIME_BUCKET_SECONDS
+
 
 @dataclass
 class SellOrder:
@@ -73,6 +162,19 @@ class OrderSet:
 
         self._all_orders = {}
 
+        # int_order_id -> order
+        self._buy_list = []
+        self._sell_list = []
+
+        # cached columnar views, reset whenever an order is added
+        self._buy_columns = None
+        self._sell_columns = None
+
+        # secondary indexes, maintained by add_buy_order/add_sell_order: "product" (int_product_id), "agent"
+        # (int_buyer_id/int_seller_id) and "time_bucket" (of time_activation) -> int order ids
+        self._buy_index = {"product": IdIndex(), "agent": IdIndex(), "time_bucket": IdIndex()}
+        self._sell_index = {"product": IdIndex(), "agent": IdIndex(), "time_bucket": IdIndex()}
+
         self.n_sell_orders = 0
         self.n_buy_orders = 0
         self.n_sellers = 0
@@ -89,8 +191,8 @@ class OrderSet:
         new_int_agent = len(self._buyers)
         new_int_product = len(self._products)
 
-        agent = order.buyer_id
-        product = order.product_id
+        agent = order.buyer_id = _intern(order.buyer_id)
+        product = order.product_id = _intern(order.product_id)
 
         if not (agent in self._buyers):
             self._buyers[agent] = new_int_agent
@@ -107,6 +209,9 @@ class OrderSet:
             order.int_buyer_id = self._buyers[agent]
             order.int_product_id = self._products[product]
             self._all_orders[order.order_id] = order
+            self._buy_list.append(order)
+            self._buy_columns = None
+            self._index_order(self._indexes('buy'), new_int_id, order.int_product_id, order.int_buyer_id, order.time_activation)
         else:
             raise ValueError(f"Buy Order: {order.order_id} already exists in orderset")
 
@@ -118,8 +223,8 @@ class OrderSet:
         new_int_product = len(self._products)
 
 
-        agent = order.seller_id
-        product = order.product_id
+        agent = order.seller_id = _intern(order.seller_id)
+        product = order.product_id = _intern(order.product_id)
 
         if not (agent in self._sellers):
             self._sellers[agent] = new_int_agent
@@ -136,10 +241,49 @@ class OrderSet:
             order.int_product_id = self._products[product]
 
             self._all_orders[order.order_id] = order
+            self._sell_list.append(order)
+            self._sell_columns = None
+            self._index_order(self._indexes('sell'), new_int_id, order.int_product_id, order.int_seller_id, order.time_activation)
         else:
             raise ValueError(f"Sell Order: {order.order_id} already exists in orderset")
 
 
+    @staticmethod
+    def _index_order(index: Dict[str, IdIndex], int_order_id: int, int_product_id: int, int_agent_id: int, time_activation: int):
+        index["product"].add(int_product_id, int_order_id)
+        index["agent"].add(int_agent_id, int_order_id)
+        index["time_bucket"].add(time_bucket(time_activation), int_order_id)
+
+    def _indexes(self, side: str) -> Dict[str, IdIndex]:
+        return self._buy_index if side == 'buy' else self._sell_index
+
+    def get_buy_ids_by_product(self, int_product_id: int) -> np.ndarray:
+        '''int ids of the buy orders for a product, ascending'''
+        return self._indexes('buy')["product"].get(int_product_id)
+
+    def get_sell_ids_by_product(self, int_product_id: int) -> np.ndarray:
+        return self._indexes('sell')["product"].get(int_product_id)
+
+    def get_buy_ids_by_agent(self, int_buyer_id: int) -> np.ndarray:
+        '''int ids of a buyer's orders, ascending'''
+        return self._indexes('buy')["agent"].get(int_buyer_id)
+
+    def get_sell_ids_by_agent(self, int_seller_id: int) -> np.ndarray:
+        return self._indexes('sell')["agent"].get(int_seller_id)
+
+    def get_buy_ids_by_time_bucket(self, bucket: int) -> np.ndarray:
+        '''int ids of the buy orders activated in `bucket` (see `time_bucket`), ascending'''
+        return self._indexes('buy')["time_bucket"].get(bucket)
+
+    def get_sell_ids_by_time_bucket(self, bucket: int) -> np.ndarray:
+        return self._indexes('sell')["time_bucket"].get(bucket)
+
+    def iter_products(self) -> Iterator[Tuple[int, np.ndarray, np.ndarray]]:
+        '''(int_product_id, buy ids, sell ids) of every product with orders on both sides'''
+        buys, sells = self._indexes('buy')["product"], self._indexes('sell')["product"]
+        for k in sorted(set(buys.keys()) & set(sells.keys())):
+            yield k, buys.get(k), sells.get(k)
+
     def iter_buy_orders(self) -> Iterator[BuyOrder]:
         for u in self._buy_orders.values():
             yield u
@@ -149,6 +293,36 @@ class OrderSet:
         for v in self._sell_orders.values():
             yield v
 
+    def get_buy_order(self, int_order_id: int) -> BuyOrder:
+        return self._buy_list[int_order_id]
+
+    def get_sell_order(self, int_order_id: int) -> SellOrder:
+        return self._sell_list[int_order_id]
+
+    def get_buy_columns(self) -> Dict[str, np.ndarray]:
+        '''columnar view of the buy orders (see `BUY_COLUMNS`), row i is the order with `int_order_id` i'''
+        if self._buy_columns is None:
+            self._buy_columns = build_columns(self.iter_buy_orders(), BUY_COLUMNS)
+        return self._buy_columns
+
+    def get_sell_columns(self) -> Dict[str, np.ndarray]:
+        '''columnar view of the sell orders (see `SELL_COLUMNS`), row i is the order with `int_order_id` i'''
+        if self._sell_columns is None:
+            self._sell_columns = build_columns(self.iter_sell_orders(), SELL_COLUMNS)
+        return self._sell_columns
+
+    def get_buyer_table(self) -> List[str]:
+        '''buyer ids indexed by `int_buyer_id`'''
+        return list(self._buyers)
+
+    def get_seller_table(self) -> List[str]:
+        '''seller ids indexed by `int_seller_id`'''
+        return list(self._sellers)
+
+    def get_product_table(self) -> List[str]:
+        '''product ids indexed by `int_product_id`'''
+        return list(self._products)
+
     def __len__(self):
         return self.n_buy_orders + self.n_sell_orders
 
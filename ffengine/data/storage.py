@@ -0,0 +1,269 @@
+import json
+import os
+from typing import Dict
+
+import numpy as np
+
+from .orders import OrderSet, BuyOrder, SellOrder, IdIndex, BUY_COLUMNS, SELL_COLUMNS, TIME_BUCKET_SECONDS
+from .matches import MatchSet, MATCH_COLUMNS
+
+## Columnar on-disk format for OrderSets and MatchSets
+#
+# A saved set is a directory holding one raw `.npy` array per column plus a `meta.json` header:
+#
+#   meta.json               format name/version and counts
+#   buy.<column>.npy        one array per entry of `BUY_COLUMNS` (order ids are stored as a fixed width string table)
+#   sell.<column>.npy       one array per entry of `SELL_COLUMNS`
+#   buyers.npy, sellers.npy, products.npy
+#                           string tables mapping int agent/product ids back to their string ids
+#
+# `.npy` files (unlike `.npz` archives) can be memory mapped, so loading only reads the headers.
+
+ORDERSET_FORMAT = "ffengine-orderset"
+MATCHSET_FORMAT = "ffengine-matchset"
+FORMAT_VERSION = 1
+
+
+def _write_meta(path: str, meta: dict):
+    with open(os.path.join(path, "meta.json"), "w") as f:
+        json.dump(meta, f)
+
+
+def _read_meta(path: str, fmt: str) -> dict:
+    with open(os.path.join(path, "meta.json")) as f:
+        meta = json.load(f)
+
+    assert meta.get("format") == fmt, f"{path} is not a saved {fmt}"
+    assert meta.get("version") == FORMAT_VERSION, f"unsupported {fmt} version: {meta.get('version')}"
+    return meta
+
+
+def _save_columns(path: str, prefix: str, columns: Dict[str, np.ndarray]):
+    for col, arr in columns.items():
+        np.save(os.path.join(path, f"{prefix}.{col}.npy"), np.asarray(arr), allow_pickle=False)
+
+
+def _load_columns(path: str, prefix: str, layout: dict, mmap: bool) -> Dict[str, np.ndarray]:
+    mmap_mode = "r" if mmap else None
+    return {
+        col: np.load(os.path.join(path, f"{prefix}.{col}.npy"), mmap_mode=mmap_mode, allow_pickle=False)
+        for col in layout
+    }
+
+
+def _string_table(strings) -> np.ndarray:
+    # an explicit dtype keeps empty tables loadable without pickling
+    strings = [str(s) for s in strings]
+    width = max([len(s) for s in strings], default=1)
+    return np.array(strings, dtype=f"<U{max(width, 1)}")
+
+
+#==============================================================================================================
+# OrderSet
+#==============================================================================================================
+
+class MappedOrderSet(OrderSet):
+    '''An OrderSet backed by (memory mapped) columns, as returned by `load_orderset`.
+
+    Engines can read `get_buy_columns`/`get_sell_columns` directly. Order dataclasses are only built when they are
+    asked for: single orders through `get_buy_order`/`get_sell_order`, the whole set on iteration, lookup by string id
+    or when new orders are added.
+    '''
+
+    def __init__(self, buy_columns: Dict[str, np.ndarray], sell_columns: Dict[str, np.ndarray], buyers: np.ndarray, sellers: np.ndarray, products: np.ndarray):
+        super().__init__()
+
+        self._buy_columns = buy_columns
+        self._sell_columns = sell_columns
+        self._buyer_table = buyers
+        self._seller_table = sellers
+        self._product_table = products
+
+        self.n_buy_orders = len(buy_columns["order_id"])
+        self.n_sell_orders = len(sell_columns["order_id"])
+        self.n_buyers = len(buyers)
+        self.n_sellers = len(sellers)
+        self.n_products = len(products)
+
+        self._built_buy_orders = {}
+        self._built_sell_orders = {}
+        self._materialized = False
+
+        # secondary indexes are bulk built from the columns when first used
+        self._buy_index = self._sell_index = None
+
+    def _indexes(self, side: str):
+        if self._buy_index is None:
+            self._buy_index, self._sell_index = (
+                {
+                    "product": IdIndex.from_keys(col["int_product_id"]),
+                    "agent": IdIndex.from_keys(col[agent]),
+                    "time_bucket": IdIndex.from_keys(np.asarray(col["time_activation"]) // TIME_BUCKET_SECONDS),
+                }
+                for col, agent in ((self._buy_columns, "int_buyer_id"), (self._sell_columns, "int_seller_id"))
+            )
+        return super()._indexes(side)
+
+    def _build_buy_order(self, i: int) -> BuyOrder:
+        if i not in self._built_buy_orders:
+            col = self._buy_columns
+            self._built_buy_orders[i] = BuyOrder(
+                order_id=str(col["order_id"][i]),
+                buyer_id=str(self._buyer_table[col["int_buyer_id"][i]]),
+                product_id=str(self._product_table[col["int_product_id"][i]]),
+                max_price_cents=int(col["max_price_cents"][i]),
+                quantity=int(col["quantity"][i]),
+                time_activation=int(col["time_activation"][i]),
+                time_expiry=int(col["time_expiry"][i]),
+                lat=float(col["lat"][i]),
+                long=float(col["long"][i]),
+                int_order_id=i,
+                int_buyer_id=int(col["int_buyer_id"][i]),
+                int_product_id=int(col["int_product_id"][i]),
+            )
+        return self._built_buy_orders[i]
+
+    def _build_sell_order(self, i: int) -> SellOrder:
+        if i not in self._built_sell_orders:
+            col = self._sell_columns
+            self._built_sell_orders[i] = SellOrder(
+                order_id=str(col["order_id"][i]),
+                seller_id=str(self._seller_table[col["int_seller_id"][i]]),
+                product_id=str(self._product_table[col["int_product_id"][i]]),
+                min_price_cents=int(col["min_price_cents"][i]),
+                quantity=int(col["quantity"][i]),
+                time_activation=int(col["time_activation"][i]),
+                time_expiry=int(col["time_expiry"][i]),
+                service_range=float(col["service_range"][i]),
+                lat=float(col["lat"][i]),
+                long=float(col["long"][i]),
+                int_order_id=i,
+                int_seller_id=int(col["int_seller_id"][i]),
+                int_product_id=int(col["int_product_id"][i]),
+            )
+        return self._built_sell_orders[i]
+
+    def _materialize(self):
+        '''build every order and the id lookups of the base OrderSet'''
+        if self._materialized:
+            return
+
+        # indexes come from the columns, before added orders reset them
+        self._indexes('buy')
+
+        self._buyers = {str(b): i for i, b in enumerate(self._buyer_table)}
+        self._sellers = {str(s): i for i, s in enumerate(self._seller_table)}
+        self._products = {str(p): i for i, p in enumerate(self._product_table)}
+
+        self._buy_list = [self._build_buy_order(i) for i in range(self.n_buy_orders)]
+        self._sell_list = [self._build_sell_order(i) for i in range(self.n_sell_orders)]
+
+        self._buy_orders = {o.order_id: o for o in self._buy_list}
+        self._sell_orders = {o.order_id: o for o in self._sell_list}
+        self._all_orders = {**self._buy_orders, **self._sell_orders}
+
+        self._materialized = True
+
+    def add_buy_order(self, order: BuyOrder):
+        self._materialize()
+        super().add_buy_order(order)
+
+    def add_sell_order(self, order: SellOrder):
+        self._materialize()
+        super().add_sell_order(order)
+
+    def iter_buy_orders(self):
+        self._materialize()
+        return super().iter_buy_orders()
+
+    def iter_sell_orders(self):
+        self._materialize()
+        return super().iter_sell_orders()
+
+    def get_buy_order(self, int_order_id: int) -> BuyOrder:
+        if self._materialized:
+            return super().get_buy_order(int_order_id)
+        return self._build_buy_order(int_order_id)
+
+    def get_sell_order(self, int_order_id: int) -> SellOrder:
+        if self._materialized:
+            return super().get_sell_order(int_order_id)
+        return self._build_sell_order(int_order_id)
+
+    def get_buyer_table(self):
+        return [str(b) for b in self._buyer_table] if not self._materialized else super().get_buyer_table()
+
+    def get_seller_table(self):
+        return [str(s) for s in self._seller_table] if not self._materialized else super().get_seller_table()
+
+    def get_product_table(self):
+        return [str(p) for p in self._product_table] if not self._materialized else super().get_product_table()
+
+    def __getitem__(self, order_id):
+        self._materialize()
+        return super().__getitem__(order_id)
+
+
+def save_orderset(orderset: OrderSet, path: str):
+    '''save `orderset` to the directory `path` (created if needed) in the columnar format described above'''
+    os.makedirs(path, exist_ok=True)
+
+    _save_columns(path, "buy", orderset.get_buy_columns())
+    _save_columns(path, "sell", orderset.get_sell_columns())
+
+    np.save(os.path.join(path, "buyers.npy"), _string_table(orderset.get_buyer_table()), allow_pickle=False)
+    np.save(os.path.join(path, "sellers.npy"), _string_table(orderset.get_seller_table()), allow_pickle=False)
+    np.save(os.path.join(path, "products.npy"), _string_table(orderset.get_product_table()), allow_pickle=False)
+
+    _write_meta(path, {
+        "format": ORDERSET_FORMAT,
+        "version": FORMAT_VERSION,
+        "n_buy_orders": orderset.n_buy_orders,
+        "n_sell_orders": orderset.n_sell_orders,
+        "n_buyers": orderset.n_buyers,
+        "n_sellers": orderset.n_sellers,
+        "n_products": orderset.n_products,
+    })
+
+
+def load_orderset(path: str, mmap: bool = True) -> MappedOrderSet:
+    '''load an OrderSet saved with `save_orderset`. With `mmap` the columns are memory mapped (read only)'''
+    meta = _read_meta(path, ORDERSET_FORMAT)
+    mmap_mode = "r" if mmap else None
+
+    orderset = MappedOrderSet(
+        buy_columns=_load_columns(path, "buy", BUY_COLUMNS, mmap),
+        sell_columns=_load_columns(path, "sell", SELL_COLUMNS, mmap),
+        buyers=np.load(os.path.join(path, "buyers.npy"), mmap_mode=mmap_mode, allow_pickle=False),
+        sellers=np.load(os.path.join(path, "sellers.npy"), mmap_mode=mmap_mode, allow_pickle=False),
+        products=np.load(os.path.join(path, "products.npy"), mmap_mode=mmap_mode, allow_pickle=False),
+    )
+
+    assert orderset.n_buy_orders == meta["n_buy_orders"] and orderset.n_sell_orders == meta["n_sell_orders"], f"{path} is corrupted: order counts do not match header"
+    return orderset
+
+
+#==============================================================================================================
+# MatchSet
+#==============================================================================================================
+
+def save_matchset(matchset: MatchSet, path: str):
+    '''save `matchset` to the directory `path`. Orders are stored by `int_order_id`, so the OrderSet the matches
+    were made on must be saved alongside (see `save_orderset`)'''
+    os.makedirs(path, exist_ok=True)
+
+    _save_columns(path, "match", matchset.to_columns())
+
+    _write_meta(path, {
+        "format": MATCHSET_FORMAT,
+        "version": FORMAT_VERSION,
+        "n_matches": matchset.n_matches,
+    })
+
+
+def load_matchset(path: str, orderset: OrderSet, mmap: bool = True) -> MatchSet:
+    '''load a MatchSet saved with `save_matchset`, resolving its orders in `orderset`'''
+    _read_meta(path, MATCHSET_FORMAT)
+    col = _load_columns(path, "match", MATCH_COLUMNS, mmap)
+
+    return MatchSet.from_arrays(orderset, col["int_buy_order_id"], col["int_sell_order_id"], col["price_cents"], col["quantity"])
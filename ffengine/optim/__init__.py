@@ -0,0 +1,38 @@
+import importlib
+
+# Names are resolved on first access (PEP 562) so that `import ffengine.optim` stays cheap:
+# gurobipy is only loaded once a model is actually built.
+_EXPORTS = {
+    'Engine': '.engines',
+    'OMMEngine': '.engines',
+    'IncrementalOMMEngine': '.engines',
+    'LPRoundingEngine': '.engines',
+    'MinCostFlowEngine': '.engines',
+    'ShardedEngine': '._sharding',
+    'GridPartitioner': '._sharding',
+    'Transport': '._sharding',
+    'LocalTransport': '._sharding',
+    'ProcessPoolTransport': '._sharding',
+    'IncrementalParams': '._params',
+    'SolverPool': '._resources',
+    'get_default_pool': '._resources',
+    'EnginePlanner': '._planner',
+    'Plan': '._planner',
+    'ProblemEstimate': '._planner',
+    'SolverProfile': '._tuning',
+    'get_solver_profile': '._tuning',
+    'SolveCache': '._cache',
+    'orderset_fingerprint': '._cache',
+    'SharedArrays': '._shm',
+    'SharedArraysHandle': '._shm',
+    'OrderMatchingModel': '._models',
+    'SparseOrderMatchingModel': '._models',
+}
+
+__all__ = list(_EXPORTS)
+
+
+def __getattr__(name):
+    if name in _EXPORTS:
+        return getattr(importlib.import_module(_EXPORTS[name], __name__), name)
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
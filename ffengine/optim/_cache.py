@@ -0,0 +1,131 @@
+import hashlib
+import json
+import os
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+import numpy as np
+
+from ffengine.data import MatchSet, OrderSet
+
+
+def orderset_fingerprint(orderset: OrderSet, model_config: dict, engine: str = "OMMEngine") -> str:
+    '''Canonical hash of what a solve depends on: the orders (by content, independent of the order they arrived in,
+    so int ids do not matter), the model config and the engine.'''
+    h = hashlib.blake2b(digest_size=20)
+    h.update(json.dumps({"engine": engine, "model_config": model_config}, sort_keys=True, default=str).encode())
+
+    sides = (
+        ("buy", orderset.get_buy_columns(), "int_buyer_id", orderset.get_buyer_table()),
+        ("sell", orderset.get_sell_columns(), "int_seller_id", orderset.get_seller_table()),
+    )
+    products = np.asarray(orderset.get_product_table(), dtype=str)
+
+    for side, columns, agent_col, agents in sides:
+        h.update(side.encode())
+        order = np.argsort(columns["order_id"], kind="stable")
+
+        for col, arr in sorted(columns.items()):
+            if col == "order_id":
+                values = arr[order]
+            elif col == agent_col:
+                values = np.asarray(agents, dtype=str)[arr[order]] if len(arr) else arr
+            elif col == "int_product_id":
+                values = products[arr[order]] if len(arr) else arr
+            else:
+                h.update(col.encode())
+                h.update(np.ascontiguousarray(arr[order]).tobytes())
+                continue
+
+            # strings: interning into int ids depends on arrival order, hash the ids themselves
+            h.update(col.encode())
+            h.update("\0".join(values.tolist()).encode())
+
+    return h.hexdigest()
+
+
+class SolveCache:
+    '''Solve results by `orderset_fingerprint`: an in-memory LRU of `max_entries`, and optionally a directory of
+    `.npz` files behind it that survives restarts and can be shared between workers.
+
+    Entries hold the matches by string order id, so a hit can be returned as a MatchSet of another OrderSet with
+    the same content (e.g. a batch redelivered in another order).
+    '''
+
+    def __init__(self, max_entries: int = 64, disk_dir: str = None):
+        self.max_entries = max_entries
+        self.disk_dir = disk_dir
+        self._entries = OrderedDict() # key -> {column: array}, objective
+
+        self.hits = 0
+        self.disk_hits = 0
+        self.misses = 0
+
+        if disk_dir:
+            os.makedirs(disk_dir, exist_ok=True)
+
+    def key(self, orderset: OrderSet, model_config: dict, engine: str = "OMMEngine") -> str:
+        return orderset_fingerprint(orderset, model_config, engine)
+
+    def _path(self, key: str) -> str:
+        return os.path.join(self.disk_dir, f"{key}.npz")
+
+    def _remember(self, key: str, entry):
+        self._entries[key] = entry
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.max_entries:
+            self._entries.popitem(last=False)
+
+    def get(self, key: str, orderset: OrderSet) -> Optional[Tuple[MatchSet, float]]:
+        '''the cached (MatchSet on `orderset`, objective) of `key`, None on a miss'''
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+        elif self.disk_dir and os.path.exists(self._path(key)):
+            with np.load(self._path(key), allow_pickle=False) as f:
+                entry = ({col: f[col] for col in f.files if col != "objective"}, float(f["objective"]))
+            self._remember(key, entry)
+            self.hits += 1
+            self.disk_hits += 1
+        else:
+            self.misses += 1
+            return None
+
+        columns, objective = entry
+        buy_index = {order_id: i for i, order_id in enumerate(orderset.get_buy_columns()["order_id"].tolist())}
+        sell_index = {order_id: i for i, order_id in enumerate(orderset.get_sell_columns()["order_id"].tolist())}
+
+        matches = MatchSet.from_arrays(
+            orderset,
+            [buy_index[o] for o in columns["buy_order_id"].tolist()],
+            [sell_index[o] for o in columns["sell_order_id"].tolist()],
+            columns["price_cents"], columns["quantity"],
+        )
+        return matches, objective
+
+    def put(self, key: str, matchset: MatchSet, objective: float):
+        records = matchset.to_records()
+        columns = {
+            "buy_order_id": np.array([r["buyOrder"] for r in records], dtype=str),
+            "sell_order_id": np.array([r["sellOrder"] for r in records], dtype=str),
+            "price_cents": matchset.to_columns()["price_cents"],
+            "quantity": matchset.to_columns()["quantity"],
+        }
+        self._remember(key, (columns, objective))
+
+        if self.disk_dir:
+            # write then rename, so concurrent readers never see half a file
+            tmp = self._path(key) + ".tmp.npz"
+            np.savez(tmp, objective=np.float64(objective), **columns)
+            os.replace(tmp, self._path(key))
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "disk_hits": self.disk_hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.,
+            "entries": len(self._entries),
+        }
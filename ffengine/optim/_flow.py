@@ -0,0 +1,75 @@
+import numpy as np
+
+## Max profit transportation problem between sell orders (supply q_v) and buy orders (demand q_u, partial fills allowed):
+##     max sum_k profit_k x_k   st.   sum_{k of v} x_k <= q_v,   sum_{k of u} x_k <= q_u,   0 <= x_k <= cap_k
+## solved as a min-cost flow source -> v -> u -> sink (plus a zero cost source -> sink bypass for the unmatched supply)
+
+try:
+    from ortools.graph.python import min_cost_flow # optional, network simplex, much faster than an LP solver on large networks
+except ImportError:
+    min_cost_flow = None
+
+COST_SCALE = 1000 # ortools wants integer costs: profits are in cents, keep 1/1000 cent resolution
+
+
+def solve_transportation(pair_u: np.ndarray, pair_v: np.ndarray, profit: np.ndarray, cap: np.ndarray,
+                         q_u: np.ndarray, q_v: np.ndarray, solver_pool=None) -> np.ndarray:
+    '''returns the integer flow x_k of every pair'''
+    if len(pair_u) == 0:
+        return np.zeros(0, dtype=np.int64)
+    if min_cost_flow is not None:
+        return _solve_ortools(pair_u, pair_v, profit, cap, q_u, q_v)
+    return _solve_gurobi(pair_u, pair_v, profit, cap, q_u, q_v, solver_pool)
+
+
+def _solve_ortools(pair_u, pair_v, profit, cap, q_u, q_v):
+    n_sell, n_buy = len(q_v), len(q_u)
+    source, sink = 0, 1
+    sell_node, buy_node = 2 + np.arange(n_sell), 2 + n_sell + np.arange(n_buy)
+    total = int(q_v.sum())
+
+    flow = min_cost_flow.SimpleMinCostFlow()
+    pair_arcs = flow.add_arcs_with_capacity_and_unit_cost(
+        sell_node[pair_v], buy_node[pair_u], cap.astype(np.int64), -np.round(profit*COST_SCALE).astype(np.int64)
+    )
+    flow.add_arcs_with_capacity_and_unit_cost(np.full(n_sell, source), sell_node, q_v.astype(np.int64), np.zeros(n_sell, dtype=np.int64))
+    flow.add_arcs_with_capacity_and_unit_cost(buy_node, np.full(n_buy, sink), q_u.astype(np.int64), np.zeros(n_buy, dtype=np.int64))
+    flow.add_arc_with_capacity_and_unit_cost(source, sink, total, 0)
+
+    supplies = np.zeros(2 + n_sell + n_buy, dtype=np.int64)
+    supplies[source], supplies[sink] = total, -total
+    flow.set_nodes_supplies(np.arange(len(supplies)), supplies)
+
+    status = flow.solve()
+    assert status == flow.OPTIMAL, f"min cost flow failed with status {status}"
+    return flow.flows(pair_arcs).astype(np.int64)
+
+
+def _solve_gurobi(pair_u, pair_v, profit, cap, q_u, q_v, solver_pool):
+    '''same network as an LP: the constraint matrix is totally unimodular, so a simplex vertex is integral'''
+    import gurobipy as gp
+    from gurobipy import GRB
+    from ._resources import get_default_pool
+
+    pool = solver_pool or get_default_pool()
+    with pool.solve_slot(n_vars=len(pair_u)) as (env, threads):
+        model = gp.Model('transportation', env=env)
+        model.ModelSense = GRB.MAXIMIZE
+        model.Params.Threads = threads
+        model.Params.Method = 1 # dual simplex: a basic (integral) solution, no barrier/crossover
+
+        x = model.addVars(len(pair_u), ub=cap.tolist(), obj=profit.tolist(), name='x')
+        x = [x[k] for k in range(len(pair_u))]
+
+        for pairs, q in ((pair_v, q_v), (pair_u, q_u)):
+            members = {}
+            for k, node in enumerate(pairs.tolist()):
+                members.setdefault(node, []).append(x[k])
+            for node, xs in members.items():
+                model.addLConstr(gp.LinExpr([1.]*len(xs), xs), GRB.LESS_EQUAL, float(q[node]))
+
+        model.optimize()
+        flows = np.rint(model.getAttr('X', x)).astype(np.int64)
+        model.dispose()
+
+    return flows
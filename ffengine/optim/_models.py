@@ -41,9 +41,10 @@ class OrderMatchingModel(gp.Model):
         q_u: Dict[int, int],
         q_v: Dict[int, int],
         c_uv: Dict[Tuple[int, int], int],
-        f_uv: Dict[Tuple[int, int], int]):
+        f_uv: Dict[Tuple[int, int], int],
+        env: gp.Env = None):
 
-        super().__init__('order-matching-model')
+        super().__init__('order-matching-model', env=env)
 
         ## decision variables
         self.__x_uv = x_uv = self.addVars(BUYORDERS, SELLORDERS, vtype=GRB.INTEGER, name='x_uv')
@@ -105,3 +106,147 @@ class OrderMatchingModel(gp.Model):
             'c_uv' : self.__c_uv,
             'f_uv' : self.__f_uv,
         }
+
+
+class SparseOrderMatchingModel(gp.Model):
+
+    '''The `OrderMatchingModel` formulation restricted to feasible pairs, and editable in place.
+
+    Only pairs (u, v) in PAIRS (the pairs with f_uv = 1) get x_uv/w_uv variables, so constraint (5) is implied and the
+    model grows with the number of feasible pairs instead of U*V. Orders and pairs can be added and removed between
+    solves (see `add_buy_order`, `add_sell_order`, `add_pair`, `remove_buy_order`, `remove_sell_order`), which lets
+    a long lived model follow an order book round by round without being rebuilt.
+
+    The objective is held in the variables' `Obj` attribute: price(p_u, p_v) per unit on x_uv and -c_uv on w_uv.
+
+    tight_binding: use min(q_u, q_v) instead of big_M in (3). Same integer solutions (x_uv can never exceed either
+    quantity), but a much stronger LP relaxation since w_uv can no longer be ~0 while x_uv > 0. Only valid while
+    quantities do not grow, which holds for `set_sell_quantity` after partial fills.
+    '''
+
+    def __init__(
+        self,
+        BUYORDERS: List[int],
+        SELLORDERS: List[int],
+        PAIRS: List[Tuple[int, int]],
+        p_u: Dict[int, int],
+        p_v: Dict[int, int],
+        q_u: Dict[int, int],
+        q_v: Dict[int, int],
+        c_uv: Dict[Tuple[int, int], int],
+        env: gp.Env = None,
+        tight_binding: bool = False,
+        **kwargs):
+
+        super().__init__('sparse-order-matching-model', env=env)
+        self.ModelSense = GRB.MAXIMIZE
+        self.__tight_binding = tight_binding
+
+        self.__p_u, self.__p_v = dict(p_u), dict(p_v)
+        self.__q_u, self.__q_v = dict(q_u), dict(q_v)
+        self.__c_uv = {}
+
+        ## decision variables
+        self.__x_uv, self.__w_uv, self.__y_u = {}, {}, {}
+
+        ## constraints, by order/pair so they can be removed with them
+        self.__supply, self.__demand = {}, {}
+        self.__binding, self.__profit = {}, {}
+
+        ## adjacency of the feasible pairs
+        self.__sellers_of = {} # u -> {v}
+        self.__buyers_of = {}  # v -> {u}
+
+        for u in BUYORDERS:
+            self.add_buy_order(u, p_u[u], q_u[u])
+        for v in SELLORDERS:
+            self.add_sell_order(v, p_v[v], q_v[v])
+        for u, v in PAIRS:
+            self.add_pair(u, v, c_uv[u, v])
+
+    def price(self, p_u, p_v):
+        return np.ceil((p_u + p_v)/2) # ensure that final price is an integer
+
+    def add_buy_order(self, u: int, p: int, q: int):
+        self.__p_u[u], self.__q_u[u] = p, q
+        self.__y_u[u] = y = self.addVar(vtype=GRB.BINARY, name=f'y_u[{u}]')
+        self.__sellers_of[u] = set()
+
+        #demand constraint: The quantity supplied cannot partially fulfill an order. It is all or nothing.
+        self.__demand[u] = self.addLConstr(gp.LinExpr(-q, y), GRB.EQUAL, 0, f'(2) demand requirement[{u}]')
+
+    def add_sell_order(self, v: int, p: int, q: int):
+        self.__p_v[v], self.__q_v[v] = p, q
+        self.__buyers_of[v] = set()
+
+        #supply constraint: The quantity fulfilled cannot overexceed the available supply.
+        self.__supply[v] = self.addLConstr(gp.LinExpr(), GRB.LESS_EQUAL, q, f'(1) supply limit[{v}]')
+
+    def add_pair(self, u: int, v: int, c: float):
+        '''add the feasible pair (u, v) with fixed cost `c`, both orders must already be in the model'''
+        price = self.price(self.__p_u[u], self.__p_v[v])
+        self.__c_uv[u, v] = c
+
+        x = self.addVar(vtype=GRB.INTEGER, obj=price, name=f'x_uv[{u},{v}]',
+                        column=gp.Column([1, 1], [self.__supply[v], self.__demand[u]]))
+        w = self.addVar(vtype=GRB.BINARY, obj=-c, name=f'w_uv[{u},{v}]')
+        self.__x_uv[u, v], self.__w_uv[u, v] = x, w
+
+        #bind w_uv to x_uv: Ensure w_uv is 1 if BUY/SELL orders u-v match for a specific quantity, 0 if u-v not matched.
+        M = min(self.__q_u[u], self.__q_v[v]) if self.__tight_binding else big_M
+        self.__binding[u, v] = self.addLConstr(x - M*w, GRB.LESS_EQUAL, 0, f'(3) binding w_uv[{u},{v}]')
+        #positive seller profit
+        self.__profit[u, v] = self.addLConstr(price*x - c*w, GRB.GREATER_EQUAL, 0, f'(4.2) specific instance seller profit[{u},{v}]')
+
+        self.__sellers_of[u].add(v)
+        self.__buyers_of[v].add(u)
+
+    def remove_pair(self, u: int, v: int):
+        self.remove([self.__x_uv.pop((u, v)), self.__w_uv.pop((u, v)), self.__binding.pop((u, v)), self.__profit.pop((u, v))])
+        self.__c_uv.pop((u, v))
+        self.__sellers_of[u].discard(v)
+        self.__buyers_of[v].discard(u)
+
+    def remove_buy_order(self, u: int):
+        for v in list(self.__sellers_of[u]):
+            self.remove_pair(u, v)
+
+        self.remove([self.__y_u.pop(u), self.__demand.pop(u)])
+        self.__sellers_of.pop(u)
+        self.__p_u.pop(u), self.__q_u.pop(u)
+
+    def remove_sell_order(self, v: int):
+        for u in list(self.__buyers_of[v]):
+            self.remove_pair(u, v)
+
+        self.remove(self.__supply.pop(v))
+        self.__buyers_of.pop(v)
+        self.__p_v.pop(v), self.__q_v.pop(v)
+
+    def set_sell_quantity(self, v: int, q: int):
+        '''update the supply q_v of a sell order that stays in the model (e.g. after a partial fill)'''
+        self.__q_v[v] = q
+        self.__supply[v].RHS = q
+
+    def relax_integrality(self):
+        '''turn the model into its LP relaxation in place: x_uv continuous, w_uv and y_u continuous in [0, 1]'''
+        x, binaries = list(self.__x_uv.values()), list(self.__w_uv.values()) + list(self.__y_u.values())
+        self.setAttr('VType', x + binaries, [GRB.CONTINUOUS]*(len(x) + len(binaries)))
+        self.setAttr('UB', binaries, [1.]*len(binaries))
+
+    def getVars(self) -> dict:
+        return {
+            'x_uv' : self.__x_uv,
+            'w_uv' : self.__w_uv,
+            'y_u' : self.__y_u,
+
+            'BUYORDERS' : list(self.__p_u),
+            'SELLORDERS' : list(self.__p_v),
+            'PAIRS' : list(self.__x_uv),
+
+            'p_u' : self.__p_u,
+            'p_v' : self.__p_v,
+            'q_u' : self.__q_u,
+            'q_v' : self.__q_v,
+            'c_uv' : self.__c_uv,
+        }
@@ -0,0 +1,153 @@
+import numpy as np
+from itertools import product
+from typing import Dict, Iterable, List, Union
+
+from ffengine.data import OrderSet, BuyOrder, SellOrder
+from ._utils import distance_matrix
+
+
+class _Columns:
+    '''append-only numpy columns with amortized O(1) appends'''
+
+    def __init__(self, layout: Dict[str, type], capacity: int = 64):
+        self._data = {col: np.zeros(capacity, dtype=dtype) for col, dtype in layout.items()}
+        self.n = 0
+
+    def append(self, **row):
+        if self.n == len(next(iter(self._data.values()))):
+            self._data = {col: np.resize(arr, 2*len(arr)) for col, arr in self._data.items()}
+
+        for col, value in row.items():
+            self._data[col][self.n] = value
+        self.n += 1
+
+    def __getitem__(self, col) -> np.ndarray:
+        return self._data[col][:self.n]
+
+
+class _SparsePairs(dict):
+    '''(u, v) -> value of the pairs that were compared, every other pair reads as 0'''
+
+    def __missing__(self, key):
+        return 0
+
+
+def _within(ids: np.ndarray, r: range) -> np.ndarray:
+    '''the ascending `ids` that fall in `r`'''
+    return ids[np.searchsorted(ids, r.start):np.searchsorted(ids, r.stop)]
+
+
+class IncrementalParams:
+    '''Builds the OMM parameters (see `OMMEngine.construct_params`) while the orders of a batch arrive.
+
+    Add orders through `add_buy_order`/`add_sell_order` (or `add_orders` for a chunk) instead of on the OrderSet
+    directly: every new order is compared against the opposite side orders of its product received so far (one
+    vectorized O(V_k) or O(U_k) step, candidates from the OrderSet's product index), so when the last order of a batch
+    arrives the parameters are complete and `OMMEngine(orderset, params=...)` can start solving straight away.
+    `c_uv`/`f_uv` only hold the same product pairs, the others read as 0: infeasible, so their cost never counts.
+    '''
+
+    def __init__(self, orderset: OrderSet, unit_tcost=3, **kwargs):
+        self.orderset = orderset
+        self.unit_tcost = unit_tcost
+
+        self._buys = _Columns({'lat': np.float64, 'long': np.float64, 'int_product_id': np.int64, 'time_activation': np.int64, 'time_expiry': np.int64, 'max_price_cents': np.int64})
+        self._sells = _Columns({'lat': np.float64, 'long': np.float64, 'int_product_id': np.int64, 'time_activation': np.int64, 'time_expiry': np.int64, 'min_price_cents': np.int64, 'service_range': np.float64})
+
+        self.p_u, self.p_v = {}, {}
+        self.q_u, self.q_v = {}, {}
+        self.c_uv, self.f_uv = _SparsePairs(), _SparsePairs()
+
+        assert orderset.total_orders == 0, "IncrementalParams must see every order of the OrderSet, start from an empty one"
+
+    def _append_buy_order(self, order: BuyOrder):
+        self.p_u[order.int_order_id], self.q_u[order.int_order_id] = order.max_price_cents, order.quantity
+        self._buys.append(
+            lat=order.lat, long=order.long, int_product_id=order.int_product_id,
+            time_activation=order.time_activation, time_expiry=order.time_expiry, max_price_cents=order.max_price_cents
+        )
+
+    def _append_sell_order(self, order: SellOrder):
+        self.p_v[order.int_order_id], self.q_v[order.int_order_id] = order.min_price_cents, order.quantity
+        self._sells.append(
+            lat=order.lat, long=order.long, int_product_id=order.int_product_id,
+            time_activation=order.time_activation, time_expiry=order.time_expiry,
+            min_price_cents=order.min_price_cents, service_range=order.service_range
+        )
+
+    def add_buy_order(self, order: BuyOrder):
+        self.orderset.add_buy_order(order)
+        self._append_buy_order(order)
+
+        # new row of the U x V parameter matrices
+        self._add_block(range(order.int_order_id, order.int_order_id + 1), range(self._sells.n))
+
+    def add_sell_order(self, order: SellOrder):
+        self.orderset.add_sell_order(order)
+        self._append_sell_order(order)
+
+        # new column of the U x V parameter matrices
+        self._add_block(range(self._buys.n), range(order.int_order_id, order.int_order_id + 1))
+
+    def add_orders(self, orders: Iterable[Union[BuyOrder, SellOrder]]) -> List[ValueError]:
+        '''add a chunk of buy and sell orders, with one vectorized step per side for the whole chunk.
+        Orders that are rejected by the OrderSet (duplicates) are skipped and their errors returned'''
+        first_u, first_v = self._buys.n, self._sells.n
+
+        errors = []
+        for order in orders:
+            try:
+                if isinstance(order, BuyOrder):
+                    self.orderset.add_buy_order(order)
+                    self._append_buy_order(order)
+                else:
+                    self.orderset.add_sell_order(order)
+                    self._append_sell_order(order)
+            except ValueError as e:
+                errors.append(e)
+
+        # new buy orders x old sell orders, then every buy order x new sell orders
+        self._add_block(range(first_u, self._buys.n), range(first_v))
+        self._add_block(range(self._buys.n), range(first_v, self._sells.n))
+
+        return errors
+
+    def _add_block(self, us: range, vs: range):
+        '''fill the parameters of the same product pairs among us x vs, product by product'''
+        if not (len(us) and len(vs)):
+            return
+
+        products = np.intersect1d(self._buys['int_product_id'][us.start:us.stop], self._sells['int_product_id'][vs.start:vs.stop])
+        for k in products.tolist():
+            u = _within(self.orderset.get_buy_ids_by_product(k), us)
+            v = _within(self.orderset.get_sell_ids_by_product(k), vs)
+
+            b = {col: self._buys[col][u, None] for col in ('lat', 'long', 'time_activation', 'time_expiry', 'max_price_cents')}
+            s = {col: self._sells[col][None, v] for col in ('lat', 'long', 'time_activation', 'time_expiry', 'min_price_cents', 'service_range')}
+
+            d = distance_matrix(b['lat'][:, 0], b['long'][:, 0], s['lat'][0], s['long'][0])
+            f = (
+                (b['time_expiry'] >= s['time_activation']) & (s['time_expiry'] >= b['time_activation']) &
+                (d <= s['service_range']) &
+                (b['max_price_cents'] >= s['min_price_cents'])
+            )
+
+            keys = list(product(u.tolist(), v.tolist()))
+            self.c_uv.update(zip(keys, (d * self.unit_tcost).ravel().tolist()))
+            self.f_uv.update(zip(keys, f.astype(int).ravel().tolist()))
+
+    @property
+    def params(self) -> dict:
+        '''the keyword arguments of `OrderMatchingModel`'''
+        assert self.orderset.n_buy_orders == self._buys.n and self.orderset.n_sell_orders == self._sells.n, "orders were added to the OrderSet without going through IncrementalParams"
+
+        return {
+            'BUYORDERS': range(self.orderset.n_buy_orders),
+            'SELLORDERS': range(self.orderset.n_sell_orders),
+            'p_u': self.p_u,
+            'p_v': self.p_v,
+            'q_u': self.q_u,
+            'q_v': self.q_v,
+            'c_uv': self.c_uv,
+            'f_uv': self.f_uv,
+        }
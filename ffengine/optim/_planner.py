@@ -0,0 +1,220 @@
+import json
+import math
+import os
+import resource
+import time
+from dataclasses import dataclass, asdict, field
+from typing import Dict, Optional
+
+import numpy as np
+
+from ffengine.data import OrderSet
+from ._utils import EARTH_RADIUS_KM, haversine_pairs
+
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180
+
+# strategy -> engine, in the order the planner tries them
+STRATEGIES = {
+    "dense": "OMMEngine", # one MIP over every U x V pair
+    "sharded": "ShardedEngine", # geographic shards of dense MIPs, reconciled across boundaries
+    "lp_rounding": "LPRoundingEngine", # heuristic: LP over the feasible pairs, rounded
+    "flow": "MinCostFlowEngine", # batches that allow partial fills
+}
+
+# priors of the cost model, replace them with `calibrate` on a decision log.
+# seconds per model variable, by strategy
+SECONDS_PER_VAR = {"dense": 2e-5, "sharded": 2e-5, "lp_rounding": 2e-6, "flow": 1e-6}
+# bytes per variable: the parameter dicts plus the solver's model
+BYTES_PER_VAR = {"dense": 400, "sharded": 400, "lp_rounding": 300, "flow": 200}
+
+
+@dataclass
+class ProblemEstimate:
+    '''what a batch will cost to solve, from its OrderSet's statistics (see `EnginePlanner.estimate`)'''
+    n_buy: int
+    n_sell: int
+    n_products: int
+    same_product_pairs: int # sum over products of U_k * V_k
+    feasible_pairs: int # estimated pairs with f_uv = 1
+    feasible_share: float # of the same product pairs
+    spread_km: float # diagonal of the orders' bounding box
+    mean_window_s: float # mean time between activation and expiry
+
+    @property
+    def dense_vars(self) -> int:
+        return 2 * self.n_buy * self.n_sell + self.n_buy
+
+    @property
+    def sparse_vars(self) -> int:
+        return 2 * self.feasible_pairs + self.n_buy
+
+
+@dataclass
+class Plan:
+    strategy: str
+    engine: str
+    reason: str
+    expected_seconds: float
+    expected_memory_mb: float
+    model_vars: float # variables the cost model charged for, summed over shards
+    estimate: ProblemEstimate
+    engine_kwargs: dict = field(default_factory=dict)
+
+
+class EnginePlanner:
+    '''Picks the engine of a batch from a cheap estimate of its size, within a memory and a latency budget.
+
+    `estimate` counts the orders per product and samples up to `sample_pairs` same product pairs per product for
+    feasibility (time windows, prices, service ranges), so it costs O(orders + products * sample_pairs).
+    `plan` then takes the first strategy that fits both budgets: "dense" (exact), "sharded" (exact per shard),
+    "lp_rounding" (heuristic, always the fallback), or "flow" for batches that allow partial fills.
+
+    With `log_path` every decision is appended as one JSON line by `record`, together with what the solve really
+    cost, so that `calibrate` can fit `seconds_per_var` to the machine and the data.
+    '''
+
+    def __init__(self, memory_budget_mb: float = 4096, latency_budget_s: float = 60, dense_max_vars: int = None,
+                 shard_orders: int = 400, seconds_per_var: Dict[str, float] = None, sample_pairs: int = 256,
+                 log_path: str = None, seed: int = 0):
+        # dense_max_vars: hard cap on the dense model, e.g. for a size limited solver licence
+        # shard_orders: `target_orders` of the ShardedEngine
+        self.memory_budget_mb = memory_budget_mb
+        self.latency_budget_s = latency_budget_s
+        self.dense_max_vars = dense_max_vars
+        self.shard_orders = shard_orders
+        self.seconds_per_var = {**SECONDS_PER_VAR, **(seconds_per_var or {})}
+        self.sample_pairs = sample_pairs
+        self.log_path = log_path
+        self.seed = seed
+
+    @classmethod
+    def from_env(cls) -> "EnginePlanner":
+        '''budgets from MATE_MEMORY_BUDGET_MB, MATE_LATENCY_BUDGET_S, MATE_DENSE_MAX_VARS, decision log at
+        MATE_PLANNER_LOG, calibrated seconds per variable from a decision log at MATE_PLANNER_CALIBRATION'''
+        env = os.environ.get
+        calibration = env("MATE_PLANNER_CALIBRATION")
+        return cls(
+            memory_budget_mb=float(env("MATE_MEMORY_BUDGET_MB", 4096)),
+            latency_budget_s=float(env("MATE_LATENCY_BUDGET_S", 60)),
+            dense_max_vars=int(env("MATE_DENSE_MAX_VARS")) if env("MATE_DENSE_MAX_VARS") else None,
+            seconds_per_var=calibrate(calibration) if calibration and os.path.exists(calibration) else None,
+            log_path=env("MATE_PLANNER_LOG"),
+        )
+
+    def settings(self) -> dict:
+        '''everything besides the batch that `plan` depends on, e.g. to key solve results by'''
+        return {
+            "memory_budget_mb": self.memory_budget_mb, "latency_budget_s": self.latency_budget_s, "dense_max_vars": self.dense_max_vars,
+            "shard_orders": self.shard_orders, "seconds_per_var": self.seconds_per_var, "sample_pairs": self.sample_pairs, "seed": self.seed,
+        }
+
+    def estimate(self, orderset: OrderSet) -> ProblemEstimate:
+        buys, sells = orderset.get_buy_columns(), orderset.get_sell_columns()
+        rng = np.random.default_rng(self.seed)
+
+        same_product, feasible = 0, 0.
+        for k, u, v in orderset.iter_products():
+            n_pairs = len(u) * len(v)
+            same_product += n_pairs
+
+            if n_pairs <= self.sample_pairs:
+                su, sv = np.repeat(u, len(v)), np.tile(v, len(u))
+            else:
+                su, sv = rng.choice(u, self.sample_pairs), rng.choice(v, self.sample_pairs)
+
+            f = (
+                (buys['time_expiry'][su] >= sells['time_activation'][sv]) & (sells['time_expiry'][sv] >= buys['time_activation'][su]) &
+                (buys['max_price_cents'][su] >= sells['min_price_cents'][sv]) &
+                (haversine_pairs(buys['lat'][su], buys['long'][su], sells['lat'][sv], sells['long'][sv]) <= sells['service_range'][sv])
+            )
+            feasible += f.mean() * n_pairs
+
+        lat = np.concatenate([buys['lat'], sells['lat']])
+        long = np.concatenate([buys['long'], sells['long']])
+        spread_km = float(np.hypot(np.ptp(lat), np.ptp(long) * np.cos(np.radians(lat.mean()))) * KM_PER_DEGREE) if len(lat) else 0.
+        windows = np.concatenate([buys['time_expiry'] - buys['time_activation'], sells['time_expiry'] - sells['time_activation']])
+
+        return ProblemEstimate(
+            n_buy=orderset.n_buy_orders, n_sell=orderset.n_sell_orders, n_products=orderset.n_products,
+            same_product_pairs=int(same_product), feasible_pairs=int(round(feasible)),
+            feasible_share=float(feasible / same_product) if same_product else 0.,
+            spread_km=spread_km, mean_window_s=float(windows.mean()) if len(windows) else 0.,
+        )
+
+    def _cost(self, strategy: str, n_vars: float):
+        '''(seconds, MB) of a model with `n_vars` variables'''
+        return self.seconds_per_var[strategy] * n_vars, BYTES_PER_VAR[strategy] * n_vars / 2**20
+
+    def plan(self, orderset: OrderSet, allow_partial_fill: bool = False) -> Plan:
+        est = self.estimate(orderset)
+        fits = lambda seconds, mb: seconds <= self.latency_budget_s and mb <= self.memory_budget_mb
+
+        if allow_partial_fill:
+            seconds, mb = self._cost("flow", est.sparse_vars)
+            return Plan("flow", STRATEGIES["flow"], "batch allows partial fills", seconds, mb, est.sparse_vars, est)
+
+        seconds, mb = self._cost("dense", est.dense_vars)
+        capped = self.dense_max_vars is not None and est.dense_vars > self.dense_max_vars
+        if fits(seconds, mb) and not capped:
+            return Plan("dense", STRATEGIES["dense"], "dense model fits the budgets", seconds, mb, est.dense_vars, est)
+        rejected = f"dense needs {est.dense_vars} vars, ~{seconds:.1f}s / {mb:.0f}MB" + (f" (cap {self.dense_max_vars})" if capped else "")
+
+        # shards of ~shard_orders orders, solved one after the other in the worst case
+        n_shards = max(1, math.ceil((est.n_buy + est.n_sell) / self.shard_orders))
+        shard_vars = 2 * (est.n_buy / n_shards) * (est.n_sell / n_shards) + est.n_buy / n_shards
+        shard_seconds, shard_mb = self._cost("sharded", shard_vars)
+        seconds, mb = shard_seconds * n_shards, shard_mb
+        shard_capped = self.dense_max_vars is not None and shard_vars > self.dense_max_vars
+        if n_shards > 1 and fits(seconds, mb) and not shard_capped:
+            return Plan("sharded", STRATEGIES["sharded"], f"{rejected}, {n_shards} shards fit the budgets", seconds, mb, shard_vars * n_shards, est,
+                        engine_kwargs={"target_orders": self.shard_orders})
+        rejected += f"; {n_shards} shards need ~{seconds:.1f}s / {mb:.0f}MB" if n_shards > 1 else ", too small to shard"
+
+        seconds, mb = self._cost("lp_rounding", est.sparse_vars)
+        return Plan("lp_rounding", STRATEGIES["lp_rounding"], f"{rejected}, falling back to the heuristic", seconds, mb, est.sparse_vars, est)
+
+    def make_engine(self, plan: Plan, orderset: OrderSet, **model_config):
+        '''the engine of `plan` on `orderset`, `model_config` as for any engine (e.g. `params` for the dense one)'''
+        from . import engines, _sharding
+
+        module = _sharding if plan.strategy == "sharded" else engines
+        if plan.strategy != "dense":
+            model_config.pop("params", None)
+        return getattr(module, plan.engine)(orderset, **plan.engine_kwargs, **model_config)
+
+    def record(self, batch_id, plan: Plan, timings: Dict[str, float], objective: Optional[float] = None, n_matches: int = None):
+        '''append the decision and the realized cost to the decision log (a no-op without `log_path`)'''
+        if not self.log_path:
+            return
+
+        seconds = sum(timings.get(stage, 0.) for stage in ("construct_params", "match", "get_matches"))
+        line = {
+            "batch_id": str(batch_id),
+            "time": int(time.time()),
+            "strategy": plan.strategy,
+            "engine": plan.engine,
+            "reason": plan.reason,
+            "budgets": {"memory_mb": self.memory_budget_mb, "latency_s": self.latency_budget_s},
+            "estimate": {**asdict(plan.estimate), "dense_vars": plan.estimate.dense_vars, "sparse_vars": plan.estimate.sparse_vars},
+            "expected": {"seconds": plan.expected_seconds, "memory_mb": plan.expected_memory_mb, "model_vars": plan.model_vars},
+            # peak RSS of the whole process so far, an upper bound on what this solve used
+            "realized": {"seconds": seconds, "timings": timings, "peak_rss_mb": resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / 1024,
+                         "objective": objective, "n_matches": n_matches},
+        }
+        os.makedirs(os.path.dirname(os.path.abspath(self.log_path)), exist_ok=True)
+        with open(self.log_path, "a") as f:
+            f.write(json.dumps(line) + "\n")
+
+
+def calibrate(log_path: str) -> Dict[str, float]:
+    '''seconds per variable of every strategy in a decision log: the median of realized seconds / modelled
+    variables, pass it to `EnginePlanner(seconds_per_var=...)`'''
+    ratios = {}
+    with open(log_path) as f:
+        for line in f:
+            d = json.loads(line)
+            n_vars = d["expected"]["model_vars"]
+            if n_vars > 0:
+                ratios.setdefault(d["strategy"], []).append(d["realized"]["seconds"] / n_vars)
+
+    return {strategy: float(np.median(r)) for strategy, r in ratios.items()}
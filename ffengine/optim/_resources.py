@@ -0,0 +1,112 @@
+import os
+import threading
+from contextlib import contextmanager
+from typing import Iterator, Tuple, TYPE_CHECKING
+
+if TYPE_CHECKING:
+    import gurobipy as gp
+
+
+class SolverPool:
+    '''Shares gurobi environments and cores between concurrent solves.
+
+    - environments are created once and reused, so a new model does not pay environment/licence setup
+    - at most `max_concurrent` solves run at once, further solves block (queue) in `solve_slot` until one finishes
+    - every solve gets `Threads` from its size and the number of solves running next to it, and never more than the
+      threads the running solves leave free (at least one), so concurrent solves share `total_threads` instead of
+      each defaulting to every core
+
+    gurobi environments are not thread safe, an environment is only handed to one solve at a time.
+    '''
+
+    def __init__(self, max_concurrent: int = None, total_threads: int = None, vars_per_thread: int = 50000, env_params: dict = None):
+        # vars_per_thread: problem size (number of variables) that justifies one more thread
+        self.total_threads = total_threads or os.cpu_count() or 1
+        self.max_concurrent = max_concurrent or self.total_threads
+        self.vars_per_thread = vars_per_thread
+        self.env_params = env_params or {}
+
+        self._slots = threading.BoundedSemaphore(self.max_concurrent)
+        self._lock = threading.Lock()
+        self._idle_envs = []
+        self.n_envs = 0
+        self.n_active = 0
+        self.n_threads = 0 # given to the running solves
+
+    def _new_env(self) -> 'gp.Env':
+        import gurobipy as gp # deferred so that importing the engines does not load gurobi
+
+        env = gp.Env(empty=True)
+        for param, value in self.env_params.items():
+            env.setParam(param, value)
+        env.start()
+        return env
+
+    def acquire_env(self) -> 'gp.Env':
+        '''take an environment out of the pool (e.g. for a long lived model), give it back with `release_env`'''
+        with self._lock:
+            if self._idle_envs:
+                return self._idle_envs.pop()
+
+        # outside the lock: starting an environment checks the licence, other solves need not wait for it
+        env = self._new_env()
+        with self._lock:
+            self.n_envs += 1
+        return env
+
+    def release_env(self, env: 'gp.Env'):
+        with self._lock:
+            self._idle_envs.append(env)
+
+    def threads_for(self, n_vars: int, n_active: int) -> int:
+        '''fair share of the cores between the running solves, capped by what a problem of this size can use'''
+        fair_share = max(1, self.total_threads // max(1, n_active))
+        by_size = 1 + n_vars // self.vars_per_thread
+        return max(1, min(fair_share, by_size))
+
+    @contextmanager
+    def solve_slot(self, n_vars: int, env: 'gp.Env' = None) -> Iterator[Tuple['gp.Env', int]]:
+        '''blocks until a solve may start, yields (environment, threads) for it. Pass `env` to keep a model on an
+        environment it already owns (see `acquire_env`) and only take part in the scheduling'''
+        self._slots.acquire()
+        with self._lock:
+            self.n_active += 1
+            threads = min(self.threads_for(n_vars, self.n_active), max(1, self.total_threads - self.n_threads))
+            self.n_threads += threads
+
+        own_env = env is None
+        try:
+            env = self.acquire_env() if own_env else env
+            try:
+                yield env, threads
+            finally:
+                if own_env:
+                    self.release_env(env)
+        finally:
+            with self._lock:
+                self.n_active -= 1
+                self.n_threads -= threads
+            self._slots.release()
+
+    def close(self):
+        with self._lock:
+            for env in self._idle_envs:
+                env.dispose()
+            self._idle_envs = []
+
+
+_default_pool = None
+_default_pool_lock = threading.Lock()
+
+def get_default_pool() -> SolverPool:
+    '''process wide SolverPool, configured from FFENGINE_MAX_CONCURRENT_SOLVES / FFENGINE_SOLVER_THREADS if set'''
+    global _default_pool
+    with _default_pool_lock:
+        if _default_pool is None:
+            max_concurrent = os.environ.get("FFENGINE_MAX_CONCURRENT_SOLVES")
+            total_threads = os.environ.get("FFENGINE_SOLVER_THREADS")
+            _default_pool = SolverPool(
+                max_concurrent=int(max_concurrent) if max_concurrent else None,
+                total_threads=int(total_threads) if total_threads else None,
+            )
+        return _default_pool
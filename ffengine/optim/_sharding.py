@@ -0,0 +1,400 @@
+import abc
+import math
+import os
+import time
+from concurrent.futures import ProcessPoolExecutor
+from dataclasses import replace
+from typing import Callable, Dict, Iterable, List, Tuple
+
+import numpy as np
+
+from ffengine.data import MatchSet, OrderSet
+from ffengine.data.orders import IdIndex
+from ffengine.data.storage import MappedOrderSet
+from .engines import Engine, OMMEngine
+from ._resources import SolverPool, get_default_pool
+from ._shm import SharedArrays, SharedArraysHandle
+from ._utils import EARTH_RADIUS_KM
+
+KM_PER_DEGREE = EARTH_RADIUS_KM * math.pi / 180 # km per degree of latitude (and of longitude at the equator)
+
+
+#==============================================================================================================
+# Transports: how shards get to the workers that solve them
+#==============================================================================================================
+
+class Transport(abc.ABC):
+    '''Runs `fn` over tasks somewhere and returns the results in order. `fn` and the tasks must be picklable for
+    anything but `LocalTransport`, a transport to remote nodes only has to implement `map`.'''
+
+    @abc.abstractmethod
+    def map(self, fn: Callable, tasks: Iterable) -> list:
+        pass
+
+    def close(self):
+        pass
+
+
+class LocalTransport(Transport):
+    '''solves the shards one after the other in this process'''
+
+    def map(self, fn, tasks):
+        return [fn(task) for task in tasks]
+
+
+class ProcessPoolTransport(Transport):
+    '''solves the shards in parallel on worker processes'''
+
+    def __init__(self, max_workers: int = None):
+        self._executor = ProcessPoolExecutor(max_workers=max_workers)
+        self.max_workers = self._executor._max_workers
+
+    def map(self, fn, tasks):
+        return list(self._executor.map(fn, tasks))
+
+    def close(self):
+        self._executor.shutdown()
+
+
+#==============================================================================================================
+# Partitioning
+#==============================================================================================================
+
+def _morton(i: np.ndarray, j: np.ndarray, bits: int = 16) -> np.ndarray:
+    '''interleave the bits of the cell indexes (Z-order curve): cells close in space get close keys'''
+    key = np.zeros(len(i), dtype=np.int64)
+    for b in range(bits):
+        key |= ((i >> b) & 1) << (2*b + 1)
+        key |= ((j >> b) & 1) << (2*b)
+    return key
+
+
+class GridPartitioner:
+    '''Splits an OrderSet into geographic shards.
+
+    Orders are put in cells of about `cell_km` x `cell_km` (latitude bands, with the longitude step widened by 1/cos(lat)
+    so cells keep their size away from the equator). Cells are then walked along a Z-order curve and packed into
+    shards of about `target_orders` orders, so shards are made of neighbouring cells.
+    '''
+
+    def __init__(self, cell_km: float, target_orders: int):
+        self.cell_km = cell_km
+        self.target_orders = target_orders
+        self.dlat = cell_km / KM_PER_DEGREE
+
+    def _band_dlong(self, i: np.ndarray) -> np.ndarray:
+        band_lat = np.radians(np.clip(-90 + (i + .5)*self.dlat, -89.9, 89.9))
+        return np.minimum(self.dlat / np.cos(band_lat), 360)
+
+    def _band_columns(self, i: np.ndarray) -> np.ndarray:
+        '''number of cells around the globe in latitude band i, the last one may be narrower'''
+        return np.ceil(360 / self._band_dlong(i) - 1e-9).astype(np.int64)
+
+    def cells(self, lat: np.ndarray, long: np.ndarray) -> Tuple[np.ndarray, np.ndarray]:
+        i = np.floor((np.asarray(lat) + 90) / self.dlat).astype(np.int64)
+        # modulo the band's columns: 180 and -180 are the same meridian
+        j = np.floor((np.asarray(long) + 180) / self._band_dlong(i)).astype(np.int64) % self._band_columns(i)
+        return i, j
+
+    def cells_in_range(self, lat: float, long: float, radius_km: float) -> List[Tuple[int, int]]:
+        '''every cell touched by the bounding box of a disc (conservative, the box is as wide as the disc is at its
+        latitude farthest from the equator). Boxes across the antimeridian wrap around to the other side'''
+        dlat = radius_km / KM_PER_DEGREE
+        lat_lo, lat_hi = max(lat - dlat, -90), min(lat + dlat, 90)
+        widest = math.radians(min(max(abs(lat_lo), abs(lat_hi)), 89.9))
+        dlong = min(dlat / math.cos(widest), 180)
+
+        # the box's longitudes as intervals within [-180, 180]
+        long_lo, long_hi = long - dlong, long + dlong
+        intervals = [(max(long_lo, -180), min(long_hi, 180))]
+        if long_lo < -180:
+            intervals.append((long_lo + 360, 180))
+        if long_hi > 180:
+            intervals.append((-180, long_hi - 360))
+
+        i_lo, i_hi = self.cells([lat_lo, lat_hi], [long, long])[0]
+        touched = []
+        for i in range(int(i_lo), int(i_hi) + 1):
+            step, n_cols = self._band_dlong(np.array([i]))[0], int(self._band_columns(np.array([i]))[0])
+            column = lambda x: min(int(math.floor((x + 180) / step)), n_cols - 1)
+            js = set()
+            for lo, hi in intervals:
+                js.update(range(column(lo), column(hi) + 1))
+            touched.extend((i, j) for j in sorted(js))
+
+        return touched
+
+    def partition(self, orderset: OrderSet) -> Dict[str, object]:
+        '''returns the shard of every buy/sell order (arrays by int_order_id) and of every occupied cell'''
+        buys, sells = orderset.get_buy_columns(), orderset.get_sell_columns()
+        bi, bj = self.cells(buys['lat'], buys['long'])
+        si, sj = self.cells(sells['lat'], sells['long'])
+
+        cell_i, cell_j = np.concatenate([bi, si]), np.concatenate([bj, sj])
+        keys = _morton(cell_i, cell_j)
+        unique_keys, inverse, counts = np.unique(keys, return_inverse=True, return_counts=True)
+
+        # pack cells (already in Z-order after np.unique) into shards
+        cell_shard = np.zeros(len(unique_keys), dtype=np.int64)
+        shard, filled = 0, 0
+        for c, count in enumerate(counts):
+            if filled and filled + count > self.target_orders:
+                shard, filled = shard + 1, 0
+            cell_shard[c] = shard
+            filled += count
+
+        order_shard = cell_shard[inverse]
+        first_cell = {}
+        for c, i, j in zip(inverse, cell_i, cell_j):
+            first_cell.setdefault((int(i), int(j)), int(cell_shard[c]))
+
+        return {
+            'n_shards': int(cell_shard.max()) + 1 if len(cell_shard) else 0,
+            'buy_shard': order_shard[:orderset.n_buy_orders],
+            'sell_shard': order_shard[orderset.n_buy_orders:],
+            'buy_cells': list(zip(bi.tolist(), bj.tolist())),
+            'cell_shard': first_cell,
+        }
+
+
+#==============================================================================================================
+# Shard solving
+#==============================================================================================================
+
+def build_suborderset(orderset: OrderSet, buy_ids: Iterable[int], sell_ids: Iterable[int], sell_quantities: Dict[int, int] = None) -> Tuple[OrderSet, List[int], List[int]]:
+    '''copy the given orders into a new OrderSet (which assigns its own int ids). Returns it with the maps from its
+    int ids back to `orderset`'s. `sell_quantities` overrides the supply of sell orders (residual supply)'''
+    sub = OrderSet()
+    buy_map, sell_map = [], []
+    for u in buy_ids:
+        sub.add_buy_order(replace(orderset.get_buy_order(u)))
+        buy_map.append(u)
+    for v in sell_ids:
+        order = orderset.get_sell_order(v)
+        if sell_quantities is not None:
+            order = replace(order, quantity=sell_quantities[v])
+        sub.add_sell_order(replace(order))
+        sell_map.append(v)
+    return sub, buy_map, sell_map
+
+
+_worker_pools = {}
+
+def _solve(orderset: OrderSet, model_config: dict, threads: int) -> Tuple[Dict[str, np.ndarray], float]:
+    '''OMM on one shard in a worker, returns the match columns (in the shard's int ids) and the objective'''
+    if threads is None:
+        pool = get_default_pool()
+    else:
+        # one solve at a time per worker process, with the cores this worker was given
+        if threads not in _worker_pools:
+            _worker_pools[threads] = SolverPool(max_concurrent=1, total_threads=threads)
+        pool = _worker_pools[threads]
+
+    matcher = OMMEngine(orderset, solver_pool=pool, **model_config)
+    matcher.construct_params()
+    matcher.match()
+    return matcher.get_matches().to_columns(), matcher.objective
+
+
+def solve_shard(task: Tuple[OrderSet, dict, int]) -> Tuple[List[Tuple[int, int, float, int]], float]:
+    '''worker entry point: solve one shard with OMM, returns its matches as (u, v, price, quantity) in the shard's
+    int ids, and the objective. `threads` None solves with the process wide pool'''
+    orderset, model_config, threads = task
+    if orderset.n_buy_orders == 0 or orderset.n_sell_orders == 0:
+        return [], 0.
+
+    col, objective = _solve(orderset, model_config, threads)
+    matches = list(zip(*(col[c].tolist() for c in ('int_buy_order_id', 'int_sell_order_id', 'price_cents', 'quantity'))))
+    return matches, objective
+
+
+# numeric columns the OMM parameters are built from (see `OMMEngine.construct_params`), the only ones shared with workers
+SHARED_BUY_COLUMNS = ('int_product_id', 'max_price_cents', 'quantity', 'time_activation', 'time_expiry', 'lat', 'long')
+SHARED_SELL_COLUMNS = ('int_product_id', 'min_price_cents', 'quantity', 'time_activation', 'time_expiry', 'service_range', 'lat', 'long')
+
+def share_shards(orderset: OrderSet, shard_buys: IdIndex, shard_sells: IdIndex, n_shards: int) -> SharedArrays:
+    '''the OrderSet's numeric columns and every shard's int order ids (shard s: `buy_ids[buy_offsets[s]:buy_offsets[s+1]]`)
+    in one shared memory block'''
+    buys, sells = orderset.get_buy_columns(), orderset.get_sell_columns()
+    arrays = {f"buy.{c}": buys[c] for c in SHARED_BUY_COLUMNS}
+    arrays.update({f"sell.{c}": sells[c] for c in SHARED_SELL_COLUMNS})
+
+    for side, index in (("buy", shard_buys), ("sell", shard_sells)):
+        ids = [index.get(s) for s in range(n_shards)]
+        arrays[f"{side}_ids"] = np.concatenate(ids) if ids else np.zeros(0, dtype=np.int64)
+        arrays[f"{side}_offsets"] = np.concatenate([[0], np.cumsum([len(i) for i in ids])]).astype(np.int64)
+    return SharedArrays(arrays)
+
+
+def _read_shard(arrays: Dict[str, np.ndarray], shard: int):
+    '''copies of one shard's int ids and columns out of the shared arrays'''
+    ids = {}
+    for side in ("buy", "sell"):
+        offsets = arrays[f"{side}_offsets"]
+        ids[side] = np.array(arrays[f"{side}_ids"][offsets[shard]:offsets[shard + 1]])
+
+    buy_columns = {c: arrays[f"buy.{c}"][ids["buy"]] for c in SHARED_BUY_COLUMNS}
+    sell_columns = {c: arrays[f"sell.{c}"][ids["sell"]] for c in SHARED_SELL_COLUMNS}
+    buy_columns.update(order_id=ids["buy"], int_buyer_id=np.zeros(len(ids["buy"]), dtype=np.int64))
+    sell_columns.update(order_id=ids["sell"], int_seller_id=np.zeros(len(ids["sell"]), dtype=np.int64))
+    return ids, buy_columns, sell_columns
+
+
+def solve_shared_shard(task: Tuple[SharedArraysHandle, int, dict, int]) -> Tuple[np.ndarray, np.ndarray, np.ndarray, np.ndarray, float]:
+    '''worker entry point of the shared memory path: attach to the block of `share_shards`, copy shard `shard`'s rows
+    out of it, solve them and return only the matches, as arrays (u, v, price, quantity) in the full OrderSet's int ids.
+    The block saves pickling a sub OrderSet per task, not the worker's work: the copy is a gather of the shard's rows
+    and the OMM parameters are built from it as usual (`tests/bench_shm.py` reports both costs)'''
+    handle, shard, model_config, threads = task
+    arrays, shm = handle.attach()
+    try:
+        ids, buy_columns, sell_columns = _read_shard(arrays, shard)
+    finally:
+        # the shard's rows are copies, no view of the block may outlive it
+        del arrays
+        shm.close()
+
+    if len(ids["buy"]) == 0 or len(ids["sell"]) == 0:
+        empty = np.zeros(0, dtype=np.int64)
+        return empty, empty, np.zeros(0), empty, 0.
+
+    # the shard as a column backed OrderSet, only the numeric columns OMM reads are filled in: string ids are not
+    # shared, the agent/product tables are blank placeholders the int ids can index
+    n_products = int(max(buy_columns['int_product_id'].max(), sell_columns['int_product_id'].max())) + 1
+    blank = lambda n: np.full(n, "", dtype="<U1")
+    sub = MappedOrderSet(buy_columns, sell_columns, buyers=blank(1), sellers=blank(1), products=blank(n_products))
+    col, objective = _solve(sub, model_config, threads)
+    return ids["buy"][col['int_buy_order_id']], ids["sell"][col['int_sell_order_id']], col['price_cents'], col['quantity'], objective
+
+
+class ShardedEngine(Engine):
+    '''OMM split into geographic shards that are solved independently (in parallel with `ProcessPoolTransport`).
+
+    1) the OrderSet is partitioned into shards of about `target_orders` neighbouring orders by `GridPartitioner`
+    2) every shard is solved with OMM through `transport`
+    3) reconciliation: sell orders whose service region reaches into another shard keep their residual supply, and
+       one small OMM matches it to the buy orders left unmatched in the cells they reach
+
+    Matches never cross a shard boundary in 2), so the result can be worse than a single OMM over the whole
+    OrderSet, 3) recovers the cross boundary matches for the orders left over (see `tests/bench_sharding.py`).
+    '''
+
+    def __init__(self, orderset: OrderSet, unit_tcost=3, target_orders: int = 400, cell_km: float = None,
+                 transport: Transport = None, solver_pool: SolverPool = None, shared_memory: bool = None, **kwargs):
+        # cell_km: grid cell size, defaults to the largest service range so that a service region only reaches the
+        #     neighbouring cells
+        # transport: where the shards are solved, defaults to this process one after the other
+        # shared_memory: hand the shards to the workers through one shared memory block (see `share_shards`) instead
+        #     of pickling a sub OrderSet per shard, defaults to True with a ProcessPoolTransport
+        self.orderset = orderset
+        self.unit_tcost = unit_tcost
+        self.transport = transport or LocalTransport()
+        self.solver_pool = solver_pool or get_default_pool()
+        self.shared_memory = isinstance(self.transport, ProcessPoolTransport) if shared_memory is None else shared_memory
+
+        if cell_km is None:
+            ranges = orderset.get_sell_columns()['service_range']
+            cell_km = max(float(ranges.max()), 1.) if len(ranges) else 100.
+        self.partitioner = GridPartitioner(cell_km, target_orders)
+        self.stats = {}
+
+    def get_orderset(self):
+        return self.orderset
+
+    def _model_config(self):
+        return {'unit_tcost': self.unit_tcost}
+
+    def _worker_threads(self):
+        if isinstance(self.transport, ProcessPoolTransport):
+            return max(1, (os.cpu_count() or 1) // self.transport.max_workers)
+        return None
+
+    def construct_params(self):
+        '''partition the OrderSet and find the sell orders whose service region crosses a shard boundary'''
+        t0 = time.perf_counter()
+        part = self.partitioner.partition(self.orderset)
+        n_shards = part['n_shards']
+
+        shard_buys, shard_sells = IdIndex.from_keys(part['buy_shard']), IdIndex.from_keys(part['sell_shard'])
+        self._n_shards = n_shards
+        if self.shared_memory:
+            self._shared = share_shards(self.orderset, shard_buys, shard_sells, n_shards)
+            self.stats.update(shared_bytes=self._shared.nbytes)
+        else:
+            self._shards = [build_suborderset(self.orderset, shard_buys.get(s).tolist(), shard_sells.get(s).tolist()) for s in range(n_shards)]
+
+        # boundary sell orders and the cells their service region reaches
+        self._boundary_sells, self._reached_cells = [], set()
+        sells = self.orderset.get_sell_columns()
+        for v, s in enumerate(part['sell_shard'].tolist()):
+            touched = self.partitioner.cells_in_range(float(sells['lat'][v]), float(sells['long'][v]), float(sells['service_range'][v]))
+            if any(part['cell_shard'].get(c, s) != s for c in touched):
+                self._boundary_sells.append(v)
+                self._reached_cells.update(touched)
+        self._buy_cells = part['buy_cells']
+
+        self.stats.update(n_shards=n_shards, n_boundary_sells=len(self._boundary_sells), partition_time=time.perf_counter() - t0)
+
+    def match(self):
+        # stage 1: every shard on its own
+        t0 = time.perf_counter()
+        threads = self._worker_threads()
+        if self.shared_memory:
+            try:
+                results = self.transport.map(solve_shared_shard, [(self._shared.handle, s, self._model_config(), threads) for s in range(self._n_shards)])
+            finally:
+                self._shared.close()
+            # matches come back in the OrderSet's int ids
+            shard_matches = [(list(zip(*(arr.tolist() for arr in result[:4]))), result[4]) for result in results]
+        else:
+            results = self.transport.map(solve_shard, [(sub, self._model_config(), threads) for sub, _, _ in self._shards])
+            shard_matches = [
+                ([(buy_map[u], sell_map[v], price, quantity) for u, v, price, quantity in matches], objective)
+                for (_, buy_map, sell_map), (matches, objective) in zip(self._shards, results)
+            ]
+
+        self._matches = []
+        self.objective = 0.
+        sold = np.zeros(self.orderset.n_sell_orders, dtype=np.int64)
+        matched = np.zeros(self.orderset.n_buy_orders, dtype=bool)
+        for matches, objective in shard_matches:
+            for u, v, price, quantity in matches:
+                self._matches.append((u, v, price, quantity))
+                sold[v] += quantity
+                matched[u] = True
+            self.objective += objective
+        self.stats.update(stage1_objective=self.objective, stage1_time=time.perf_counter() - t0)
+
+        # stage 2: residual supply of boundary sell orders against the buy orders left unmatched where they reach
+        t0 = time.perf_counter()
+        residual = {v: self.orderset.get_sell_order(v).quantity - int(sold[v]) for v in self._boundary_sells}
+        sell_ids = [v for v, q in residual.items() if q > 0]
+        # only buy orders of the residual products can match
+        products = {self.orderset.get_sell_order(v).int_product_id for v in sell_ids}
+        candidates = sorted(u for k in products for u in self.orderset.get_buy_ids_by_product(k).tolist())
+        buy_ids = [u for u in candidates if not matched[u] and self._buy_cells[u] in self._reached_cells]
+
+        stage2_objective = 0.
+        if sell_ids and buy_ids:
+            sub, buy_map, sell_map = build_suborderset(self.orderset, buy_ids, sell_ids, sell_quantities=residual)
+            matcher = OMMEngine(sub, solver_pool=self.solver_pool, **self._model_config())
+            matcher.construct_params()
+            matcher.match()
+            col = matcher.get_matches().to_columns()
+            for u, v, price, quantity in zip(*(col[c].tolist() for c in ('int_buy_order_id', 'int_sell_order_id', 'price_cents', 'quantity'))):
+                self._matches.append((buy_map[u], sell_map[v], price, quantity))
+            stage2_objective = matcher.objective
+        self.objective += stage2_objective
+
+        self.stats.update(
+            stage2_objective=stage2_objective, stage2_buy_orders=len(buy_ids), stage2_sell_orders=len(sell_ids),
+            stage2_time=time.perf_counter() - t0
+        )
+
+    def get_matches(self) -> MatchSet:
+        u, v, price, quantity = zip(*self._matches) if self._matches else ([], [], [], [])
+        matches = MatchSet.from_arrays(self.orderset, u, v, price, quantity)
+
+        self.matchset = matches
+
+        return matches
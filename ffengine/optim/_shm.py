@@ -0,0 +1,83 @@
+import sys
+from dataclasses import dataclass
+from multiprocessing import resource_tracker, shared_memory
+from typing import Dict, Tuple
+
+import numpy as np
+
+ALIGNMENT = 64 # bytes, every array starts on a cache line
+
+_own_tracker = False
+
+def _runs_own_tracker() -> bool:
+    '''whether this process's resource tracker is its own rather than the one it shares with the creator: processes
+    started by multiprocessing inherit the running tracker (fork, spawn and forkserver alike), a process without one
+    yet (e.g. forked before the first block was created) starts its own on the first attach'''
+    global _own_tracker
+    _own_tracker = _own_tracker or resource_tracker._resource_tracker._fd is None
+    return _own_tracker
+
+
+@dataclass(frozen=True)
+class SharedArraysHandle:
+    '''what a worker needs to attach to a `SharedArrays` block: its name and {array: (dtype, shape, offset)}.
+    A few hundred bytes to pickle, whatever the size of the arrays'''
+    name: str
+    layout: Tuple[Tuple[str, str, Tuple[int, ...], int], ...]
+
+    def attach(self) -> Tuple[Dict[str, np.ndarray], shared_memory.SharedMemory]:
+        '''read-only views of the arrays (attaching copies nothing), keep the returned SharedMemory open while they
+        are used. Whatever must outlive it has to be copied out'''
+        if sys.version_info >= (3, 13):
+            shm = shared_memory.SharedMemory(name=self.name, track=False)
+        else:
+            # the block is the creator's to unlink. Attaching registers it with this process's resource tracker: an
+            # own tracker would unlink it (and warn) when this process exits, so it is unregistered there. A shared
+            # tracker holds the creator's registration, which must stay for the creator's unlink (and for cleanup if
+            # the creator crashes)
+            own_tracker = _runs_own_tracker()
+            shm = shared_memory.SharedMemory(name=self.name)
+            if own_tracker:
+                resource_tracker.unregister(shm._name, "shared_memory")
+        arrays = {}
+        for key, dtype, shape, offset in self.layout:
+            arr = np.ndarray(shape, dtype=np.dtype(dtype), buffer=shm.buf, offset=offset)
+            arr.flags.writeable = False
+            arrays[key] = arr
+        return arrays, shm
+
+
+class SharedArrays:
+    '''Numeric arrays copied once into one `multiprocessing.shared_memory` block, e.g. the order columns and pair
+    arrays of a problem that worker processes solve parts of. Pass `handle` to the workers instead of the arrays.
+
+    The creating process owns the block: `close` it when done (also unlinks it), or use it as a context manager.
+    '''
+
+    def __init__(self, arrays: Dict[str, np.ndarray]):
+        layout, offset = [], 0
+        arrays = {key: np.ascontiguousarray(arr) for key, arr in arrays.items()}
+        for key, arr in arrays.items():
+            assert arr.dtype.kind in "biuf", f"only numeric arrays can be shared, {key} is {arr.dtype}"
+            offset = -(-offset // ALIGNMENT) * ALIGNMENT
+            layout.append((key, arr.dtype.str, arr.shape, offset))
+            offset += arr.nbytes
+
+        self._shm = shared_memory.SharedMemory(create=True, size=max(offset, 1))
+        self.nbytes = offset
+        self.handle = SharedArraysHandle(self._shm.name, tuple(layout))
+
+        for key, dtype, shape, offset in layout:
+            np.ndarray(shape, dtype=np.dtype(dtype), buffer=self._shm.buf, offset=offset)[...] = arrays[key]
+
+    def close(self):
+        if self._shm is not None:
+            self._shm.close()
+            self._shm.unlink()
+            self._shm = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
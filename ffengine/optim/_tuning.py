@@ -0,0 +1,47 @@
+import json
+import os
+from typing import Dict, List, Optional
+
+# A solver profile (written by `python -m ffengine.tuning`) holds gurobi parameters per size class of the dense OMM
+# model, classes are ordered by `max_vars` and the last one has no bound:
+#
+#   {"version": 1, "size_classes": [{"max_vars": 5000, "params": {"MIPFocus": 1, "Presolve": 2}, "stats": {...}},
+#                                    {"max_vars": null, "params": {"Heuristics": 0.2}}]}
+PROFILE_VERSION = 1
+
+
+class SolverProfile:
+    '''gurobi parameters by model size (number of variables), see the format above'''
+
+    def __init__(self, size_classes: List[dict]):
+        self.size_classes = sorted(size_classes, key=lambda c: float("inf") if c.get("max_vars") is None else c["max_vars"])
+
+    @classmethod
+    def load(cls, path: str) -> "SolverProfile":
+        with open(path) as f:
+            profile = json.load(f)
+        assert profile.get("version") == PROFILE_VERSION, f"solver profile {path} has version {profile.get('version')}, expected {PROFILE_VERSION}"
+        return cls(profile["size_classes"])
+
+    def save(self, path: str):
+        with open(path, "w") as f:
+            json.dump({"version": PROFILE_VERSION, "size_classes": self.size_classes}, f, indent=2)
+
+    def params_for(self, n_vars: int) -> Dict[str, float]:
+        '''parameters of the smallest class that holds a model of `n_vars` variables, none if no class does'''
+        for size_class in self.size_classes:
+            if size_class.get("max_vars") is None or n_vars <= size_class["max_vars"]:
+                return dict(size_class["params"])
+        return {}
+
+
+_default_profile = None
+_default_loaded = False
+
+def get_solver_profile() -> Optional[SolverProfile]:
+    '''the profile at FFENGINE_SOLVER_PROFILE (loaded once), None when unset: gurobi defaults'''
+    global _default_profile, _default_loaded
+    if not _default_loaded:
+        path = os.environ.get("FFENGINE_SOLVER_PROFILE")
+        _default_profile, _default_loaded = SolverProfile.load(path) if path else None, True
+    return _default_profile
@@ -1,4 +1,7 @@
 import math
+import numpy as np
+
+from ffengine.data.orders import IdIndex
 
 ## General utils for preprocessing and matching engine stuff
 
@@ -16,4 +19,108 @@ def distance(origin, destination) -> float:
     c = 2 * math.atan2(math.sqrt(a), math.sqrt(1-a))
     d = radius * c
 
-    return d
\ No newline at end of file
+    return d
+
+def distance_matrix(lat_u, long_u, lat_v, long_v) -> np.ndarray:
+    '''vectorized `distance`: returns the U x V matrix of distances (km) between the points (lat_u, long_u) and (lat_v, long_v)'''
+    lat_u, long_u = np.radians(np.asarray(lat_u, dtype=np.float64))[:, None], np.radians(np.asarray(long_u, dtype=np.float64))[:, None]
+    lat_v, long_v = np.radians(np.asarray(lat_v, dtype=np.float64))[None, :], np.radians(np.asarray(long_v, dtype=np.float64))[None, :]
+
+    a = np.sin((lat_v - lat_u)/2)**2 + np.cos(lat_u) * np.cos(lat_v) * np.sin((long_v - long_u)/2)**2
+    c = 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+
+    return EARTH_RADIUS_KM * c
+
+
+def haversine_pairs(lat_u, long_u, lat_v, long_v) -> np.ndarray:
+    '''elementwise `distance` (km) between the points (lat_u[i], long_u[i]) and (lat_v[i], long_v[i])'''
+    lat_u, long_u, lat_v, long_v = (np.radians(np.asarray(x, dtype=np.float64)) for x in (lat_u, long_u, lat_v, long_v))
+
+    a = np.sin((lat_v - lat_u)/2)**2 + np.cos(lat_u) * np.cos(lat_v) * np.sin((long_v - long_u)/2)**2
+    return EARTH_RADIUS_KM * 2 * np.arctan2(np.sqrt(a), np.sqrt(1-a))
+
+
+## Distance modes of `feasible_pairs`:
+# "exact"     haversine of every U x V pair in float64
+# "screened"  the service range check is done on float32 chords (straight line distance between the points on the
+#             unit sphere, monotone in the great circle distance) and only the pairs that pass it get an exact
+#             haversine, which decides the pairs close to the boundary and gives the costs. Same pairs and costs as
+#             "exact", with one subtraction per coordinate per pair instead of the trig functions
+DISTANCE_MODES = ("exact", "screened")
+
+# |float32 chord - chord| <= CHORD_ABS_ERROR + CHORD_REL_ERROR * chord: the unit vectors are rounded to float32
+# (2^-25 per component, both points), then the differences, squares and sum add a few relative roundings. Both
+# bounds have a x2 margin, CHORD_ABS_ERROR is ~1.5m on the earth
+CHORD_ABS_ERROR = 4 * 2.**-24
+CHORD_REL_ERROR = 8 * 2.**-24
+
+def unit_vectors(lat, long, dtype=np.float32) -> np.ndarray:
+    '''the N x 3 points on the unit sphere of (lat, long) in degrees, computed in float64 and rounded to `dtype`'''
+    lat, long = np.radians(np.asarray(lat, dtype=np.float64)), np.radians(np.asarray(long, dtype=np.float64))
+    return np.stack([np.cos(lat) * np.cos(long), np.cos(lat) * np.sin(long), np.sin(lat)], axis=1).astype(dtype)
+
+def range_chord(service_range) -> np.ndarray:
+    '''chord of a great circle distance (km)'''
+    return 2 * np.sin(np.minimum(np.asarray(service_range, dtype=np.float64) / EARTH_RADIUS_KM, np.pi) / 2)
+
+def maybe_in_range(lat_u, long_u, lat_v, long_v, service_range) -> np.ndarray:
+    '''U x V float32 screen of `distance_matrix(...) <= service_range[None, :]`: True for every pair within the
+    range, and possibly for pairs just outside it (within the chord error bound), so it never drops a pair'''
+    a, b = unit_vectors(lat_u, long_u), unit_vectors(lat_v, long_v)
+
+    chord2 = np.zeros((len(a), len(b)), dtype=np.float32)
+    for axis in range(3):
+        diff = a[:, axis, None] - b[None, :, axis]
+        chord2 += diff * diff
+
+    t = range_chord(service_range)
+    bound = (t + CHORD_ABS_ERROR + CHORD_REL_ERROR * t)**2
+    # round the float64 bound up to float32, so the comparison stays in float32 without losing the margin
+    bound32 = bound.astype(np.float32)
+    bound32 = np.where(bound32 < bound, np.nextafter(bound32, np.float32(np.inf)), bound32)
+    return chord2 <= bound32[None, :]
+
+
+def is_feasible(buy_order, sell_order, d: float) -> bool:
+    '''f_uv for a single pair of orders `d` km apart, see `OMMEngine.construct_params`'''
+    return (
+        buy_order.int_product_id == sell_order.int_product_id and
+        buy_order.time_expiry >= sell_order.time_activation and sell_order.time_expiry >= buy_order.time_activation and
+        d <= sell_order.service_range and
+        buy_order.max_price_cents >= sell_order.min_price_cents
+    )
+
+
+def feasible_pairs(buys: dict, sells: dict, distance_mode: str = "exact", products=None):
+    '''the pairs with f_uv = 1 from the OrderSet's columns (see `OrderSet.get_buy_columns`), as arrays (u, v, d).
+    Distances are only computed within a product, so memory is O(largest product's U*V) instead of O(U*V).
+    `distance_mode` is one of `DISTANCE_MODES`, both give the same pairs and distances.
+    `products` are the (int_product_id, buy ids, sell ids) to pair, e.g. `OrderSet.iter_products()`, by default
+    they are grouped from the columns'''
+    assert distance_mode in DISTANCE_MODES, f"unknown distance mode {distance_mode}, expected one of {DISTANCE_MODES}"
+    us, vs, ds = [np.zeros(0, dtype=np.int64)], [np.zeros(0, dtype=np.int64)], [np.zeros(0)]
+
+    if products is None:
+        by_buy, by_sell = IdIndex.from_keys(buys['int_product_id']), IdIndex.from_keys(sells['int_product_id'])
+        products = ((k, by_buy.get(k), by_sell.get(k)) for k in sorted(set(by_buy.keys()) & set(by_sell.keys())))
+
+    for k, u, v in products:
+        f = (
+            (buys['time_expiry'][u][:, None] >= sells['time_activation'][v][None, :]) &
+            (sells['time_expiry'][v][None, :] >= buys['time_activation'][u][:, None]) &
+            (buys['max_price_cents'][u][:, None] >= sells['min_price_cents'][v][None, :])
+        )
+
+        if distance_mode == "exact":
+            d = distance_matrix(buys['lat'][u], buys['long'][u], sells['lat'][v], sells['long'][v])
+            i, j = np.nonzero(f & (d <= sells['service_range'][v][None, :]))
+            d = d[i, j]
+        else:
+            i, j = np.nonzero(f & maybe_in_range(buys['lat'][u], buys['long'][u], sells['lat'][v], sells['long'][v], sells['service_range'][v]))
+            d = haversine_pairs(buys['lat'][u[i]], buys['long'][u[i]], sells['lat'][v[j]], sells['long'][v[j]])
+            keep = d <= sells['service_range'][v[j]]
+            i, j, d = i[keep], j[keep], d[keep]
+
+        us.append(u[i]), vs.append(v[j]), ds.append(d)
+
+    return np.concatenate(us), np.concatenate(vs), np.concatenate(ds)
@@ -1,7 +1,16 @@
-from ._models import OrderMatchingModel
 from ffengine.data import MatchSet, Match, OrderSet
-from ._utils import distance
+from ffengine.data.book import OrderBook
+from ffengine.profiling import StageProfiler, get_profiler, run_stage
+from ._utils import distance, distance_matrix, feasible_pairs, is_feasible
+from ._params import IncrementalParams
+from ._resources import SolverPool, get_default_pool
+from ._tuning import SolverProfile, get_solver_profile
+from ._flow import solve_transportation
+from itertools import product
 import abc
+import time
+
+import numpy as np
 
 class Engine(abc.ABC):
     
@@ -21,110 +30,446 @@ class Engine(abc.ABC):
     def get_matches(self) -> MatchSet:
         pass
 
+    def run(self, batch_id=None, profiler: StageProfiler=None) -> MatchSet:
+        '''construct_params, match and get_matches in a row. Stages go through `profiler`, which defaults to the one
+        configured by FFENGINE_PROFILE (see `ffengine.profiling`), artifacts are named by `batch_id`'''
+        profiler = profiler or get_profiler()
+        batch_id = batch_id if batch_id is not None else f"{type(self).__name__}-{int(time.time()*1000)}"
+
+        run_stage(profiler, batch_id, 'construct_params', self.construct_params)
+        run_stage(profiler, batch_id, 'match', self.match)
+        return run_stage(profiler, batch_id, 'get_matches', self.get_matches)
+
 
 class OMMEngine(Engine):
 
-    def __init__(self, orderset: OrderSet, unit_tcost=3, **kwargs):
+    def __init__(self, orderset: OrderSet, unit_tcost=3, params: IncrementalParams=None, solver_pool: SolverPool=None,
+                 solver_profile: SolverProfile=None, solver_params: dict=None, **kwargs):
         # kwargs are a catchall that are ignored so that interface is the same across engines
+        # params: parameters built while the orders arrived, `construct_params` then has nothing left to do
+        # solver_pool: gurobi environments/threads to solve with, defaults to the process wide pool
+        # solver_profile: tuned gurobi parameters by model size, defaults to the one at FFENGINE_SOLVER_PROFILE (see `ffengine.tuning`)
+        # solver_params: gurobi parameters applied on top of the profile's
         self.orderset = orderset
         self._params = {}
         self.unit_tcost = unit_tcost
+        self._prebuilt_params = params
+        self.solver_pool = solver_pool or get_default_pool()
+        self.solver_profile = solver_profile or get_solver_profile()
+        self.solver_params = solver_params or {}
+
+        if params is not None:
+            assert params.orderset is orderset and params.unit_tcost == unit_tcost, "prebuilt params do not belong to this OrderSet/model config"
 
     def get_orderset(self):
         return self.orderset
 
     def construct_params(self):
         ''' Constructs the parameters for OMM based on the given OrderSet. This must be run before `match`
-        straightforward approach: O(U*V + U + V)'''
+        straightforward approach: O(U*V + U + V), vectorized over the OrderSet's columns'''
 
-        self._params['BUYORDERS'] = range(self.orderset.n_buy_orders)
-        self._params['SELLORDERS'] = range(self.orderset.n_sell_orders)
+        if self._prebuilt_params is not None:
+            self._params = self._prebuilt_params.params
+            return
 
-        self._params['p_u'] = {}
-        self._params['p_v'] = {}
-        self._params['q_u'] = {}
-        self._params['q_v'] = {}
+        buys = self.orderset.get_buy_columns()
+        sells = self.orderset.get_sell_columns()
+        BUYORDERS = range(self.orderset.n_buy_orders)
+        SELLORDERS = range(self.orderset.n_sell_orders)
 
-        self._params['f_uv'] = {}
-        self._params['c_uv'] = {}
+        self._params['BUYORDERS'] = BUYORDERS
+        self._params['SELLORDERS'] = SELLORDERS
 
-        for u in self.orderset.iter_buy_orders():
-            self._params['p_u'][u.int_order_id] = u.max_price_cents
-            self._params['q_u'][u.int_order_id] = u.quantity
+        self._params['p_u'] = dict(zip(BUYORDERS, buys['max_price_cents'].tolist()))
+        self._params['p_v'] = dict(zip(SELLORDERS, sells['min_price_cents'].tolist()))
+        self._params['q_u'] = dict(zip(BUYORDERS, buys['quantity'].tolist()))
+        self._params['q_v'] = dict(zip(SELLORDERS, sells['quantity'].tolist()))
 
-        for v in self.orderset.iter_sell_orders():
-            self._params['p_v'][v.int_order_id] = v.min_price_cents
-            self._params['q_v'][v.int_order_id] = v.quantity
+        ## construct uv params (U x V matrices, row u column v)
+        d = distance_matrix(buys['lat'], buys['long'], sells['lat'], sells['long'])
 
-        
-        ## construct uv params
-        for u in self.orderset.iter_buy_orders():
-            for v in self.orderset.iter_sell_orders():
-                d = distance(
-                    (u.lat, u.long),
-                    (v.lat, v.long)
-                )
+        ## able to match criteria:
+        # 1) same product
+        is_same_prod = buys['int_product_id'][:, None] == sells['int_product_id'][None, :]
+        # 2) available at same time
+        is_available = (buys['time_expiry'][:, None] >= sells['time_activation'][None, :]) & (sells['time_expiry'][None, :] >= buys['time_activation'][:, None])
+        # 3) distance is within service region
+        is_serviceable = d <= sells['service_range'][None, :]
+        # 4) price bounds are feasible
+        is_beneficial = buys['max_price_cents'][:, None] >= sells['min_price_cents'][None, :]
+
+        pairs = list(product(BUYORDERS, SELLORDERS))
+        self._params['c_uv'] = dict(zip(pairs, (d * self.unit_tcost).ravel().tolist()))
 
-                self._params['c_uv'][
-                    (u.int_order_id, v.int_order_id)
-                ] = d * self.unit_tcost
-
-                ## able to match criteria:
-                # 1) same product
-                is_same_prod = (u.int_product_id == v.int_product_id)
-                # 2) available at same time
-                is_available = (u.time_expiry >= v.time_activation) & (v.time_expiry >= u.time_activation)
-                # 3) distance is within service region
-                is_serviceable = (d <= v.service_range)
-                # 4) price bounds are feasible
-                is_beneficial = (u.max_price_cents >= v.min_price_cents)
-
-                # 1 if all conditions are met, 0 otherwise
-                self._params['f_uv'][(
-                    u.int_order_id, v.int_order_id
-                )] = int(is_same_prod & is_available & is_serviceable & is_beneficial)
+        # 1 if all conditions are met, 0 otherwise
+        self._params['f_uv'] = dict(zip(pairs, (is_same_prod & is_available & is_serviceable & is_beneficial).astype(int).ravel().tolist()))
 
     def match(self):
-        solver = OrderMatchingModel(**self._params)
-        solver.optimize()
+        n_buy, n_sell = len(self._params['BUYORDERS']), len(self._params['SELLORDERS'])
+        n_vars = 2*n_buy*n_sell + n_buy
+
+        with self.solver_pool.solve_slot(n_vars=n_vars) as (env, threads):
+            from ._models import OrderMatchingModel # gurobipy is only imported once something is solved
+
+            solver = OrderMatchingModel(**self._params, env=env)
+            solver.Params.Threads = threads
+            tuned = {**(self.solver_profile.params_for(n_vars) if self.solver_profile else {}), **self.solver_params}
+            for param, value in tuned.items():
+                solver.setParam(param, value)
+            solver.optimize()
+
+            # read the solution while the environment is still ours
+            self.objective = solver.ObjVal
+            self.runtime = solver.Runtime
+            self._solution = solver.getAttr('X', solver.getVars()['x_uv'])
+            solver.dispose()
+
         self._solved_model = solver
 
 
     def get_matches(self) -> MatchSet:
 
-        matches = MatchSet()
-
         model_vars = self._solved_model.getVars()
-        x_uv = model_vars['x_uv']
+        x_uv = self._solution # read in one bulk query by `match`
+
+        buy_ids, sell_ids, prices, quantities = [], [], [], []
+        for (u, v), x in x_uv.items():
+            quantity = int(x)
+
+            if quantity > 0:
+                buy_order, sell_order = self.orderset.get_buy_order(u), self.orderset.get_sell_order(v)
+
+                # is this assertion necessary? We can likely remove this after some testing
+                assert (
+                    (buy_order.max_price_cents == model_vars['p_u'][u]) and (sell_order.min_price_cents == model_vars['p_v'][v]) and
+                    (buy_order.quantity == model_vars['q_u'][u]) and (sell_order.quantity == model_vars['q_v'][v])
+                    ), "Critical assertion failed! Order IDs have got mixed up... data is wrong"
+
+                assert(
+                    quantity <= buy_order.quantity and quantity <=sell_order.quantity
+                ), "Critical assertion failed! Supply/demand constraints violated"
+                
+                buy_ids.append(u), sell_ids.append(v), quantities.append(quantity)
+                prices.append(self._solved_model.price(model_vars['p_u'][u], model_vars['p_v'][v]))
+
+        # one columnar MatchSet, `Match` objects are only built if someone iterates over it
+        matches = MatchSet.from_arrays(self.orderset, buy_ids, sell_ids, prices, quantities)
+        self.matchset = matches
         
-        for buy_order in self.orderset.iter_buy_orders():
-            for sell_order in self.orderset.iter_sell_orders():
-                u, v = buy_order.int_order_id, sell_order.int_order_id
+        return matches
 
-                quantity = int(x_uv[u,v].x)
 
-                if quantity > 0:
 
-                    # is this assertion necessary? We can likely remove this after some testing
-                    assert (
-                        (buy_order.max_price_cents == model_vars['p_u'][u]) and (sell_order.min_price_cents == model_vars['p_v'][v]) and
-                        (buy_order.quantity == model_vars['q_u'][u]) and (sell_order.quantity == model_vars['q_v'][v])
-                        ), "Critical assertion failed! Order IDs have got mixed up... data is wrong"
 
-                    assert(
-                        quantity <= buy_order.quantity and quantity <=sell_order.quantity
-                    ), "Critical assertion failed! Supply/demand constraints violated"
-                    
-                    price = self._solved_model.price(model_vars['p_u'][u], model_vars['p_v'][v])
-                    
 
-                    matches.add_match(
-                        Match(buy_order=buy_order, sell_order=sell_order, price_cents=price, quantity=quantity)
-                    )
+class LPRoundingEngine(Engine):
+    '''Fast mode for batches too large for the integer model: solves the LP relaxation of OMM over the feasible pairs
+    (polynomial), then rounds it greedily into a feasible matching.
+
+    Rounding: buy orders are visited by decreasing LP y_u, then by best unit margin for the ones the LP left out (and
+    a second time by order value, the better of the two passes is kept). Each is filled from its sellers by decreasing LP x_uv with the residual supply, skipping allocations that would lose
+    money on their own (4.2), and only kept if the whole quantity is filled (2) at a positive profit.
+
+    After `match`: `lp_bound` is the LP objective (an upper bound on what OMM can reach), `objective` the rounded
+    solution's and `gap` the relative difference between them.
+    '''
+
+    def __init__(self, orderset: OrderSet, unit_tcost=3, solver_pool: SolverPool=None, distance_mode: str="exact", **kwargs):
+        self.orderset = orderset
+        self.unit_tcost = unit_tcost
+        self.solver_pool = solver_pool or get_default_pool()
+        self.distance_mode = distance_mode
+
+    def get_orderset(self):
+        return self.orderset
+
+    def construct_params(self):
+        '''feasible pairs only, computed product by product: O(sum over products of U_k*V_k). With
+        `distance_mode="screened"` the service ranges are checked in float32 first (see `_utils.DISTANCE_MODES`)'''
+        buys = self.orderset.get_buy_columns()
+        sells = self.orderset.get_sell_columns()
+
+        u, v, d = feasible_pairs(buys, sells, self.distance_mode, self.orderset.iter_products())
+        self._pair_u, self._pair_v = u, v
+        self._pair_c = d * self.unit_tcost
+        self._pair_price = np.ceil((buys['max_price_cents'][u] + sells['min_price_cents'][v]) / 2)
+        self._q_u, self._q_v = buys['quantity'], sells['quantity']
+
+    def match(self):
+        pairs = list(zip(self._pair_u.tolist(), self._pair_v.tolist()))
+        BUYORDERS, SELLORDERS = range(self.orderset.n_buy_orders), range(self.orderset.n_sell_orders)
+
+        with self.solver_pool.solve_slot(n_vars=2*len(pairs) + len(BUYORDERS)) as (env, threads):
+            from ._models import SparseOrderMatchingModel # gurobipy is only imported once something is solved
+
+            buys, sells = self.orderset.get_buy_columns(), self.orderset.get_sell_columns()
+            solver = SparseOrderMatchingModel(
+                env=env, tight_binding=True,
+                BUYORDERS=BUYORDERS, SELLORDERS=SELLORDERS, PAIRS=pairs,
+                p_u=dict(zip(BUYORDERS, buys['max_price_cents'].tolist())),
+                p_v=dict(zip(SELLORDERS, sells['min_price_cents'].tolist())),
+                q_u=dict(zip(BUYORDERS, self._q_u.tolist())),
+                q_v=dict(zip(SELLORDERS, self._q_v.tolist())),
+                c_uv=dict(zip(pairs, self._pair_c.tolist())),
+            )
+            solver.relax_integrality()
+            solver.Params.Threads = threads
+            solver.optimize()
+
+            model_vars = solver.getVars()
+            self.lp_bound = solver.ObjVal
+            x_lp = np.array(solver.getAttr('X', [model_vars['x_uv'][p] for p in pairs])) if pairs else np.zeros(0)
+            y_lp = np.array(solver.getAttr('X', [model_vars['y_u'][u] for u in BUYORDERS])) if len(BUYORDERS) else np.zeros(0)
+            solver.dispose()
+
+        self._allocation = self._round(x_lp, y_lp)
+        self.objective = sum(self._pair_price[k]*x - self._pair_c[k] for k, x in self._allocation)
+        self.gap = (self.lp_bound - self.objective) / abs(self.lp_bound) if self.lp_bound else 0.
+
+    def _round(self, x_lp: np.ndarray, y_lp: np.ndarray):
+        '''greedy repair of the LP solution, returns [(pair index, quantity)]'''
+        margin = self._pair_price - self._pair_c / self._q_u[self._pair_u] # per unit, if u were filled by this pair alone
+
+        # pairs of every buy order, by decreasing LP flow then unit margin
+        by_buy = {}
+        for k in np.lexsort((-margin, -x_lp)).tolist():
+            by_buy.setdefault(int(self._pair_u[k]), []).append(k)
+
+        best_margin = {u: margin[ks].max() for u, ks in by_buy.items()}
+
+        # the LP's preference first, and the orders' own value as a second opinion: keep the better of the two
+        orders = [
+            sorted(by_buy, key=lambda u: (-y_lp[u], -best_margin[u])),
+            sorted(by_buy, key=lambda u: -best_margin[u]*self._q_u[u]),
+        ]
+        return max((self._fill(order, by_buy) for order in orders), key=lambda a: a[1])[0]
+
+    def _fill(self, order, by_buy):
+        '''one greedy pass over the buy orders in `order`, returns (allocation, its objective)'''
+        residual = self._q_v.copy()
+        allocation, total = [], 0.
+        for u in order:
+            need, taken, profit = int(self._q_u[u]), [], 0.
+            for k in by_buy[u]:
+                q = min(need, int(residual[self._pair_v[k]]))
+                if q <= 0 or self._pair_price[k]*q - self._pair_c[k] < 0: # (4.2) specific instance seller profit
+                    continue
+                taken.append((k, q))
+                profit += self._pair_price[k]*q - self._pair_c[k]
+                need -= q
+                if need == 0:
+                    break
+
+            if need == 0 and profit > 0: # (2) all or nothing
+                for k, q in taken:
+                    residual[self._pair_v[k]] -= q
+                allocation.extend(taken)
+                total += profit
+
+        return allocation, total
+
+    def get_matches(self) -> MatchSet:
+        k = np.array([k for k, _ in self._allocation], dtype=np.int64)
+        quantity = np.array([q for _, q in self._allocation], dtype=np.int64)
+        matches = MatchSet.from_arrays(self.orderset, self._pair_u[k], self._pair_v[k], self._pair_price[k], quantity)
 
         self.matchset = matches
-        
+
+        return matches
+
+
+class MinCostFlowEngine(Engine):
+    '''Matching for batches that allow partial fills: without the all-or-nothing demand (2) OMM is a transportation
+    problem, solved as a min-cost flow (ortools' network simplex when installed, otherwise a gurobi simplex LP).
+
+    The fixed charge c_uv is the only non network part:
+    - linearization: it is spread over the largest shipment the pair can carry, unit profit = price - c_uv/min(q_u, q_v)
+      (exact when the pair ships that much, otherwise an underestimate of the cost)
+    - pruning: pairs with no positive unit profit are left out of the network
+    - repair (dynamic slope scaling): the flow is solved again with the charge of every used pair spread over what
+      it actually ships and the pairs used at a loss (price*x_uv < c_uv, (4.2)) pruned, until the flow settles or
+      `max_iterations`. The best iterate is kept, with any pair still at a loss dropped
+
+    `objective` is the fixed charge objective of the matches, so it compares directly with OMM's.
+    '''
+
+    def __init__(self, orderset: OrderSet, unit_tcost=3, solver_pool: SolverPool=None, max_iterations: int=10, distance_mode: str="exact", **kwargs):
+        self.orderset = orderset
+        self.unit_tcost = unit_tcost
+        self.solver_pool = solver_pool or get_default_pool()
+        self.max_iterations = max_iterations
+        self.distance_mode = distance_mode
+
+    def get_orderset(self):
+        return self.orderset
+
+    def construct_params(self):
+        buys = self.orderset.get_buy_columns()
+        sells = self.orderset.get_sell_columns()
+        self._q_u, self._q_v = buys['quantity'], sells['quantity']
+
+        u, v, d = feasible_pairs(buys, sells, self.distance_mode, self.orderset.iter_products())
+        price = np.ceil((buys['max_price_cents'][u] + sells['min_price_cents'][v]) / 2)
+        c = d * self.unit_tcost
+        cap = np.minimum(self._q_u[u], self._q_v[v])
+
+        keep = price*cap - c > 0 # pruning pre-pass
+        self._pair_u, self._pair_v, self._pair_price, self._pair_c, self._pair_cap = u[keep], v[keep], price[keep], c[keep], cap[keep]
+        self.n_pruned = int((~keep).sum())
+
+    def match(self):
+        active = np.ones(len(self._pair_u), dtype=bool)
+        shipment = self._pair_cap.astype(np.float64) # what the fixed charge is spread over
+        self.objective, self._flow = 0., np.zeros(len(self._pair_u), dtype=np.int64)
+
+        for self.n_iterations in range(1, self.max_iterations + 1):
+            x = np.zeros(len(self._pair_u), dtype=np.int64)
+            x[active] = solve_transportation(
+                self._pair_u[active], self._pair_v[active], (self._pair_price - self._pair_c / shipment)[active],
+                self._pair_cap[active], self._q_u, self._q_v, solver_pool=self.solver_pool
+            )
+
+            at_loss = (x > 0) & (self._pair_price*x - self._pair_c < 0)
+            used = (x > 0) & ~at_loss
+            objective = float((self._pair_price[used]*x[used] - self._pair_c[used]).sum())
+            if objective > self.objective:
+                self.objective, self._flow = objective, np.where(used, x, 0)
+
+            # next linearization: pairs at a loss are pruned, used pairs are charged over what they actually ship
+            converged = not at_loss.any() and np.array_equal(shipment[used], x[used])
+            active &= ~at_loss
+            shipment[used] = x[used]
+            if converged:
+                break
+
+    def get_matches(self) -> MatchSet:
+        k = np.nonzero(self._flow)[0]
+        matches = MatchSet.from_arrays(self.orderset, self._pair_u[k], self._pair_v[k], self._pair_price[k], self._flow[k])
+
+        self.matchset = matches
+
         return matches
 
 
+class IncrementalOMMEngine(Engine):
+    '''OMM over a persistent `OrderBook`. The sparse model (feasible pairs only) is built once and then updated in
+    place every round from the book's change log, so per round work scales with the churn rather than the book size.
 
+    usage, every round:
+        book.expire(now); book.add_buy_order(...); ...
+        engine.construct_params(); engine.match(); matches = engine.get_matches()
+        book.apply_matches(matches)
+    '''
+
+    def __init__(self, orderbook: OrderBook, unit_tcost=3, solver_pool: SolverPool=None, **kwargs):
+        self.orderbook = orderbook
+        self.unit_tcost = unit_tcost
+        self.solver_pool = solver_pool or get_default_pool()
+        self._model = None
+        self._env = None
+
+    def get_orderset(self):
+        return self.orderbook
+
+    def _pairs_of_buy_order(self, u):
+        for v in self.orderbook.get_sell_candidates(u.int_product_id):
+            v = self.orderbook.get_sell_order(v)
+            d = distance((u.lat, u.long), (v.lat, v.long))
+            if is_feasible(u, v, d):
+                yield u.int_order_id, v.int_order_id, d * self.unit_tcost
+
+    def _pairs_of_sell_order(self, v, skip_buy_orders=()):
+        for u in self.orderbook.get_buy_candidates(v.int_product_id):
+            if u in skip_buy_orders:
+                continue
+            u = self.orderbook.get_buy_order(u)
+            d = distance((u.lat, u.long), (v.lat, v.long))
+            if is_feasible(u, v, d):
+                yield u.int_order_id, v.int_order_id, d * self.unit_tcost
+
+    def construct_params(self):
+        '''apply the changes to the book since the last round to the model: O(churn * orders per product)'''
+        changes = self.orderbook.pop_changes()
+
+        if self._model is None:
+            # first round, build the model in one go from the whole book
+            pairs = {}
+            for u in self.orderbook.iter_buy_orders():
+                pairs.update({(u_id, v_id): c for u_id, v_id, c in self._pairs_of_buy_order(u)})
+
+            buys, sells = list(self.orderbook.iter_buy_orders()), list(self.orderbook.iter_sell_orders())
+            from ._models import SparseOrderMatchingModel # gurobipy is only imported once something is solved
+
+            # the model lives as long as the engine, so it keeps its own environment
+            self._env = self.solver_pool.acquire_env()
+            self._model = SparseOrderMatchingModel(
+                env=self._env,
+                BUYORDERS=[u.int_order_id for u in buys],
+                SELLORDERS=[v.int_order_id for v in sells],
+                PAIRS=list(pairs),
+                p_u={u.int_order_id: u.max_price_cents for u in buys},
+                p_v={v.int_order_id: v.min_price_cents for v in sells},
+                q_u={u.int_order_id: u.quantity for u in buys},
+                q_v={v.int_order_id: v.quantity for v in sells},
+                c_uv=pairs,
+            )
+            return
+
+        model = self._model
+        for u in changes['removed_buy']:
+            model.remove_buy_order(u)
+        for v in changes['removed_sell']:
+            model.remove_sell_order(v)
+        for v in changes['changed_sell']:
+            model.set_sell_quantity(v, self.orderbook.get_sell_order(v).quantity)
+
+        added_buys = [self.orderbook.get_buy_order(u) for u in changes['added_buy']]
+        added_sells = [self.orderbook.get_sell_order(v) for v in changes['added_sell']]
+
+        for u in added_buys:
+            model.add_buy_order(u.int_order_id, u.max_price_cents, u.quantity)
+        for v in added_sells:
+            model.add_sell_order(v.int_order_id, v.min_price_cents, v.quantity)
+
+        # new buy orders against the whole book (including new sell orders), new sell orders against old buy orders
+        for u in added_buys:
+            for u_id, v_id, c in self._pairs_of_buy_order(u):
+                model.add_pair(u_id, v_id, c)
+        for v in added_sells:
+            for u_id, v_id, c in self._pairs_of_sell_order(v, skip_buy_orders=changes['added_buy']):
+                model.add_pair(u_id, v_id, c)
+
+    def match(self):
+        with self.solver_pool.solve_slot(n_vars=self._model.NumVars, env=self._env) as (env, threads):
+            self._model.Params.Threads = threads
+            self._model.optimize()
+            self.objective = self._model.ObjVal
+
+    def close(self):
+        '''free the model and give its environment back to the pool'''
+        if self._model is not None:
+            self._model.dispose()
+            self.solver_pool.release_env(self._env)
+            self._model, self._env = None, None
+
+    def get_matches(self) -> MatchSet:
+        matches = MatchSet()
+
+        model_vars = self._model.getVars()
+        pairs = list(model_vars['x_uv'])
+        x_uv = self._model.getAttr('X', list(model_vars['x_uv'].values())) if pairs else []
+
+        for (u, v), x in zip(pairs, x_uv):
+            quantity = int(x)
+
+            if quantity > 0:
+                buy_order, sell_order = self.orderbook.get_buy_order(u), self.orderbook.get_sell_order(v)
+                price = self._model.price(model_vars['p_u'][u], model_vars['p_v'][v])
+
+                matches.add_match(
+                    Match(buy_order=buy_order, sell_order=sell_order, price_cents=price, quantity=quantity)
+                )
+
+        self.matchset = matches
+
+        return matches
@@ -0,0 +1,169 @@
+'''Opt-in profiling of the matching stages (construct_params, match, get_matches).
+
+A `StageProfiler` runs selected stages under cProfile or a sampling profiler, optionally with tracemalloc, and writes
+one artifact per stage and batch to its output directory:
+
+    <out_dir>/<batch_id>.<stage>.prof           cProfile stats (`python -m pstats`, snakeviz, ...)
+    <out_dir>/<batch_id>.<stage>.folded         sampled stacks in folded format (flamegraph.pl, speedscope)
+    <out_dir>/<batch_id>.<stage>.tracemalloc    tracemalloc snapshot (`tracemalloc.Snapshot.load`)
+    <out_dir>/<batch_id>.<stage>.mem.txt        peak traced memory and the top allocation sites
+
+Enable it from the environment (read once, by `get_profiler`):
+
+    FFENGINE_PROFILE=cprofile|sample    profiler to use, unset or empty disables profiling
+    FFENGINE_PROFILE_STAGES=match,...   stages to profile, defaults to all of them
+    FFENGINE_PROFILE_MEMORY=1           also trace allocations
+    FFENGINE_PROFILE_DIR=profiles       output directory
+
+or pass a `StageProfiler` to `Engine.run`, `TestCase.run` or `MatchingEngineService.PROFILER`. Disabled, `run_stage`
+just calls the stage.
+'''
+import cProfile
+import os
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+from typing import Callable, Iterable, Optional
+
+STAGES = ("construct_params", "match", "get_matches")
+MODES = ("cprofile", "sample")
+
+# tracemalloc is process wide: stages traced for memory run one at a time, so that one stage's stop or peak reset
+# does not cut into another's
+_memory_lock = threading.Lock()
+
+
+class _Sampler(threading.Thread):
+    '''samples the stack of one thread every `interval` seconds'''
+
+    def __init__(self, thread_id: int, interval: float):
+        super().__init__(daemon=True)
+        self.thread_id = thread_id
+        self.interval = interval
+        self.counts = Counter()
+        self._done = threading.Event()
+
+    def run(self):
+        while not self._done.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{code.co_name} ({os.path.basename(code.co_filename)}:{code.co_firstlineno})")
+                frame = frame.f_back
+            if stack:
+                self.counts[";".join(reversed(stack))] += 1
+
+    def stop(self):
+        self._done.set()
+        self.join()
+
+    def dump(self, path: str):
+        with open(path, "w") as f:
+            for stack, count in self.counts.most_common():
+                f.write(f"{stack} {count}\n")
+
+
+class StageProfiler:
+    '''profiles the `stages` it is asked to run (see the module docstring for the artifacts)'''
+
+    def __init__(self, out_dir: str, mode: str = "cprofile", stages: Iterable[str] = STAGES, memory: bool = False,
+                 interval: float = 0.005, top_allocations: int = 25):
+        assert mode in MODES, f"unknown profiling mode {mode}, expected one of {MODES}"
+        self.out_dir = out_dir
+        self.mode = mode
+        self.stages = set(stages)
+        self.memory = memory
+        self.interval = interval
+        self.top_allocations = top_allocations
+
+    @classmethod
+    def from_env(cls) -> Optional["StageProfiler"]:
+        mode = os.environ.get("FFENGINE_PROFILE", "").strip().lower()
+        if not mode:
+            return None
+
+        stages = os.environ.get("FFENGINE_PROFILE_STAGES")
+        return cls(
+            out_dir=os.environ.get("FFENGINE_PROFILE_DIR", "profiles"),
+            mode=mode,
+            stages=[s.strip() for s in stages.split(",")] if stages else STAGES,
+            memory=os.environ.get("FFENGINE_PROFILE_MEMORY") == "1",
+        )
+
+    def _path(self, batch_id, stage: str, ext: str) -> str:
+        return os.path.join(self.out_dir, f"{str(batch_id).replace(os.sep, '_')}.{stage}.{ext}")
+
+    def run(self, batch_id, stage: str, fn: Callable):
+        '''call `fn` (the stage), profiled if `stage` is one of ours. Profiles the calling thread, stages
+        traced for memory wait for each other'''
+        if stage not in self.stages:
+            return fn()
+
+        os.makedirs(self.out_dir, exist_ok=True)
+        if self.memory:
+            with _memory_lock:
+                return self._run(batch_id, stage, fn)
+        return self._run(batch_id, stage, fn)
+
+    def _run(self, batch_id, stage: str, fn: Callable):
+        tracing = self.memory and not tracemalloc.is_tracing()
+        if tracing:
+            tracemalloc.start()
+        elif self.memory and hasattr(tracemalloc, "reset_peak"):
+            # traced before (python 3.9+ only, before that the peak covers all of the tracing so far)
+            tracemalloc.reset_peak()
+
+        if self.mode == "cprofile":
+            profiler = cProfile.Profile()
+            profiler.enable()
+        else:
+            profiler = _Sampler(threading.get_ident(), self.interval)
+            profiler.start()
+
+        start = time.perf_counter()
+        try:
+            return fn()
+        finally:
+            elapsed = time.perf_counter() - start
+            if self.mode == "cprofile":
+                profiler.disable()
+                profiler.dump_stats(self._path(batch_id, stage, "prof"))
+            else:
+                profiler.stop()
+                profiler.dump(self._path(batch_id, stage, "folded"))
+
+            if self.memory:
+                self._dump_memory(batch_id, stage, elapsed)
+                if tracing:
+                    tracemalloc.stop()
+
+    def _dump_memory(self, batch_id, stage: str, elapsed: float):
+        snapshot = tracemalloc.take_snapshot()
+        snapshot.dump(self._path(batch_id, stage, "tracemalloc"))
+        _, peak = tracemalloc.get_traced_memory()
+
+        with open(self._path(batch_id, stage, "mem.txt"), "w") as f:
+            f.write(f"{stage} of batch {batch_id}: {elapsed:.4f}s, peak traced memory {peak / 2**20:.1f} MiB\n\n")
+            for stat in snapshot.statistics("lineno")[:self.top_allocations]:
+                f.write(f"{stat}\n")
+
+
+_default_profiler = None
+_default_loaded = False
+
+def get_profiler() -> Optional[StageProfiler]:
+    '''the profiler configured by the FFENGINE_PROFILE* environment variables, None when profiling is off'''
+    global _default_profiler, _default_loaded
+    if not _default_loaded:
+        _default_profiler, _default_loaded = StageProfiler.from_env(), True
+    return _default_profiler
+
+
+def run_stage(profiler: Optional[StageProfiler], batch_id, stage: str, fn: Callable):
+    '''`fn()`, under `profiler` when there is one'''
+    if profiler is None:
+        return fn()
+    return profiler.run(batch_id, stage, fn)
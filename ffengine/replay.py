@@ -0,0 +1,166 @@
+'''Record matching batches and re-run them offline.
+
+Recording (opt-in, see `BatchRecorder`) writes one directory per completed batch:
+
+    <root>/<batch_id>/record.json   model config, engine, stage timings (seconds) and objective of the original solve
+    <root>/<batch_id>/orderset/     the batch's OrderSet (see `ffengine.data.storage`)
+    <root>/<batch_id>/matchset/     the published MatchSet
+
+Replay a recorded batch through any Engine with:
+
+    python -m ffengine.replay <root> [--batch ID ...] [--engine OMMEngine | module:Class] [--profile OUTDIR [--profile-mode sample] [--profile-memory]]
+'''
+import argparse
+import importlib
+import json
+import os
+import time
+from datetime import datetime
+from typing import Dict, List, Optional
+
+from ffengine.data import OrderSet, MatchSet
+from ffengine.data.storage import save_orderset, load_orderset, save_matchset, load_matchset
+from ffengine.optim._utils import distance
+from ffengine.profiling import StageProfiler, run_stage, STAGES
+
+RECORD_FILE = "record.json"
+
+
+def matchset_objective(matchset: MatchSet, unit_tcost: float) -> float:
+    '''seller profit of a MatchSet, i.e. the objective of `OrderMatchingModel` evaluated at the matches'''
+    return sum(
+        m.quantity * m.price_cents - distance((m.buy_order.lat, m.buy_order.long), (m.sell_order.lat, m.sell_order.long)) * unit_tcost
+        for m in matchset.iter_matches()
+    )
+
+
+def resolve_engine(name: str):
+    '''`OMMEngine` -> ffengine.optim.engines.OMMEngine, `package.module:Class` -> Class'''
+    if ":" in name:
+        module, cls = name.split(":", 1)
+    else:
+        module, cls = "ffengine.optim.engines", name
+    return getattr(importlib.import_module(module), cls)
+
+
+def batch_dir(root: str, batch_id) -> str:
+    '''the recording directory of a batch: path separators in its id are replaced, as in the profiler's and the
+    checkpoint's file names, so that every batch stays under `root`'''
+    name = str(batch_id).replace(os.sep, "_")
+    if os.altsep:
+        name = name.replace(os.altsep, "_")
+    if name in ("", os.curdir, os.pardir):
+        raise ValueError(f"batch id {batch_id!r} cannot name a recording directory")
+    return os.path.join(root, name)
+
+
+class BatchRecorder:
+    '''Writes completed batches to `root` so they can be replayed with `replay_batch`'''
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(root, exist_ok=True)
+
+    def record(self, batch_id: str, orderset: OrderSet, model_config: dict, timings: Dict[str, float],
+               matchset: Optional[MatchSet] = None, objective: Optional[float] = None, engine: str = "OMMEngine") -> str:
+        path = batch_dir(self.root, batch_id)
+        os.makedirs(path, exist_ok=True)
+
+        save_orderset(orderset, os.path.join(path, "orderset"))
+        if matchset is not None:
+            save_matchset(matchset, os.path.join(path, "matchset"))
+
+        with open(os.path.join(path, RECORD_FILE), "w") as f:
+            json.dump({
+                "batch_id": str(batch_id),
+                "recorded_at": int(datetime.utcnow().timestamp()),
+                "engine": engine,
+                "model_config": model_config,
+                "timings": timings,
+                "objective": objective,
+                "n_orders": len(orderset),
+                "n_matches": None if matchset is None else matchset.n_matches,
+            }, f, indent=2)
+
+        return path
+
+
+def list_batches(root: str) -> List[str]:
+    return sorted(b for b in os.listdir(root) if os.path.isfile(os.path.join(root, b, RECORD_FILE)))
+
+
+def load_batch(root: str, batch_id: str) -> dict:
+    '''returns the batch record with its `orderset` (memory mapped) and `matchset` (if recorded) loaded'''
+    path = batch_dir(root, batch_id)
+    with open(os.path.join(path, RECORD_FILE)) as f:
+        record = json.load(f)
+
+    record["orderset"] = load_orderset(os.path.join(path, "orderset"))
+    record["matchset"] = load_matchset(os.path.join(path, "matchset"), record["orderset"]) if os.path.isdir(os.path.join(path, "matchset")) else None
+    return record
+
+
+def replay_batch(root: str, batch_id: str, engine: str = None, profile_dir: str = None, profile_mode: str = "cprofile", profile_memory: bool = False) -> dict:
+    '''re-run a recorded batch through `engine` (defaults to the recorded one), timing every stage.
+    With `profile_dir` each stage is profiled (see `ffengine.profiling.StageProfiler`), e.g. with cProfile to
+    <profile_dir>/<batch_id>.<stage>.prof'''
+    record = load_batch(root, batch_id)
+    engine_cls = resolve_engine(engine or record["engine"])
+    profiler = StageProfiler(profile_dir, mode=profile_mode, memory=profile_memory) if profile_dir else None
+
+    timings = {}
+    start = time.perf_counter()
+    matcher = engine_cls(record["orderset"], **record["model_config"])
+    timings["setup"] = time.perf_counter() - start
+
+    result = None
+    for stage in STAGES:
+        start = time.perf_counter()
+        result = run_stage(profiler, batch_id, stage, getattr(matcher, stage))
+        timings[stage] = time.perf_counter() - start
+
+    timings["total"] = sum(timings.values())
+
+    return {
+        "batch_id": batch_id,
+        "engine": engine_cls.__name__,
+        "timings": timings,
+        "objective": matchset_objective(result, record["model_config"].get("unit_tcost", 0)),
+        "n_matches": result.n_matches,
+        "original": {k: record[k] for k in ("engine", "timings", "objective", "n_matches")},
+    }
+
+
+def format_comparison(result: dict) -> str:
+    original = result["original"]
+    lines = [f"batch {result['batch_id']}: {original['engine']} (recorded) vs {result['engine']} (replay)"]
+
+    for stage in STAGES + ("total",):
+        before, after = original["timings"].get(stage), result["timings"].get(stage)
+        ratio = f"x{after / before:.2f}" if before else ""
+        lines.append(f"  {stage:<18}{'-' if before is None else f'{before:.4f}s':>12}{after:>11.4f}s {ratio}")
+
+    objective = '-' if original['objective'] is None else f"{original['objective']:.2f}"
+    lines.append(f"  {'objective':<18}{objective:>12}{result['objective']:>12.2f}")
+    lines.append(f"  {'matches':<18}{str(original['n_matches']):>12}{result['n_matches']:>12}")
+    return "\n".join(lines)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m ffengine.replay", description="re-run recorded matching batches")
+    parser.add_argument("root", help="recording directory (MatchingEngineService.RECORD_DIR)")
+    parser.add_argument("--batch", action="append", help="batch id to replay (repeatable), defaults to all recorded batches")
+    parser.add_argument("--engine", default=None, help="engine class name in ffengine.optim.engines or module:Class, defaults to the recorded engine")
+    parser.add_argument("--profile", default=None, metavar="OUTDIR", help="dump a profile of every stage to OUTDIR")
+    parser.add_argument("--profile-mode", default="cprofile", choices=["cprofile", "sample"], help="cProfile or the low overhead sampling profiler")
+    parser.add_argument("--profile-memory", action="store_true", help="also trace allocations with tracemalloc")
+    parser.add_argument("--json", action="store_true", help="print results as json lines")
+    args = parser.parse_args(argv)
+
+    for batch_id in (args.batch or list_batches(args.root)):
+        result = replay_batch(args.root, batch_id, engine=args.engine, profile_dir=args.profile, profile_mode=args.profile_mode, profile_memory=args.profile_memory)
+        print(json.dumps(result) if args.json else format_comparison(result))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,2 +1,3 @@
 from ._paramgen import TestCase
-from ._metrics import TestCaseMetrics
\ No newline at end of file
+from ._metrics import TestCaseMetrics
+from ._market import MarketSimulation, SimulationReport, RoundStats
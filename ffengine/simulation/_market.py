@@ -0,0 +1,269 @@
+import heapq
+import time
+from dataclasses import dataclass, asdict
+from datetime import datetime
+from typing import Callable, Dict, List, Tuple
+
+import numpy as np
+
+from ffengine.data.book import OrderBook
+from ffengine.data.orders import BuyOrder, SellOrder
+from ffengine.optim.engines import Engine, IncrementalOMMEngine
+from ffengine.profiling import StageProfiler
+
+import ffengine.simulation._utils as utils
+
+# event kinds, in the order events at the same time are handled: orders arriving at the round's time make it in
+ARRIVAL, ROUND = 0, 1
+
+
+@dataclass
+class RoundStats:
+    round: int
+    time: int
+    arrived_buy: int
+    arrived_sell: int
+    expired_buy: int
+    expired_sell: int
+    book_buy: int # orders in the book when the engine ran
+    book_sell: int
+    n_matches: int
+    filled_buy: int # buy orders filled (all or nothing) this round
+    matched_quantity: int
+    demanded_quantity: int # of the buy orders in the book
+    latency_s: float # the engine's construct_params + match + get_matches
+    objective: float = None
+
+    @property
+    def throughput(self) -> float:
+        '''book orders per second of engine time'''
+        return (self.book_buy + self.book_sell) / self.latency_s if self.latency_s > 0 else 0.
+
+    @property
+    def fill_rate(self) -> float:
+        '''share of the book's buy orders filled this round'''
+        return self.filled_buy / self.book_buy if self.book_buy else 0.
+
+
+class SimulationReport:
+    '''per round `RoundStats` of a `MarketSimulation.run`, with totals in `summary`'''
+
+    def __init__(self, engine: str, rounds: List[RoundStats]):
+        self.engine = engine
+        self.rounds = rounds
+
+    def summary(self) -> dict:
+        rounds = self.rounds
+        latencies = np.array([r.latency_s for r in rounds]) if rounds else np.zeros(1)
+        total = lambda attr: sum(getattr(r, attr) for r in rounds)
+        arrived_buy, filled_buy = total("arrived_buy"), total("filled_buy")
+        book_orders = total("book_buy") + total("book_sell")
+        return {
+            "engine": self.engine,
+            "rounds": len(rounds),
+            "arrived_buy": arrived_buy,
+            "arrived_sell": total("arrived_sell"),
+            "filled_buy": filled_buy,
+            "expired_buy": total("expired_buy"),
+            "expired_sell": total("expired_sell"),
+            # of the buy orders that arrived, over the whole run (orders still in the book count as unfilled)
+            "buy_fill_rate": filled_buy / arrived_buy if arrived_buy else 0.,
+            "mean_book_orders": float(np.mean([r.book_buy + r.book_sell for r in rounds])) if rounds else 0.,
+            "latency_mean_s": float(latencies.mean()),
+            "latency_p50_s": float(np.percentile(latencies, 50)),
+            "latency_p95_s": float(np.percentile(latencies, 95)),
+            "latency_max_s": float(latencies.max()),
+            "throughput": book_orders / latencies.sum() if latencies.sum() > 0 else 0., # book orders per second of engine time
+        }
+
+    def to_records(self) -> List[dict]:
+        return [{**asdict(r), "throughput": r.throughput, "fill_rate": r.fill_rate} for r in self.rounds]
+
+    def format(self) -> str:
+        lines = [f"{'round':>5} {'arrived':>9} {'expired':>9} {'book':>9} {'matches':>7} {'fill':>6} {'latency':>9} {'orders/s':>9}"]
+        for r in self.rounds:
+            lines.append(
+                f"{r.round:>5} {r.arrived_buy:>4}/{r.arrived_sell:<4} {r.expired_buy:>4}/{r.expired_sell:<4} {r.book_buy:>4}/{r.book_sell:<4} "
+                f"{r.n_matches:>7} {r.fill_rate:>6.1%} {r.latency_s * 1e3:>7.1f}ms {r.throughput:>9.0f}"
+            )
+        s = self.summary()
+        lines.append(
+            f"{self.engine}: {s['rounds']} rounds, buy fill rate {s['buy_fill_rate']:.1%} ({s['expired_buy']} buy orders expired), "
+            f"latency p50 {s['latency_p50_s'] * 1e3:.1f}ms p95 {s['latency_p95_s'] * 1e3:.1f}ms, {s['throughput']:.0f} orders/s"
+        )
+        return "\n".join(lines)
+
+
+class MarketSimulation:
+    '''
+    Discrete-event simulation of a market over many matching rounds, on the distributions of `TestCase`.
+
+    The agents (size_I sellers, size_J buyers) are drawn once like `TestCase`'s: a capacity parameter from D_scap_p /
+    D_dcap_p, a capacity from s_bounds / d_bounds, a location within dist_bounds and, for sellers, a subset of
+    s_subsize products. Orders then arrive as Poisson processes of `buy_rate` and `sell_rate` orders per second: each
+    arrival picks an agent uniformly and a product from Q_K (sellers: among their products), its quantity is the
+    agent's expected share of that product, its price from lb_fn / ub_fn and P_K as in `TestCase`, and it stays
+    active for a window drawn uniformly from `window_bounds` seconds.
+
+    Every `round_seconds` the book (an `OrderBook`) drops expired orders and the engine matches what is left;
+    matched orders leave the book (sell orders keep their remaining quantity), the rest carries over.
+
+    Q_K, P_K, D_scap_p, D_dcap_p, s_bounds, d_bounds, s_subsize, lb_fn, ub_fn, dist_bounds, unit_tcost - see `TestCase`
+    buy_rate, sell_rate - mean arrivals per second
+    round_seconds - time between two matching rounds
+    window_bounds - (min, max) seconds between an order's activation and its expiry
+    service_range - of the sell orders, in km
+    start_time - time of the first arrival, defaults to now
+    '''
+
+    def __init__(
+        self,
+        size_I: int,
+        size_J: int,
+        size_K: int,
+        Q_K: Dict[int, float],
+        P_K: Dict[int, int],
+        D_scap_p: Dict[int, float],
+        D_dcap_p: Dict[int, float],
+        s_bounds: Callable[[int], Tuple[int, int]],
+        d_bounds: Callable[[int], Tuple[int, int]],
+        s_subsize: Dict[int, int],
+        lb_fn: Callable[[int, int], int],
+        ub_fn: Callable[[int, int], int],
+        dist_bounds: Tuple[float, float],
+        unit_tcost: int,
+        buy_rate: float = 1.,
+        sell_rate: float = 1.,
+        round_seconds: int = 60,
+        window_bounds: Tuple[int, int] = (60, 600),
+        service_range: float = 100,
+        start_time: int = None,
+        random_seed: int = 0
+    ):
+        assert len(Q_K) == size_K, f'Q_K does not have {size_K} elements according to parameter `size_K`'
+        assert len(P_K) == size_K, f'P_K does not have {size_K} elements according to parameter `size_K`'
+        assert utils.non_zero(P_K), f'P_K has negative or 0 prices'
+        assert np.all([i <= size_K for i in s_subsize.values()]), f'subset size for a seller cannot be larger than `size_K`: {size_K}'
+        assert dist_bounds[0] >=0 and dist_bounds[1] >=0, f'cannot have negative distances. Must be (+,+)'
+        assert buy_rate > 0 and sell_rate > 0, 'arrival rates must be positive'
+        assert 0 < window_bounds[0] <= window_bounds[1], 'window bounds must be (min, max) with 0 < min <= max'
+
+        self.rng = np.random.default_rng(random_seed)
+        self.model_constants = {"unit_tcost": unit_tcost}
+        self.P_K, self.lb_fn, self.ub_fn = P_K, lb_fn, ub_fn
+        self.rates = {"buy": buy_rate, "sell": sell_rate}
+        self.round_seconds = round_seconds
+        self.window_bounds = window_bounds
+        self.service_range = service_range
+        self.start_time = start_time if start_time is not None else int(datetime.utcnow().timestamp())
+
+        rng = self.rng
+        sample = lambda pmf: list(pmf)[rng.choice(len(pmf), p=list(pmf.values()))]
+        dist_bounds_radius = dist_bounds[0] / 2, dist_bounds[1] / 2 # sampling is done using a radius, max distance is a diameter
+        locate = lambda: (utils.arcconvert(rng.uniform(*dist_bounds_radius)), rng.uniform(-180, 180))
+
+        # agents: capacity, location and the pmf of the products they order
+        self.sellers = []
+        for i in range(size_I):
+            theta = sample(D_scap_p)
+            products = rng.choice(list(Q_K), size=s_subsize[theta], replace=False)
+            self.sellers.append({"capacity": rng.uniform(*s_bounds(theta)), "location": locate(), "products": utils.dist_subset(Q_K, keys=products)})
+        self.buyers = []
+        for j in range(size_J):
+            theta = sample(D_dcap_p)
+            self.buyers.append({"capacity": rng.uniform(*d_bounds(theta)), "location": locate(), "products": dict(Q_K)})
+
+        self._sample = sample
+        self._next_order = {"buy": 0, "sell": 0}
+
+    def _new_order(self, side: str, t: int):
+        agents = self.buyers if side == "buy" else self.sellers
+        agent_id = int(self.rng.integers(len(agents)))
+        agent = agents[agent_id]
+        k = self._sample({k: p for k, p in agent["products"].items() if p > 0})
+
+        quantity = max(1, int(round(agent["capacity"] * agent["products"][k])))
+        window = int(self.rng.integers(self.window_bounds[0], self.window_bounds[1] + 1))
+        order_no = self._next_order[side]
+        self._next_order[side] += 1
+
+        lat, long = agent["location"]
+        if side == "buy":
+            return BuyOrder(
+                order_id=f'BuyOrder-{order_no}', buyer_id=f'Buyer-{agent_id}', product_id=f'Product-{k}',
+                max_price_cents=int(self.ub_fn(agent["capacity"], self.P_K[k])), quantity=quantity,
+                time_activation=t, time_expiry=t + window, lat=lat, long=long,
+            )
+        return SellOrder(
+            order_id=f'SellOrder-{order_no}', seller_id=f'Seller-{agent_id}', product_id=f'Product-{k}',
+            min_price_cents=int(self.lb_fn(agent["capacity"], self.P_K[k])), quantity=quantity,
+            time_activation=t, time_expiry=t + window, service_range=self.service_range, lat=lat, long=long,
+        )
+
+    def events(self, n_rounds: int):
+        '''(time, kind, side) in time order: Poisson arrivals of both sides and the n_rounds matching rounds'''
+        end = self.start_time + n_rounds * self.round_seconds
+        queue = [(self.start_time + (r + 1) * self.round_seconds, ROUND, None) for r in range(n_rounds)]
+        for side, rate in self.rates.items():
+            queue.append((self.start_time + self.rng.exponential(1 / rate), ARRIVAL, side))
+        heapq.heapify(queue)
+
+        while queue:
+            t, kind, side = heapq.heappop(queue)
+            if kind == ARRIVAL:
+                if t > end:
+                    continue
+                # the next arrival of this side, interarrival times are exponential
+                heapq.heappush(queue, (t + self.rng.exponential(1 / self.rates[side]), ARRIVAL, side))
+            yield t, kind, side
+
+    def run(self, engine: Engine, n_rounds: int = 10, profiler: StageProfiler = None, log=None) -> SimulationReport:
+        '''simulate `n_rounds` rounds matched by `engine` (an Engine class). IncrementalOMMEngine lives across the
+        rounds on the book itself, any other engine is built every round on a snapshot of the book.
+        `log`: called with every round's RoundStats, e.g. to print progress'''
+        book = OrderBook()
+        persistent = engine(book, **self.model_constants) if issubclass(engine, IncrementalOMMEngine) else None
+        rounds, arrived = [], {"buy": 0, "sell": 0}
+
+        try:
+            for t, kind, side in self.events(n_rounds):
+                if kind == ARRIVAL:
+                    order = self._new_order(side, int(t))
+                    book.add_buy_order(order) if side == "buy" else book.add_sell_order(order)
+                    arrived[side] += 1
+                    continue
+
+                t = int(t)
+                expired = book.expire(t)
+                n_expired_buy = sum(isinstance(o, BuyOrder) for o in expired)
+                stats = RoundStats(
+                    round=len(rounds), time=t, arrived_buy=arrived["buy"], arrived_sell=arrived["sell"],
+                    expired_buy=n_expired_buy, expired_sell=len(expired) - n_expired_buy,
+                    book_buy=book.n_buy_orders, book_sell=book.n_sell_orders,
+                    n_matches=0, filled_buy=0, matched_quantity=0,
+                    demanded_quantity=sum(u.quantity for u in book.iter_buy_orders()), latency_s=0.,
+                )
+                arrived = {"buy": 0, "sell": 0}
+
+                # nothing to match with one side empty, the book's change log waits for the next round
+                if book.n_buy_orders and book.n_sell_orders:
+                    batch_id = f"sim-round-{stats.round}"
+                    start = time.perf_counter()
+                    matcher = persistent or engine(book.to_orderset(), **self.model_constants)
+                    matches = matcher.run(batch_id=batch_id, profiler=profiler)
+                    stats.latency_s = time.perf_counter() - start
+                    stats.objective = getattr(matcher, "objective", None)
+
+                    stats.n_matches = matches.n_matches
+                    stats.matched_quantity = sum(m.quantity for m in matches.iter_matches())
+                    stats.filled_buy = len({m.buy_order.order_id for m in matches.iter_matches()})
+                    book.apply_matches(matches)
+
+                rounds.append(stats)
+                if log is not None:
+                    log(stats)
+        finally:
+            if persistent is not None:
+                persistent.close()
+
+        return SimulationReport(engine.__name__, rounds)
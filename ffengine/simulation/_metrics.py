@@ -1,7 +1,6 @@
 from typing import Dict
-import matplotlib.pyplot as plt
-import seaborn as sbn
-import pandas as pd
+
+# matplotlib and pandas are imported on first use: they take seconds to import and a matching worker never plots
 
 #==============================================================================================================
 # Visualization functions
@@ -9,6 +8,9 @@ import pandas as pd
 
 class TestCaseMetrics:
     def __init__(self, named_results: Dict[str, dict]):
+        import matplotlib.pyplot as plt
+        import pandas as pd
+
         self.named_results = named_results
 
         tables = {}
@@ -27,6 +29,8 @@ class TestCaseMetrics:
     
     def surplus_plot(self, agent: str):
 
+        import matplotlib.pyplot as plt
+
         assert agent in ['Buyer', 'Seller'], "agent must be buyer or seller"
 
         data = self.tables[agent + '-Surplus']
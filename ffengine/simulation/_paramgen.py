@@ -1,9 +1,9 @@
 import numpy as np
-import gurobipy as gp
 from typing import Dict, Callable, Tuple, Iterable
 from datetime import datetime
 
-from ffengine.optim.engines import Engine, OMMEngine
+from ffengine.optim.engines import Engine
+from ffengine.profiling import StageProfiler
 
 import ffengine.simulation._utils as utils
 
@@ -192,13 +192,12 @@ class TestCase:
         self.order_set = tempOrderSet
 
     
-    def run(self, engine: Engine):
+    def run(self, engine: Engine, profiler: StageProfiler = None, batch_id: str = "testcase"):
+        # profiler: profile the engine's stages (see `ffengine.profiling`), defaults to FFENGINE_PROFILE
 
         matcher = engine(self.order_set, **self.model_constants)
         
-        matcher.construct_params()
-        matcher.match()
-        matchset = matcher.get_matches()
+        matchset = matcher.run(batch_id=batch_id, profiler=profiler)
 
         ## Build validation metrics
         summary_stats = {
@@ -209,29 +208,17 @@ class TestCase:
             "Matched-Buyers": [],
             "Matched-Sellers": []
         }
-        # instatiate buyer validation metrics
-        for order in self.order_set.iter_buy_orders():
-
-            buyer_id, product_id = order.int_buyer_id, order.int_product_id
-            product_price, product_quantity = order.max_price_cents, order.quantity
-
+        # instatiate buyer/seller validation metrics, agent by agent from the OrderSet's agent index
+        buys, sells = self.order_set.get_buy_columns(), self.order_set.get_sell_columns()
+        for buyer_id in range(self.order_set.n_buyers):
+            ids = self.order_set.get_buy_ids_by_agent(buyer_id)
             summary_stats["Buyer-Surplus"][buyer_id] = 0
-            if not buyer_id in summary_stats['Unmatched-Demand']:
-                summary_stats['Unmatched-Demand'][buyer_id] = {product_id : product_quantity}
-            else:
-                summary_stats['Unmatched-Demand'][buyer_id][product_id] = product_quantity
-
-        # instatiate seller validation metrics
-        for order in self.order_set.iter_sell_orders():
-
-            seller_id, product_id = order.int_seller_id, order.int_product_id
-            product_price, product_quantity = order.min_price_cents, order.quantity
+            summary_stats['Unmatched-Demand'][buyer_id] = dict(zip(buys['int_product_id'][ids].tolist(), buys['quantity'][ids].tolist()))
 
+        for seller_id in range(self.order_set.n_sellers):
+            ids = self.order_set.get_sell_ids_by_agent(seller_id)
             summary_stats["Seller-Surplus"][seller_id] = 0
-            if not seller_id in summary_stats['Unmatched-Supply']:
-                summary_stats['Unmatched-Supply'][seller_id] = {product_id : product_quantity}
-            else:
-                summary_stats['Unmatched-Supply'][seller_id][product_id] = product_quantity
+            summary_stats['Unmatched-Supply'][seller_id] = dict(zip(sells['int_product_id'][ids].tolist(), sells['quantity'][ids].tolist()))
 
         # build validation from matches
         for match in matchset.iter_matches():
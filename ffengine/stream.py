@@ -0,0 +1,256 @@
+'''Match order streams offline: order-created messages in, matches out, both as NDJSON.
+
+Every input line is one message in the shape the matching service consumes (either protocol version, see
+`ffengine.data.messages`). The messages flow through a pipeline of generators: lines are parsed, grouped into their
+batch by `batchId` until the batch has all the orders its totals announce, completed batches are solved on a pool of
+worker processes and their matches are written as they come back, one line per match:
+
+    {"batchId": "...", "matchId": 0, "buyOrder": "...", "sellOrder": "...", "volume": 3, "priceCents": 120.0}
+
+Memory stays bounded whatever the number of batches: at most `--max-open-batches` batches (and `--max-open-orders`
+orders) are being grouped, beyond that the oldest open batch is evicted, and at most `--max-pending` solved batches are
+in flight. Evicted batches, and batches still open at the end of the input, are dropped or solved as they are
+(`--incomplete`), later messages of a closed batch are skipped. Progress and one summary per batch go to stderr.
+
+    python -m ffengine.stream [FILE ...] [--out matches.ndjson] [--engine OMMEngine | module:Class] [--workers N]
+                              [--unit-tcost 300] [--incomplete drop|solve]
+
+FILE defaults to stdin (also `-`), files ending in .gz are decompressed. Without `--engine` every batch gets the
+engine `EnginePlanner` picks for it, as in the service (budgets from MATE_*).
+'''
+import argparse
+import gzip
+import json
+import os
+import sys
+import time
+from collections import OrderedDict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Iterable, Iterator, List, Optional, TextIO, Tuple
+
+from ffengine.data import OrderSet, BuyOrder
+from ffengine.data.messages import parse_orders_message
+
+try:
+    import orjson # optional, several times faster decoding of large batch messages
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+DEFAULT_MODEL_CONFIG = {"unit_tcost": 300} # MatchingEngineService.MODEL_CONFIG
+CLOSED_BATCH_IDS = 100_000 # ids of solved, evicted or dropped batches remembered to skip their late messages
+
+
+def log(*args):
+    print(*args, file=sys.stderr)
+
+
+def read_lines(paths: List[str]) -> Iterator[str]:
+    '''the lines of every file in turn, `-` is stdin'''
+    for path in paths or ["-"]:
+        if path == "-":
+            yield from sys.stdin
+            continue
+        with (gzip.open(path, "rt") if path.endswith(".gz") else open(path)) as f:
+            yield from f
+
+
+def parse_messages(lines: Iterable[str], stats: dict) -> Iterator[Tuple[list, dict]]:
+    '''(orders, batch_info) of every message, malformed lines are reported and skipped'''
+    for n, line in enumerate(lines, 1):
+        if not line.strip():
+            continue
+        try:
+            yield parse_orders_message(_loads(line))
+        except (ValueError, KeyError, TypeError) as e:
+            stats["bad_lines"] += 1
+            log(f"line {n}: skipped, {type(e).__name__}: {e}")
+
+
+class _OpenBatch:
+    def __init__(self):
+        self.orderset = OrderSet()
+        self.totals = {}
+        self.allow_partial_fill = False
+
+    def add(self, orders: list, batch_info: dict, stats: dict):
+        self.totals.update(batch_info["totalOrders"])
+        self.allow_partial_fill |= batch_info["allowPartialFill"]
+        for _, order in orders:
+            try:
+                if isinstance(order, BuyOrder):
+                    self.orderset.add_buy_order(order)
+                else:
+                    self.orderset.add_sell_order(order)
+            except ValueError as e:
+                stats["duplicates"] += 1
+                log(e)
+
+    @property
+    def complete(self) -> bool:
+        '''every order the totals announce arrived, like the service decides it'''
+        return (
+            self.totals.get("buyOrder.created") == self.orderset.n_buy_orders and
+            self.totals.get("sellOrder.created") == self.orderset.n_sell_orders
+        )
+
+
+def group_batches(messages: Iterable[Tuple[list, dict]], stats: dict, max_open_batches: int = 64, max_open_orders: int = 1_000_000,
+                  incomplete: str = "drop") -> Iterator[Tuple[str, OrderSet, bool, bool]]:
+    '''(batch id, OrderSet, allow partial fill, complete) of every batch once all its orders arrived. Open batches are
+    kept in arrival order, the oldest is evicted when there are more than `max_open_batches` or more than
+    `max_open_orders` orders in them; evicted and leftover batches are yielded incomplete or dropped (`incomplete`).
+    Messages of a batch closed before (among the last CLOSED_BATCH_IDS) are skipped rather than opening it again'''
+    open_batches = {} # batch id -> _OpenBatch, oldest first
+    closed = OrderedDict() # batch id -> None, oldest first
+    n_open_orders = 0
+
+    def close(batch_id, complete):
+        nonlocal n_open_orders
+        batch = open_batches.pop(batch_id)
+        n_open_orders -= len(batch.orderset)
+        closed[batch_id] = None
+        if len(closed) > CLOSED_BATCH_IDS:
+            closed.popitem(last=False)
+        if complete:
+            stats["complete"] += 1
+        else:
+            stats["incomplete"] += 1
+            log(f"batch {batch_id}: incomplete ({batch.orderset.n_buy_orders} buy, {batch.orderset.n_sell_orders} sell orders "
+                f"of {batch.totals}), {'solving it as is' if incomplete == 'solve' else 'dropped'}")
+            if incomplete != "solve":
+                return None
+        return batch_id, batch.orderset, batch.allow_partial_fill, complete
+
+    for orders, batch_info in messages:
+        batch_id = batch_info["batchId"]
+        if batch_id in closed:
+            stats["late"] += len(orders)
+            continue
+        batch = open_batches.get(batch_id)
+        if batch is None:
+            batch = open_batches[batch_id] = _OpenBatch()
+
+        size = len(batch.orderset)
+        batch.add(orders, batch_info, stats)
+        n_open_orders += len(batch.orderset) - size
+
+        if batch.complete:
+            yield close(batch_id, True)
+
+        while open_batches and (len(open_batches) > max_open_batches or n_open_orders > max_open_orders):
+            evicted = close(next(iter(open_batches)), False)
+            if evicted is not None:
+                yield evicted
+
+    for batch_id in list(open_batches):
+        leftover = close(batch_id, False)
+        if leftover is not None:
+            yield leftover
+
+
+def solve_batch(task) -> dict:
+    '''worker: one batch through `engine` (a name for `ffengine.replay.resolve_engine`) or the planner's engine'''
+    batch_id, orderset, allow_partial_fill, complete, engine, model_config = task
+    from ffengine.optim import EnginePlanner
+    from ffengine.replay import resolve_engine
+
+    result = {"batchId": batch_id, "complete": complete, "n_buy": orderset.n_buy_orders, "n_sell": orderset.n_sell_orders,
+              "engine": None, "objective": None, "n_matches": 0, "matches": []}
+    if not (orderset.n_buy_orders and orderset.n_sell_orders):
+        return result # nothing to match
+
+    start = time.perf_counter()
+    try:
+        if engine is not None:
+            matcher = resolve_engine(engine)(orderset, **model_config)
+        else:
+            planner = EnginePlanner.from_env()
+            matcher = planner.make_engine(planner.plan(orderset, allow_partial_fill=allow_partial_fill), orderset, **model_config)
+        matcher.construct_params()
+        matcher.match()
+        matches = matcher.get_matches()
+    except Exception as e:
+        return {**result, "error": f"{type(e).__name__}: {e}"}
+
+    return {**result, "engine": type(matcher).__name__, "objective": matcher.objective, "n_matches": matches.n_matches,
+            "seconds": time.perf_counter() - start, "matches": matches.to_records()}
+
+
+def solve_batches(batches: Iterable[tuple], engine: Optional[str] = None, model_config: dict = None, workers: int = None,
+                  max_pending: int = None) -> Iterator[dict]:
+    '''`solve_batch` results in the order the batches completed. `workers=0` solves in this process, otherwise a
+    process pool solves up to `max_pending` (default twice the workers) batches at once'''
+    model_config = model_config or DEFAULT_MODEL_CONFIG
+    tasks = ((*batch, engine, model_config) for batch in batches if batch is not None)
+
+    if workers == 0:
+        yield from map(solve_batch, tasks)
+        return
+
+    with ProcessPoolExecutor(max_workers=workers) as executor:
+        max_pending = max_pending or 2 * executor._max_workers
+        pending = deque()
+        for task in tasks:
+            pending.append(executor.submit(solve_batch, task))
+            if len(pending) >= max_pending:
+                yield pending.popleft().result()
+        while pending:
+            yield pending.popleft().result()
+
+
+def write_matches(results: Iterable[dict], out: TextIO, stats: dict):
+    '''one NDJSON line per match, one summary per batch on stderr'''
+    for result in results:
+        batch_id = result["batchId"]
+        for record in result["matches"]:
+            out.write(json.dumps({"batchId": batch_id, **record}) + "\n")
+        out.flush()
+
+        stats["matches"] += result["n_matches"]
+        if "error" in result:
+            stats["errors"] += 1
+            log(f"batch {batch_id}: failed, {result['error']}")
+        elif result["engine"] is None:
+            log(f"batch {batch_id}: nothing to match ({result['n_buy']} buy, {result['n_sell']} sell orders)")
+        else:
+            objective = f"{result['objective']:.2f}" if result["objective"] is not None else "-"
+            log(f"batch {batch_id}: {result['n_matches']} matches of {result['n_buy']} buy and {result['n_sell']} sell orders, "
+                f"{result['engine']} in {result['seconds']:.2f}s, objective {objective}")
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m ffengine.stream", description="match NDJSON order-created messages, write the matches as NDJSON")
+    parser.add_argument("files", nargs="*", help="NDJSON message files (.gz ok), defaults to stdin")
+    parser.add_argument("--out", default="-", help="matches file, defaults to stdout")
+    parser.add_argument("--engine", default=None, help="engine class name in ffengine.optim.engines or module:Class, defaults to the planner's pick")
+    parser.add_argument("--unit-tcost", type=float, default=DEFAULT_MODEL_CONFIG["unit_tcost"])
+    parser.add_argument("--workers", type=int, default=None, help="solver processes, 0 solves in this process")
+    parser.add_argument("--max-pending", type=int, default=None, help="batches being solved at once, defaults to twice the workers")
+    parser.add_argument("--max-open-batches", type=int, default=64, help="batches being grouped at once")
+    parser.add_argument("--max-open-orders", type=int, default=1_000_000, help="orders in the batches being grouped")
+    parser.add_argument("--incomplete", choices=["drop", "solve"], default="drop", help="what to do with batches that never complete")
+    args = parser.parse_args(argv)
+
+    if args.out == "-":
+        # stdout is reserved for the matches: everything else printed, here, by the workers or by the solver, goes to stderr
+        out = os.fdopen(os.dup(sys.stdout.fileno()), "w")
+        sys.stdout.flush()
+        os.dup2(sys.stderr.fileno(), sys.stdout.fileno())
+    else:
+        out = open(args.out, "w")
+
+    stats = {"bad_lines": 0, "duplicates": 0, "late": 0, "complete": 0, "incomplete": 0, "matches": 0, "errors": 0}
+    start = time.perf_counter()
+    with out:
+        messages = parse_messages(read_lines(args.files), stats)
+        batches = group_batches(messages, stats, args.max_open_batches, args.max_open_orders, args.incomplete)
+        results = solve_batches(batches, args.engine, {"unit_tcost": args.unit_tcost}, args.workers, args.max_pending)
+        write_matches(results, out, stats)
+
+    log(f"done in {time.perf_counter() - start:.1f}s: {stats}")
+    return 1 if stats["errors"] else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
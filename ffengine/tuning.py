@@ -0,0 +1,194 @@
+'''Tune the gurobi parameters of OMMEngine on saved matching instances.
+
+Every instance (a recorded batch, see `ffengine.replay`, or a generated `TestCase`) is solved with every point of a
+grid over the search space, in parallel on worker processes with one solver thread each. Per size class of the dense
+model (number of variables) the parameters with the best shifted geometric mean runtime are kept, counting a run
+that misses the best objective found for its instance (beyond `--tolerance`) or fails as twice the time limit.
+
+    python -m ffengine.tuning --out solver_profile.json [--records ROOT [--batch ID ...]] [--testcases 3 --sizes 4,6,8]
+                              [--space space.json] [--classes 2000,20000,200000] [--workers N] [--time-limit 60]
+
+The profile is loaded by OMMEngine from FFENGINE_SOLVER_PROFILE (see `ffengine.optim.SolverProfile`).
+'''
+import argparse
+import itertools
+import json
+import math
+import time
+from concurrent.futures import ProcessPoolExecutor
+from typing import Dict, List, Optional
+
+from ffengine.data import OrderSet
+from ffengine.optim._tuning import SolverProfile
+
+# parameter -> values, the grid is their product (72 points)
+DEFAULT_SPACE = {
+    "MIPFocus": [0, 1, 2],
+    "Heuristics": [0.05, 0.2],
+    "Presolve": [-1, 2],
+    "Cuts": [-1, 0, 2],
+    "MIPGap": [1e-4, 1e-3],
+}
+# upper bounds (variables of the dense model) of the size classes, a last unbounded class is always added
+DEFAULT_CLASSES = [2000, 20000, 200000]
+SHIFT_SECONDS = 0.01 # shift of the geometric mean, so that instances solved in no time do not dominate
+
+
+def instance_vars(orderset: OrderSet) -> int:
+    return 2 * orderset.n_buy_orders * orderset.n_sell_orders + orderset.n_buy_orders
+
+
+def recorded_instances(root: str, batch_ids: List[str] = None) -> List[dict]:
+    from ffengine.replay import list_batches, load_batch
+
+    instances = []
+    for batch_id in (batch_ids or list_batches(root)):
+        record = load_batch(root, batch_id)
+        instances.append({"name": f"record:{batch_id}", "orderset": record["orderset"], "model_config": record["model_config"]})
+    return instances
+
+
+def testcase_instances(sizes: List[int], seeds: int, n_products: int = 3) -> List[dict]:
+    '''TestCases of `size` buyers and sellers, as in the benchmarks under tests/'''
+    from ffengine.simulation import TestCase
+
+    instances = []
+    for size, seed in itertools.product(sizes, range(seeds)):
+        I, K = list(range(size)), list(range(n_products))
+        testcase = TestCase(
+            size_I=size, size_J=size, size_K=n_products,
+            Q_K={k: 1/n_products for k in K}, P_K={k: [5, 2, 1][k % 3] for k in K},
+            D_scap_p={0: .7, 1: .3}, D_dcap_p={0: 1},
+            s_bounds=lambda c: (1,10) if c == 0 else (10, 20),
+            d_bounds=lambda c: (3, 7),
+            s_subsize={i: n_products for i in I},
+            lb_fn= lambda k, i: i - int(i > 1),
+            ub_fn= lambda c, p: p + 1,
+            dist_bounds= (3, 10),
+            unit_tcost=1,
+            random_seed=seed
+        )
+        instances.append({"name": f"testcase:{size}x{size}:{seed}", "orderset": testcase.order_set, "model_config": testcase.model_constants})
+    return instances
+
+
+def grid(space: Dict[str, list]) -> List[dict]:
+    '''every combination of the space's values, gurobi defaults ({}) first as the baseline'''
+    names = sorted(space)
+    points = [dict(zip(names, values)) for values in itertools.product(*(space[n] for n in names))]
+    return [{}] + [p for p in points if p]
+
+
+def solve_instance(task) -> dict:
+    '''worker: one instance with one parameter setting, single threaded'''
+    name, orderset, model_config, params, time_limit = task
+    from ffengine.optim.engines import OMMEngine
+
+    solver_params = {"OutputFlag": 0, **params, "Threads": 1, **({"TimeLimit": time_limit} if time_limit else {})}
+    matcher = OMMEngine(orderset, solver_params=solver_params, **model_config)
+    start = time.perf_counter()
+    try:
+        matcher.construct_params()
+        matcher.match()
+        return {"instance": name, "params": params, "objective": matcher.objective, "runtime": matcher.runtime, "wall": time.perf_counter() - start}
+    except Exception as e:
+        # e.g. no solution within the time limit
+        return {"instance": name, "params": params, "objective": None, "runtime": None, "error": str(e)}
+
+
+def shifted_geomean(values: List[float]) -> float:
+    return math.exp(sum(math.log(v + SHIFT_SECONDS) for v in values) / len(values)) - SHIFT_SECONDS
+
+
+def select(results: List[dict], time_limit: Optional[float], tolerance: float) -> dict:
+    '''best parameters of one size class: {"params", "score", "baseline_score", "n_instances"}'''
+    best_objective = {}
+    for r in results:
+        if r["objective"] is not None:
+            best_objective[r["instance"]] = max(best_objective.get(r["instance"], -math.inf), r["objective"])
+
+    worst = max((r["runtime"] for r in results if r["runtime"] is not None), default=1.)
+    penalty = 2 * (time_limit or worst)
+
+    by_params = {}
+    for r in results:
+        best = best_objective.get(r["instance"])
+        solved = r["objective"] is not None and r["objective"] >= best - tolerance * max(abs(best), 1.)
+        by_params.setdefault(json.dumps(r["params"], sort_keys=True), []).append(r["runtime"] if solved else penalty)
+
+    scores = {params: shifted_geomean(runtimes) for params, runtimes in by_params.items()}
+    best_params = min(scores, key=lambda p: (scores[p], p != "{}")) # ties go to the defaults
+    return {
+        "params": json.loads(best_params),
+        "score": scores[best_params],
+        "baseline_score": scores.get("{}"),
+        "n_instances": len(best_objective),
+    }
+
+
+def tune(instances: List[dict], space: Dict[str, list] = None, classes: List[int] = None, max_workers: int = None,
+         time_limit: float = None, tolerance: float = 1e-4, log=print) -> SolverProfile:
+    '''solve every instance with every grid point of `space` and keep the best parameters per size class'''
+    points = grid(space or DEFAULT_SPACE)
+    bounds = sorted(classes or DEFAULT_CLASSES) + [None]
+    class_of = lambda n_vars: next(i for i, b in enumerate(bounds) if b is None or n_vars <= b)
+
+    tasks = [(inst["name"], inst["orderset"], inst["model_config"], params, time_limit) for inst in instances for params in points]
+    log(f"{len(instances)} instances x {len(points)} parameter settings = {len(tasks)} solves")
+
+    start = time.perf_counter()
+    with ProcessPoolExecutor(max_workers=max_workers) as executor:
+        results = list(executor.map(solve_instance, tasks))
+    log(f"solved in {time.perf_counter() - start:.1f}s, {sum('error' in r for r in results)} failed")
+
+    n_vars = {inst["name"]: instance_vars(inst["orderset"]) for inst in instances}
+    size_classes, previous = [], {}
+    for i, bound in enumerate(bounds):
+        class_results = [r for r in results if class_of(n_vars[r["instance"]]) == i]
+        if class_results:
+            stats = select(class_results, time_limit, tolerance)
+            previous = stats["params"]
+            params = stats.pop("params")
+        else:
+            # no instance of this size: the next smaller class's parameters
+            params, stats = previous, {"inherited": True}
+        size_classes.append({"max_vars": bound, "params": params, "stats": stats})
+        log(f"  <= {bound if bound is not None else 'inf':>8} vars: {params or 'defaults'} {stats}")
+
+    return SolverProfile(size_classes)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="python -m ffengine.tuning", description="tune OMMEngine's gurobi parameters per instance size")
+    parser.add_argument("--out", required=True, help="solver profile to write (FFENGINE_SOLVER_PROFILE)")
+    parser.add_argument("--records", default=None, help="recording directory of batches to tune on (see ffengine.replay)")
+    parser.add_argument("--batch", action="append", help="recorded batch id (repeatable), defaults to all")
+    parser.add_argument("--testcases", type=int, default=0, help="generated TestCases per size")
+    parser.add_argument("--sizes", default="4,6,8", help="buyers and sellers of the generated TestCases")
+    parser.add_argument("--space", default=None, help="json file {param: [values]}, defaults to DEFAULT_SPACE")
+    parser.add_argument("--classes", default=None, help="size class bounds in variables, e.g. 2000,20000,200000")
+    parser.add_argument("--workers", type=int, default=None)
+    parser.add_argument("--time-limit", type=float, default=None, help="seconds per solve")
+    parser.add_argument("--tolerance", type=float, default=1e-4, help="relative objective loss still counted as solved")
+    args = parser.parse_args(argv)
+
+    instances = []
+    if args.records:
+        instances += recorded_instances(args.records, args.batch)
+    if args.testcases:
+        instances += testcase_instances([int(s) for s in args.sizes.split(",")], args.testcases)
+    assert instances, "no instances: pass --records and/or --testcases"
+
+    space = None
+    if args.space:
+        with open(args.space) as f:
+            space = json.load(f)
+    classes = [int(c) for c in args.classes.split(",")] if args.classes else None
+
+    profile = tune(instances, space, classes, args.workers, args.time_limit, args.tolerance)
+    profile.save(args.out)
+    print(f"wrote {args.out}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,236 @@
+import json
+import logging
+import os
+import queue
+import struct
+import threading
+import time
+import zlib
+from typing import Any, Dict, Iterator, List, Optional, Tuple, Union
+
+from ffengine.data import BuyOrder, SellOrder
+from ._logging import fields
+
+logger = logging.getLogger("mate.checkpoint")
+
+# One append-only log per in-flight batch, <dir>/<batch id>.ckpt:
+#   MAGIC, then records of RECORD_HEADER (kind, payload length, crc32 of the payload) + payload
+#   META   the batch_info of the chunks that follow (json), written when it changes
+#   BUY    buy orders, u32 count then per order the BUY_FIELDS struct and 3 u16 length prefixed utf8 strings
+#   SELL   same with SELL_FIELDS
+# A record cut short by a crash (or with a bad crc) ends the log, the orders before it are restored.
+MAGIC = b"MATECKP1"
+RECORD_HEADER = struct.Struct("<BII")
+META, BUY, SELL = 0, 1, 2
+
+BUY_FIELDS = struct.Struct("<qqqqdd") # max_price_cents, quantity, time_activation, time_expiry, lat, long
+SELL_FIELDS = struct.Struct("<qqqqddd") # min_price_cents, quantity, time_activation, time_expiry, service_range, lat, long
+COUNT = struct.Struct("<I")
+STR_LEN = struct.Struct("<H")
+
+
+def _pack_str(s: str) -> bytes:
+    b = str(s).encode()
+    return STR_LEN.pack(len(b)) + b
+
+def _unpack_str(buf: memoryview, pos: int) -> Tuple[str, int]:
+    n, = STR_LEN.unpack_from(buf, pos)
+    pos += STR_LEN.size
+    return bytes(buf[pos:pos + n]).decode(), pos + n
+
+
+def encode_orders(orders: List[Union[BuyOrder, SellOrder]], kind: int) -> bytes:
+    '''one BUY or SELL record payload, a fixed size struct and three short strings per order'''
+    parts = [COUNT.pack(len(orders))]
+    for o in orders:
+        if kind == BUY:
+            parts.append(BUY_FIELDS.pack(o.max_price_cents, o.quantity, o.time_activation, o.time_expiry, o.lat, o.long))
+            parts += (_pack_str(o.order_id), _pack_str(o.buyer_id), _pack_str(o.product_id))
+        else:
+            parts.append(SELL_FIELDS.pack(o.min_price_cents, o.quantity, o.time_activation, o.time_expiry, o.service_range, o.lat, o.long))
+            parts += (_pack_str(o.order_id), _pack_str(o.seller_id), _pack_str(o.product_id))
+    return b"".join(parts)
+
+
+def decode_orders(payload: bytes, kind: int) -> List[Union[BuyOrder, SellOrder]]:
+    buf = memoryview(payload)
+    n, = COUNT.unpack_from(buf, 0)
+    pos = COUNT.size
+
+    orders = []
+    for _ in range(n):
+        if kind == BUY:
+            price, quantity, activation, expiry, lat, long = BUY_FIELDS.unpack_from(buf, pos)
+            pos += BUY_FIELDS.size
+        else:
+            price, quantity, activation, expiry, service_range, lat, long = SELL_FIELDS.unpack_from(buf, pos)
+            pos += SELL_FIELDS.size
+        order_id, pos = _unpack_str(buf, pos)
+        agent_id, pos = _unpack_str(buf, pos)
+        product_id, pos = _unpack_str(buf, pos)
+
+        if kind == BUY:
+            orders.append(BuyOrder(
+                order_id=order_id, buyer_id=agent_id, product_id=product_id,
+                max_price_cents=price, quantity=quantity, time_activation=activation, time_expiry=expiry, lat=lat, long=long
+            ))
+        else:
+            orders.append(SellOrder(
+                order_id=order_id, seller_id=agent_id, product_id=product_id,
+                min_price_cents=price, quantity=quantity, time_activation=activation, time_expiry=expiry,
+                service_range=service_range, lat=lat, long=long
+            ))
+    return orders
+
+
+def merge_batch_info(batch_info: Optional[dict], update: dict) -> dict:
+    '''batch_info of a batch after one more chunk: v1 messages only announce the total of their own side, so totals
+    accumulate (as the service's processed flags do), and one chunk allowing partial fills is enough'''
+    if batch_info is None:
+        return dict(update)
+    return {
+        **batch_info, **update,
+        "totalOrders": {**batch_info["totalOrders"], **update["totalOrders"]},
+        "allowPartialFill": bool(batch_info.get("allowPartialFill", False) or update.get("allowPartialFill", False)),
+    }
+
+
+def read_log(path: str) -> Tuple[dict, List[Tuple[str, Any]]]:
+    '''(batch_info merged over all its META records, [(order_type, order)]) of one log, up to its first torn or
+    corrupt record'''
+    with open(path, "rb") as f:
+        data = f.read()
+    if not data.startswith(MAGIC):
+        return None, []
+
+    batch_info, orders = None, []
+    pos = len(MAGIC)
+    while pos + RECORD_HEADER.size <= len(data):
+        kind, length, crc = RECORD_HEADER.unpack_from(data, pos)
+        payload = data[pos + RECORD_HEADER.size:pos + RECORD_HEADER.size + length]
+        if len(payload) < length or zlib.crc32(payload) != crc:
+            logger.warning("checkpoint torn, restoring what precedes it", extra=fields(path=path, byte=pos))
+            break
+        pos += RECORD_HEADER.size + length
+
+        if kind == META:
+            batch_info = merge_batch_info(batch_info, json.loads(payload))
+        else:
+            orders += [("buyOrder.created" if kind == BUY else "sellOrder.created", o) for o in decode_orders(payload, kind)]
+
+    return batch_info, orders
+
+
+class BatchCheckpoint:
+    '''Append-only binary logs of the in-flight batches under `root` (format above), written by a background thread.
+
+    `append` and `discard` only queue work, the event loop never touches the disk. The writer encodes each chunk
+    (a fixed size struct and three short strings per order), appends it, and flushes + fsyncs the touched logs every
+    `interval` seconds, so a crash loses at most that much of the stream (the API resends it anyway).
+    `restore` reads the logs back, e.g. on startup.
+    '''
+
+    def __init__(self, root: str, interval: float = 1.0):
+        self.root = root
+        self.interval = interval
+        os.makedirs(root, exist_ok=True)
+
+        self._queue = queue.Queue()
+        self._files = {} # batch id -> open log
+        self._last_info = {} # batch id -> last batch_info written
+        self._dirty = set()
+        self._thread = threading.Thread(target=self._run, name="batch-checkpoint", daemon=True)
+        self._thread.start()
+
+    def _path(self, batch_id: str) -> str:
+        return os.path.join(self.root, f"{str(batch_id).replace(os.sep, '_')}.ckpt")
+
+    def append(self, batch_id: str, batch_info: dict, orders: List[Union[BuyOrder, SellOrder]]):
+        '''queue a chunk of (accepted) orders of `batch_id` for the log'''
+        self._queue.put(("append", batch_id, batch_info, list(orders)))
+
+    def discard(self, batch_id: str):
+        '''queue the removal of a batch's log, once the batch is complete'''
+        self._queue.put(("discard", batch_id))
+
+    def close(self):
+        '''write everything queued so far and stop the writer'''
+        self._queue.put(None)
+        self._thread.join()
+
+    def _run(self):
+        last_sync = time.monotonic()
+        while True:
+            try:
+                item = self._queue.get(timeout=self.interval)
+            except queue.Empty:
+                item = ()
+
+            if item is None:
+                self._sync()
+                for f in self._files.values():
+                    f.close()
+                self._files.clear()
+                return
+
+            try:
+                if item and item[0] == "append":
+                    self._write(*item[1:])
+                elif item:
+                    self._remove(item[1])
+            except Exception as e:
+                # a failing checkpoint must not take ingestion (or the writer) down with it: the chunk is skipped
+                logger.error("checkpoint write failed, chunk skipped", extra=fields(batch_id=item[1], error=repr(e)))
+
+            if time.monotonic() - last_sync >= self.interval:
+                self._sync()
+                last_sync = time.monotonic()
+
+    def _write(self, batch_id: str, batch_info: dict, orders: list):
+        # encoded before the log is touched: a chunk that does not encode leaves no trace in it
+        records = []
+        new_info = self._last_info.get(batch_id) != batch_info
+        if new_info:
+            records.append((META, json.dumps(batch_info).encode()))
+        for kind, cls in ((BUY, BuyOrder), (SELL, SellOrder)):
+            side = [o for o in orders if isinstance(o, cls)]
+            if side:
+                records.append((kind, encode_orders(side, kind)))
+        data = b"".join(RECORD_HEADER.pack(kind, len(payload), zlib.crc32(payload)) + payload for kind, payload in records)
+
+        f = self._files.get(batch_id)
+        if f is None:
+            path = self._path(batch_id)
+            f = self._files[batch_id] = open(path, "ab")
+            if f.tell() == 0:
+                f.write(MAGIC)
+
+        f.write(data)
+        if new_info:
+            self._last_info[batch_id] = batch_info
+        self._dirty.add(batch_id)
+
+    def _remove(self, batch_id: str):
+        f = self._files.pop(batch_id, None)
+        if f is not None:
+            f.close()
+        self._last_info.pop(batch_id, None)
+        self._dirty.discard(batch_id)
+        if os.path.exists(self._path(batch_id)):
+            os.remove(self._path(batch_id))
+
+    def _sync(self):
+        for batch_id in self._dirty:
+            f = self._files[batch_id]
+            f.flush()
+            os.fsync(f.fileno())
+        self._dirty.clear()
+
+    def restore(self) -> Iterator[Tuple[dict, List[Tuple[str, Any]]]]:
+        '''(batch_info, orders as (order_type, order)) of every checkpointed batch, in the chunk format of `handle_orders`'''
+        for name in sorted(os.listdir(self.root)):
+            if not name.endswith(".ckpt"):
+                continue
+            batch_info, orders = read_log(os.path.join(self.root, name))
+            if batch_info is not None:
+                yield batch_info, orders
@@ -0,0 +1,40 @@
+from typing import Dict, List, Tuple
+
+MATCH_DELTA_TYPE = "mate.match.delta"
+
+# A delta message carries the changes of one market's matches since the previous round it published:
+# {"type": "mate.match.delta", "message": {"batchId", "marketId", "totalChanges", "messageSize", "changes": [...]}}
+# every change is a match record (see `MatchSet.to_records`) with an "op":
+#   "new"        the pair (buyOrder, sellOrder) was not matched before
+#   "changed"    the pair was matched before with another volume or price
+#   "cancelled"  the pair is no longer matched, only "buyOrder" and "sellOrder" are set
+# Pairs that are matched with the same volume and price in both rounds are not sent.
+
+
+class PublishedMatches:
+    '''the last match state published for one market, keyed by (buy order id, sell order id)'''
+
+    def __init__(self):
+        self._state: Dict[Tuple[str, str], dict] = {}
+
+    def update(self, records: List[dict]) -> List[dict]:
+        '''make `records` (the new round's matches) the published state, returns the changes to publish. Diff and
+        update happen in one step, so concurrent rounds of a market on the event loop never diff against the same state'''
+        new_state = {(r["buyOrder"], r["sellOrder"]): r for r in records}
+
+        changes = []
+        for key, record in new_state.items():
+            old = self._state.get(key)
+            if old is None:
+                changes.append({"op": "new", **record})
+            elif (old["volume"], old["priceCents"]) != (record["volume"], record["priceCents"]):
+                changes.append({"op": "changed", **record})
+
+        for buy_order, sell_order in self._state.keys() - new_state.keys():
+            changes.append({"op": "cancelled", "buyOrder": buy_order, "sellOrder": sell_order})
+
+        self._state = new_state
+        return changes
+
+    def __len__(self):
+        return len(self._state)
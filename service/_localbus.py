@@ -0,0 +1,65 @@
+import asyncio
+from collections import defaultdict
+from typing import Any, Awaitable, Callable
+
+from ._msgclasses import OrderJson
+from .app import MatchingEngineService, ORDERS_TOPIC
+
+
+class LocalBus:
+    '''In-memory stand-in for the SNS topics/SQS queues the service talks to.
+
+    `publish` has the shape of `tomodachi.aws_sns_sqs_publish`: the message is encoded with the envelope, then every
+    subscriber of the topic gets it on its own task (like concurrent SQS consumers). Subscribers given an envelope
+    receive the parsed keyword arguments (like a tomodachi handler), the others the raw payload.
+    '''
+
+    def __init__(self, envelope=OrderJson):
+        self.envelope = envelope
+        self._subscribers = defaultdict(list) # topic -> [(handler, envelope)]
+        self._pending = set()
+        self.n_published = defaultdict(int)
+
+    def subscribe(self, topic: str, handler: Callable[..., Awaitable], envelope: Any = None):
+        self._subscribers[topic].append((handler, envelope))
+
+    async def publish(self, service: Any, data: Any, topic: str, **kwargs: Any) -> None:
+        payload = await self.envelope.build_message(service, topic, data)
+        self.n_published[topic] += 1
+
+        for handler, envelope in self._subscribers[topic]:
+            task = asyncio.ensure_future(self._deliver(handler, envelope, payload))
+            self._pending.add(task)
+            task.add_done_callback(self._pending.discard)
+
+    async def _deliver(self, handler, envelope, payload: str):
+        if envelope is None:
+            await handler(payload)
+        else:
+            message, _, _ = await envelope.parse_message(payload)
+            await handler(**message)
+
+    async def drain(self):
+        '''wait until every published message has been handled (including the messages those handlers publish)'''
+        while self._pending:
+            await asyncio.gather(*list(self._pending))
+
+
+class LocalMatchingEngineService(MatchingEngineService):
+    '''MatchingEngineService wired to a LocalBus instead of AWS: consumes orders from `ORDERS_TOPIC` and publishes
+    to the bus. Used by `service/loadgen.py`.'''
+
+    def __init__(self, bus: LocalBus):
+        self.bus = bus
+
+        # per instance state, the class level dicts are shared by every instance
+        self.global_lock = asyncio.Lock()
+        self.round_number = 0
+        self.ordersets, self.orderparams, self.datalocks = {}, {}, {}
+        self._matchsets, self.processed_flags, self.partial_fills = {}, {}, {}
+        self.markets, self.published_matches = {}, {}
+
+        bus.subscribe(ORDERS_TOPIC, self.handle_orders, envelope=OrderJson)
+
+    async def publish(self, data: Any, topic: str) -> None:
+        await self.bus.publish(self, data=data, topic=topic)
@@ -0,0 +1,192 @@
+import atexit
+import datetime
+import itertools
+import json
+import logging
+import logging.handlers
+import os
+import queue
+import sys
+import threading
+from typing import Dict, Optional, TextIO
+
+# The service logs through the "mate" logger (children: mate.app, mate.ingest, mate.checkpoint, ...) with an event name
+# as the message and its data as fields, e.g.
+#
+#   logger.info("batch complete", extra=fields(batch_id=batch_id, n_buy=123))
+#
+# `setup_logging` (called when `service.app` is imported) sends the records through a bounded queue to a listener
+# thread, which formats and writes them: the event loop only creates and enqueues records, the formatting (including
+# `to_dict` of orders and json of whole messages passed as fields) and the writes happen off it. Configure it with:
+#
+#   MATE_LOG_LEVEL=INFO               level of the "mate" logger, DEBUG logs every order and outgoing message
+#   MATE_LOG_FORMAT=json|text         one json object per line (default) or "time level logger event k=v ..."
+#   MATE_LOG_SAMPLE=event=rate,...    keep only `rate` of the records of an event (1 in round(1/rate)), e.g.
+#                                     "order received=0.01,publishing matches=0.1". Warnings and errors are never sampled
+#   MATE_LOG_QUEUE_SIZE=10000         records waiting for the writer, beyond that new records are dropped (and counted)
+#                                     rather than blocking the event loop
+#   MATE_LOG_SYNC=1                   write from the logging thread itself, no queue (e.g. to debug a crash)
+LOGGER = "mate"
+
+
+def fields(**kwargs) -> dict:
+    '''`extra` of a log call: the record's structured fields'''
+    return {"fields": kwargs}
+
+
+def _jsonable(value):
+    # orders, matches, ... are converted by the writer thread, not by the caller
+    if hasattr(value, "to_dict"):
+        return value.to_dict()
+    return str(value)
+
+
+class JsonFormatter(logging.Formatter):
+    '''{"time", "level", "logger", "event", **fields} as one line of json'''
+
+    def format(self, record: logging.LogRecord) -> str:
+        line = {
+            "time": datetime.datetime.fromtimestamp(record.created, datetime.timezone.utc).isoformat(timespec="milliseconds"),
+            "level": record.levelname,
+            "logger": record.name,
+            "event": record.getMessage(),
+            **getattr(record, "fields", {}),
+        }
+        if record.exc_info:
+            line["exc"] = self.formatException(record.exc_info)
+        return json.dumps(line, default=_jsonable)
+
+
+class TextFormatter(logging.Formatter):
+    '''"time level logger event k=v ...", for reading logs in a terminal'''
+
+    def __init__(self):
+        super().__init__("%(asctime)s %(levelname)-7s %(name)s %(message)s")
+
+    def formatMessage(self, record: logging.LogRecord) -> str:
+        line = super().formatMessage(record)
+        for key, value in getattr(record, "fields", {}).items():
+            value = json.dumps(value, default=_jsonable) if not isinstance(value, str) else value
+            line += f" {key}={value}"
+        return line
+
+
+class SamplingFilter(logging.Filter):
+    '''keeps 1 in round(1/rate) records of every sampled event (the record's message), deterministically. Records
+    also come from executor threads: each event's count is an `itertools.count`, whose `next` is atomic'''
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.every = {event: max(1, round(1 / rate)) if rate > 0 else 0 for event, rate in rates.items()}
+        self._counts = {event: itertools.count() for event in self.every}
+
+    @classmethod
+    def parse(cls, spec: str) -> "SamplingFilter":
+        '''from "event=rate,event=rate"'''
+        rates = {}
+        for item in filter(None, (s.strip() for s in spec.split(","))):
+            event, rate = item.rsplit("=", 1)
+            rates[event.strip()] = float(rate)
+        return cls(rates)
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        every = self.every.get(record.msg)
+        if every is None or record.levelno >= logging.WARNING:
+            return True
+        if every == 0:
+            return False
+        return next(self._counts[record.msg]) % every == 0
+
+
+class _QueueHandler(logging.handlers.QueueHandler):
+    '''enqueues records as they are, never blocks: a full queue drops the record'''
+
+    def __init__(self, log_queue: queue.Queue):
+        super().__init__(log_queue)
+        self.dropped = 0
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        # the stock prepare formats the message here, i.e. on the event loop. The listener is a thread of this
+        # process, so the record can cross as it is and be formatted there
+        return record
+
+    def enqueue(self, record: logging.LogRecord):
+        try:
+            self.queue.put_nowait(record)
+        except queue.Full:
+            self.dropped += 1
+
+
+class _QueueListener(logging.handlers.QueueListener):
+    def enqueue_sentinel(self):
+        self.queue.put(self._sentinel) # waits for room, unlike the stock put_nowait
+
+
+class LogSetup:
+    '''what `setup_logging` installed, `stop` writes what is queued and removes it'''
+
+    def __init__(self, handler: logging.Handler, listener: Optional[logging.handlers.QueueListener]):
+        self.handler = handler
+        self.listener = listener
+        self._stopped = False
+
+    @property
+    def dropped(self) -> int:
+        return getattr(self.handler, "dropped", 0)
+
+    def stop(self):
+        if self._stopped:
+            return
+        self._stopped = True
+        logging.getLogger(LOGGER).removeHandler(self.handler)
+        if self.listener is not None:
+            self.listener.stop()
+        if self.dropped:
+            print(f"logging: {self.dropped} records dropped on a full queue", file=sys.stderr)
+
+
+_current = None
+_lock = threading.Lock()
+
+def setup_logging(level: str = None, fmt: str = None, sample: str = None, queue_size: int = None, sync: bool = None,
+                  stream: TextIO = None) -> LogSetup:
+    '''(re)configure the "mate" logger, arguments default to the MATE_LOG_* variables above, `stream` to stderr'''
+    global _current
+    env = os.environ.get
+    level = (level or env("MATE_LOG_LEVEL") or "INFO").upper()
+    fmt = fmt or env("MATE_LOG_FORMAT") or "json"
+    sample = sample if sample is not None else env("MATE_LOG_SAMPLE", "")
+    queue_size = queue_size if queue_size is not None else int(env("MATE_LOG_QUEUE_SIZE", 10000))
+    sync = sync if sync is not None else env("MATE_LOG_SYNC") == "1"
+
+    with _lock:
+        if _current is not None:
+            _current.stop()
+
+        writer = logging.StreamHandler(stream or sys.stderr)
+        writer.setFormatter(JsonFormatter() if fmt == "json" else TextFormatter())
+
+        if sync:
+            handler, listener = writer, None
+        else:
+            handler = _QueueHandler(queue.Queue(queue_size))
+            listener = _QueueListener(handler.queue, writer)
+            listener.start()
+        if sample:
+            # on the handler that enqueues (logger filters would miss the child loggers), a sampled out record
+            # never reaches the queue
+            handler.addFilter(SamplingFilter.parse(sample))
+
+        logger = logging.getLogger(LOGGER)
+        logger.setLevel(level)
+        logger.propagate = False # not through the root logger's (tomodachi's) handlers as well
+        logger.addHandler(handler)
+
+        _current = LogSetup(handler, listener)
+        return _current
+
+
+@atexit.register
+def _stop_logging():
+    if _current is not None:
+        _current.stop()
@@ -1,8 +1,18 @@
 import json
+import logging
 from typing import Any, Dict, Tuple, Union
-from ffengine.data import BuyOrder, SellOrder
+from ffengine.data.messages import (
+    PROTOCOL_VERSION, SINGLE_ORDER_PROTOCOL_VERSION, ORDER_BATCH_TYPE, parse_order, parse_orders_message,
+) # the message formats, shared with the `ffengine.stream` CLI
+from ._logging import fields
 
-PROTOCOL_VERSION = "custom-order-json--1.0.0"
+try:
+    import orjson # optional, several times faster decoding of large batch messages
+    _loads = orjson.loads
+except ImportError:
+    _loads = json.loads
+
+logger = logging.getLogger("mate.ingest")
 
 
 class OrderJson(object):
@@ -12,53 +22,20 @@ class OrderJson(object):
 
     @classmethod
     async def parse_message(cls, payload: str, **kwargs: Any) -> Union[Dict, Tuple]:
-        data = json.loads(payload)
-
-        order_type = data["type"]
-        total_orders = data["message"]["totalMessageCount"]
-        orderset_id = data["message"]["batchId"]
-        order_info = data["message"]["message"]
-
-        order_id = order_info["id"]
-        agent_id = order_info["proxyId"]
-        product_id = order_info["productId"]
-        quantity = int(order_info["volume"])
-        activ_time = order_info["earliestDate"]["seconds"]
-        expir_time = order_info["latestDate"]["seconds"]
-        lat, long = order_info["lat"], order_info["long"]
-
-        order=None
-        if order_type == "buyOrder.created":
-            price = int(order_info["maxPriceCents"])
-
-            order = BuyOrder(
-                order_id=order_id, buyer_id=agent_id, product_id=product_id,
-                max_price_cents=price, quantity=quantity,
-                time_activation=activ_time, time_expiry=expir_time,
-                lat=lat, long=long
-            )
-        
-        elif order_type == "sellOrder.created":
-            price = int(order_info["minPriceCents"])
-            service_range = order_info["serviceRadius"]
-
-            order = SellOrder(
-                order_id=order_id, seller_id=agent_id, product_id=product_id,
-                min_price_cents=price, quantity=quantity,
-                time_activation=activ_time, time_expiry=expir_time,
-                lat=lat, long=long, service_range=service_range
-            )
+        '''parses both protocol versions into a chunk of orders: `orders` is a list of (order_type, order)'''
+        data = _loads(payload)
+        orders, batch_info = parse_orders_message(data)
 
-        print(f"Recvd Order: {order.to_dict()}")
+        if data["type"] == ORDER_BATCH_TYPE:
+            logger.debug("orders received", extra=fields(batch_id=batch_info["batchId"], n_orders=len(orders)))
+        else:
+            # the order itself goes as a field, the writer thread turns it into a dict
+            logger.debug("order received", extra=fields(batch_id=batch_info["batchId"], order=orders[0][1]))
 
         return (
             {
-                "order": order,
-                "order_type": order_type,
-                "batch_info": {
-                    "totalMessageCount": total_orders,
-                    "batchId": orderset_id
-                }
+                "orders": orders,
+                "batch_info": batch_info,
             },
             None,
             None,
@@ -0,0 +1,104 @@
+## Local stand-in for the FieldFresh API endpoints used by `APITester`/`AsyncAPITester`
+# run from the repo root: `python -m service._stubapi --port 8081 --products 10`
+# then point the tester's "api-url" at http://localhost:8081
+#
+# Orders and proxies are only kept in memory. `fail_every` makes every n-th request answer 503 to exercise retries, before
+# handling it or, with `fail_after`, after handling it (a lost response: the orders exist but the client does not know).
+# POSTs with an Idempotency-Key header seen before get the first response again instead of being handled twice.
+
+import argparse
+import itertools
+from typing import Dict
+
+from aiohttp import web
+
+
+class StubAPI:
+    def __init__(self, n_products: int = 10, fail_every: int = 0, fail_after: bool = False):
+        self.products = [{"id": f"p_{i}", "name": f"Product {i}"} for i in range(n_products)]
+        self.fail_every = fail_every
+        self.fail_after = fail_after
+        self._responses: Dict[str, web.Response] = {} # Idempotency-Key -> first response
+
+        self.proxies: Dict[str, dict] = {}
+        self.buy_orders: Dict[str, dict] = {}
+        self.sell_orders: Dict[str, dict] = {}
+
+        self._ids = itertools.count()
+        self.n_requests = 0
+
+    def _new_id(self, prefix: str) -> str:
+        return f"{prefix}_{next(self._ids)}"
+
+    @web.middleware
+    async def _flaky(self, request, handler):
+        self.n_requests += 1
+        fail = self.fail_every and self.n_requests % self.fail_every == 0
+        if fail and not self.fail_after:
+            return web.json_response({"error": "stub failure"}, status=503)
+
+        key = request.headers.get("Idempotency-Key")
+        if key is None:
+            response = await handler(request)
+        elif key in self._responses:
+            response = web.json_response(text=self._responses[key])
+        else:
+            response = await handler(request)
+            self._responses[key] = response.text
+
+        if fail:
+            return web.json_response({"error": "stub failure"}, status=503)
+        return response
+
+    async def get_products(self, request):
+        return web.json_response({"products": self.products})
+
+    async def signin(self, request):
+        body = await request.json()
+        return web.json_response({
+            "cognitoJWT": {"access_token": "stub-token"},
+            "user": {"profileId": "stub-user-" + body["email"]},
+        })
+
+    async def create_proxy(self, request):
+        body = await request.json()
+        proxy_id = self._new_id("proxy")
+        self.proxies[proxy_id] = body
+        return web.json_response({"id": proxy_id, **body})
+
+    async def _create_orders(self, request, key: str, store: dict):
+        body = await request.json()
+        assert body["proxyId"] in self.proxies, f"unknown proxy {body['proxyId']}"
+
+        created = []
+        for order in body[key]:
+            order_id = self._new_id(key)
+            store[order_id] = {"proxyId": body["proxyId"], **order}
+            created.append({"id": order_id, **order})
+        return web.json_response({key: created})
+
+    async def create_buy_orders(self, request):
+        return await self._create_orders(request, "buyProducts", self.buy_orders)
+
+    async def create_sell_orders(self, request):
+        return await self._create_orders(request, "sellProducts", self.sell_orders)
+
+    def app(self) -> web.Application:
+        app = web.Application(middlewares=[self._flaky])
+        app.router.add_get("/products", self.get_products)
+        app.router.add_post("/auth/signin", self.signin)
+        app.router.add_post("/proxy/new", self.create_proxy)
+        app.router.add_post("/orders/buy", self.create_buy_orders)
+        app.router.add_post("/orders/sell", self.create_sell_orders)
+        return app
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m service._stubapi")
+    parser.add_argument("--port", type=int, default=8081)
+    parser.add_argument("--products", type=int, default=10)
+    parser.add_argument("--fail-every", type=int, default=0)
+    parser.add_argument("--fail-after", action="store_true", help="fail after handling the request rather than before")
+    args = parser.parse_args()
+
+    web.run_app(StubAPI(args.products, args.fail_every, args.fail_after).app(), port=args.port)
@@ -1,26 +1,49 @@
 import os
-from typing import Any
+from typing import Any, List, Tuple
 
 import tomodachi
 from tomodachi import aws_sns_sqs, aws_sns_sqs_publish
 from tomodachi.discovery import AWSSNSRegistration
 from ._msgclasses import OrderJson
+from ._delta import PublishedMatches, MATCH_DELTA_TYPE
+from ._checkpoint import BatchCheckpoint
+from ._logging import setup_logging, fields
 
 from ffengine.data import OrderSet, BuyOrder, SellOrder
-from ffengine.optim.engines import OMMEngine
+from ffengine.optim.engines import IncrementalParams
+from ffengine.optim import SolveCache, EnginePlanner
+from ffengine.replay import BatchRecorder
+from ffengine.profiling import get_profiler, run_stage
 import json
 from datetime import datetime
 import asyncio
 
-import debugpy
 import time
+import logging
 
-aws_credentials = json.load(open('aws_credentials.json'))
+ORDERS_TOPIC = "dev-field-fresh-mate-sns" # orders from the API
+API_TOPIC = "dev-field-fresh-api-sns" # matches and ready messages to the API
 
-# debugpy.listen(8090)
-# time.sleep(10)
+def load_aws_credentials(path: str = 'aws_credentials.json') -> dict:
+    '''credentials file if present, otherwise the standard AWS environment variables (e.g. when running locally)'''
+    if os.path.exists(path):
+        return json.load(open(path))
+    return {
+        "aws_access_key_id": os.environ.get("AWS_ACCESS_KEY_ID"),
+        "aws_secret_access_key": os.environ.get("AWS_SECRET_ACCESS_KEY"),
+    }
+
+aws_credentials = load_aws_credentials()
+
+# debugpy is only needed (and imported) when attaching a debugger, e.g. MATE_DEBUGPY_PORT=8090
+if os.environ.get("MATE_DEBUGPY_PORT"):
+    import debugpy
+    debugpy.listen(int(os.environ["MATE_DEBUGPY_PORT"]))
+    time.sleep(10)
 
-# TODO: convert `print` to logging
+# structured logs, written by a background thread (see `_logging.py` for the MATE_LOG_* settings)
+log_setup = setup_logging()
+logger = logging.getLogger("mate.app")
 
 class MatchingEngineService(tomodachi.Service):
     name = "matching-engine-service"
@@ -53,64 +76,160 @@ class MatchingEngineService(tomodachi.Service):
     MATCH_BATCH_SIZE = 3
     MODEL_CONFIG = {"unit_tcost" : 300}
     DEBUG_MODE = False
+    RECORD_DIR = os.environ.get("MATE_RECORD_DIR") # opt-in: record every completed batch here for `python -m ffengine.replay`
+    PROFILER = get_profiler() # opt-in: a `ffengine.profiling.StageProfiler`, from FFENGINE_PROFILE* by default
+    # results of batches already solved, by content: a redelivered or repeated batch is not solved again.
+    # MATE_SOLVE_CACHE_DIR adds an on disk tier behind the in memory LRU
+    SOLVE_CACHE = SolveCache(max_entries=int(os.environ.get("MATE_SOLVE_CACHE_SIZE", 64)), disk_dir=os.environ.get("MATE_SOLVE_CACHE_DIR"))
+    # picks the engine of every batch from its estimated size, budgets and decision log from MATE_* (see `EnginePlanner.from_env`)
+    PLANNER = EnginePlanner.from_env()
+    PUBLISH_DELTAS = os.environ.get("MATE_PUBLISH_DELTAS") == "1" # opt-in: publish only what changed since the market's last round (see `_delta.py`)
 
     global_lock = asyncio.Lock()
     round_number = 0
     ordersets = {}
+    orderparams = {}
     datalocks = {}
     _matchsets = {}
     processed_flags = {}
+    partial_fills = {}
+    markets = {} # batch id -> market id
+    published_matches = {} # market id -> PublishedMatches
+    recorder = BatchRecorder(RECORD_DIR) if RECORD_DIR else None
+    CHECKPOINT_DIR = os.environ.get("MATE_CHECKPOINT_DIR") # opt-in: log in-flight batches here and restore them on startup (see `_checkpoint.py`)
+    checkpoint = BatchCheckpoint(CHECKPOINT_DIR) if CHECKPOINT_DIR else None
+
+    async def _start_service(self) -> None:
+        '''restore the checkpointed batches before consuming, orders the API resends are then rejected as duplicates'''
+        if self.checkpoint is None:
+            return
+        start = time.perf_counter()
+        restored = await asyncio.get_event_loop().run_in_executor(None, lambda: list(self.checkpoint.restore()))
+        for batch_info, orders in restored:
+            await self.handle_orders(orders, batch_info, checkpoint=False)
+        logger.info("checkpoint restored", extra=fields(batches=len(restored), orders=sum(len(o) for _, o in restored), seconds=time.perf_counter() - start))
+
+    async def _stop_service(self) -> None:
+        if self.checkpoint is not None:
+            self.checkpoint.close()
+
+    async def publish(self, data: Any, topic: str) -> None:
+        '''every outgoing message goes through here, so the transport can be swapped (see `service/_localbus.py`)'''
+        await aws_sns_sqs_publish(self, data=data, topic=topic)
 
-    @aws_sns_sqs("dev-field-fresh-mate-sns", queue_name="stage-field-fresh-matching-engine-sqs_1")
-    async def recvSystemOrders(self, order: Any, order_type: str, batch_info: dict ) -> None:
+    @aws_sns_sqs(ORDERS_TOPIC, queue_name="stage-field-fresh-matching-engine-sqs_1")
+    async def recvSystemOrders(self, orders: List[Tuple[str, Any]], batch_info: dict ) -> None:
         '''Receive new orders sent to MATE. Preprocess them and store the parameters.
+        `orders` is the chunk of (order_type, order) carried by one message (see `OrderJson`)
         '''
+        await self.handle_orders(orders, batch_info)
 
+    async def handle_orders(self, orders: List[Tuple[str, Any]], batch_info: dict, checkpoint: bool = True) -> None:
+        '''transport independent body of `recvSystemOrders`: add the chunk to its batch, match and publish once the batch is complete.
+        With `checkpoint` the accepted orders are also queued for the checkpoint log (off when restoring from it)'''
 
-        total_orders = batch_info["totalMessageCount"]
+
+        total_orders = batch_info["totalOrders"]
         orderset_id = batch_info["batchId"]
 
         async with self.global_lock:
             if not orderset_id in self.ordersets:
-                print("adding new orderset")
+                logger.info("batch opened", extra=fields(batch_id=orderset_id, market_id=batch_info.get("marketId", "default")))
                 self.ordersets[orderset_id] = OrderSet()
+                # build the model parameters while the batch arrives, so matching can start as soon as it is complete
+                self.orderparams[orderset_id] = IncrementalParams(self.ordersets[orderset_id], **self.MODEL_CONFIG)
                 self.datalocks[orderset_id] = asyncio.Lock()
                 self.processed_flags[orderset_id] = {'buy' : False, 'sell' : False}
+                self.partial_fills[orderset_id] = False
+                self.markets[orderset_id] = batch_info.get("marketId", "default")
 
         async with self.datalocks[orderset_id]:
-            if order_type == "buyOrder.created":
-                try:
-                    self.ordersets[orderset_id].add_buy_order(order)
-                    print('added buy order')
-                except ValueError as e:
-                    print(e)
-                self.processed_flags[orderset_id]['buy'] = (total_orders == self.ordersets[orderset_id].n_buy_orders)
-            elif order_type == "sellOrder.created":
-                try:
-                    self.ordersets[orderset_id].add_sell_order(order)
-                    print('added sell order')
-                except ValueError as e:
-                    print(e)
-                self.processed_flags[orderset_id]['sell'] = (total_orders == self.ordersets[orderset_id].n_sell_orders)
-
-        print(len(self.ordersets[orderset_id]), len(self.ordersets[orderset_id]._all_orders))
-        print(self.processed_flags[orderset_id])
+            self.partial_fills[orderset_id] |= batch_info.get("allowPartialFill", False)
+
+            # the whole chunk goes in under one lock acquisition, with one vectorized parameter update per side
+            orderset = self.ordersets[orderset_id]
+            first_buy, first_sell = orderset.n_buy_orders, orderset.n_sell_orders
+            errors = self.orderparams[orderset_id].add_orders(order for _, order in orders)
+            for e in errors:
+                logger.warning("order rejected", extra=fields(batch_id=orderset_id, error=str(e)))
+            logger.debug("orders added", extra=fields(batch_id=orderset_id, added=len(orders) - len(errors)))
+
+            if self.checkpoint is not None and checkpoint:
+                # only the accepted orders, duplicates of a redelivery are not logged twice
+                self.checkpoint.append(orderset_id, batch_info, [
+                    *(orderset.get_buy_order(i) for i in range(first_buy, orderset.n_buy_orders)),
+                    *(orderset.get_sell_order(i) for i in range(first_sell, orderset.n_sell_orders)),
+                ])
+
+            if "buyOrder.created" in total_orders:
+                self.processed_flags[orderset_id]['buy'] = (total_orders["buyOrder.created"] == self.ordersets[orderset_id].n_buy_orders)
+            if "sellOrder.created" in total_orders:
+                self.processed_flags[orderset_id]['sell'] = (total_orders["sellOrder.created"] == self.ordersets[orderset_id].n_sell_orders)
+
+        if logger.isEnabledFor(logging.DEBUG): # once per message, skip building the fields when they would be thrown away
+            logger.debug("batch progress", extra=fields(
+                batch_id=orderset_id, n_buy=self.ordersets[orderset_id].n_buy_orders, n_sell=self.ordersets[orderset_id].n_sell_orders,
+                totals=total_orders, complete=dict(self.processed_flags[orderset_id]),
+            ))
         if self.processed_flags[orderset_id]['buy'] and self.processed_flags[orderset_id]['sell']:
             self.processed_flags.pop(orderset_id)
             self.datalocks.pop(orderset_id)
-            print(f"Order set len: {len(self.ordersets[orderset_id])}")
-            print(f"buy orders: {self.ordersets[orderset_id].n_buy_orders}")
-            print(f"sell orders: {self.ordersets[orderset_id].n_sell_orders}")
+            logger.info("batch complete", extra=fields(
+                batch_id=orderset_id, n_orders=len(self.ordersets[orderset_id]),
+                n_buy=self.ordersets[orderset_id].n_buy_orders, n_sell=self.ordersets[orderset_id].n_sell_orders,
+            ))
 
             assert len(self.ordersets[orderset_id]) == len(self.ordersets[orderset_id]._all_orders), f"Critical failure: {len(self.ordersets[orderset_id]) - len(self.ordersets[orderset_id]._all_orders)} duplicated orders"
 
             # start matching
-            matcher = OMMEngine(self.ordersets.pop(orderset_id), **self.MODEL_CONFIG)
-            matcher.construct_params()
-            matcher.match()
+            timings = {}
+            orderset = self.ordersets.pop(orderset_id)
+            orderparams = self.orderparams.pop(orderset_id)
+
+            start = time.perf_counter()
+            allow_partial_fill = self.partial_fills.pop(orderset_id)
+            # keyed by content before planning: the planner's pick follows from the orders, the partial fill flag and the
+            # planner's settings, so a hit skips planning and building the engine altogether
+            cache_key = self.SOLVE_CACHE.key(
+                orderset, {**self.MODEL_CONFIG, "allow_partial_fill": allow_partial_fill, "planner": self.PLANNER.settings()}, "EnginePlanner"
+            )
+            cached = self.SOLVE_CACHE.get(cache_key, orderset)
+            timings["setup"] = time.perf_counter() - start
 
-            # return matches
-            matches = matcher.get_matches()
+            matcher = None
+            if cached is not None:
+                matches, objective = cached
+                logger.info("solve cache hit", extra=fields(batch_id=orderset_id, cache=self.SOLVE_CACHE.stats()))
+            else:
+                start = time.perf_counter()
+                # dense MIP while it fits the budgets, then shards, then the LP heuristic; a min-cost flow for partial fills
+                plan = self.PLANNER.plan(orderset, allow_partial_fill=allow_partial_fill)
+                logger.info("engine planned", extra=fields(
+                    batch_id=orderset_id, engine=plan.engine, reason=plan.reason,
+                    expected_seconds=plan.expected_seconds, expected_memory_mb=plan.expected_memory_mb,
+                ))
+                matcher = self.PLANNER.make_engine(plan, orderset, params=orderparams, **self.MODEL_CONFIG)
+                timings["setup"] += time.perf_counter() - start
+
+                # every stage runs off the event loop, which keeps ingesting the other batches meanwhile: concurrent
+                # solves share cores/environments through the engine's SolverPool
+                loop = asyncio.get_event_loop()
+                start = time.perf_counter()
+                await loop.run_in_executor(None, run_stage, self.PROFILER, orderset_id, "construct_params", matcher.construct_params)
+                timings["construct_params"] = time.perf_counter() - start
+
+                start = time.perf_counter()
+                await loop.run_in_executor(None, run_stage, self.PROFILER, orderset_id, "match", matcher.match)
+                timings["match"] = time.perf_counter() - start
+
+                # return matches
+                start = time.perf_counter()
+                matches = await loop.run_in_executor(None, run_stage, self.PROFILER, orderset_id, "get_matches", matcher.get_matches)
+                timings["get_matches"] = time.perf_counter() - start
+
+                objective = matcher.objective
+                self.SOLVE_CACHE.put(cache_key, matches, objective)
+                self.PLANNER.record(orderset_id, plan, timings, objective=objective, n_matches=matches.n_matches)
             total_matches = matches.n_matches
 
             if self.DEBUG_MODE:
@@ -120,33 +239,67 @@ class MatchingEngineService(tomodachi.Service):
                 "batchId": batch_id, "totalMatches": total_matches, "messageSize": len(messagelist), "matches": messagelist
                 }
 
-            matchbatch = []
-            for i, match in enumerate(matches.iter_matches()):
-                matchdata = match.to_dict()
-                matchbatch.append(matchdata)
-
-                if (i+1) % self.MATCH_BATCH_SIZE:
-                    data = {"type": "mate.match.batch", "message": package_matches(total_matches, orderset_id, matchbatch)}
-                    print("sending: ", data)
-                    await aws_sns_sqs_publish(self, data=data, topic="dev-field-fresh-api-sns")
-                    matchbatch = []
-            
-            if len(matchbatch):
-                data = {"type": "mate.match.batch", "message": package_matches(total_matches, orderset_id, matchbatch)}
-                print("sending: ", data)
-                await aws_sns_sqs_publish(self, data=data, topic="dev-field-fresh-api-sns")
-
-            print(f"sent all responses: {matches.n_matches} matches")
+            start = time.perf_counter()
+            market_id = self.markets.pop(orderset_id)
+            if self.PUBLISH_DELTAS:
+                await self.publish_delta(market_id, orderset_id, matches.to_records())
+            else:
+                # all the match messages in one vectorized step instead of a `Match.to_dict` per match, sent in
+                # messages of MATCH_BATCH_SIZE matches
+                records = matches.to_records()
+                for i in range(0, len(records), self.MATCH_BATCH_SIZE):
+                    data = {"type": "mate.match.batch", "message": package_matches(total_matches, orderset_id, records[i:i+self.MATCH_BATCH_SIZE])}
+                    logger.debug("publishing matches", extra=fields(batch_id=orderset_id, message=data))
+                    await self.publish(data, topic=API_TOPIC)
+
+            logger.info("matches published", extra=fields(batch_id=orderset_id, n_matches=matches.n_matches, objective=objective))
+            if self.checkpoint is not None:
+                # only now: a crash while planning, solving or publishing restores the batch and matches it again
+                self.checkpoint.discard(orderset_id)
+            timings["publish"] = time.perf_counter() - start
+            timings["total"] = sum(timings.values())
+
+            if self.recorder and matcher is not None: # a cache hit was recorded when it was solved
+                await asyncio.get_event_loop().run_in_executor(
+                    None, lambda: self.recorder.record(
+                        orderset_id, orderset, self.MODEL_CONFIG, timings,
+                        matchset=matches, objective=objective, engine=type(matcher).__name__
+                    )
+                )
             self.round_number += 1
 
 
+    @tomodachi.http("GET", r"/cache/stats/?")
+    async def cache_stats(self, request):
+        '''hit/miss counters of the solve cache'''
+        return 200, json.dumps(self.SOLVE_CACHE.stats())
+
+    async def publish_delta(self, market_id: str, batch_id: str, records: List[dict]) -> None:
+        '''publish the changes between the market's last published matches and `records`, in messages of at most
+        MATCH_BATCH_SIZE changes. A market's first round is all "new". A round without changes still sends one (empty)
+        message, so the API knows the round is done'''
+        published = self.published_matches.setdefault(market_id, PublishedMatches())
+        changes = published.update(records)
+
+        for i in range(0, max(len(changes), 1), self.MATCH_BATCH_SIZE):
+            part = changes[i:i+self.MATCH_BATCH_SIZE]
+            data = {"type": MATCH_DELTA_TYPE, "message": {
+                "batchId": batch_id, "marketId": market_id, "totalChanges": len(changes), "messageSize": len(part), "changes": part
+            }}
+            await self.publish(data, topic=API_TOPIC)
+
+        logger.info("match deltas published", extra=fields(batch_id=batch_id, market_id=market_id, n_changes=len(changes), n_matches=len(records)))
+
     @tomodachi.schedule(interval=MATCHING_PERIOD_SECONDS, immediately=~DEBUG_MODE) # immediately means to also run on startup, disable when debugging
     async def request_orders(self) -> None:
+        await self.send_ready()
+
+    async def send_ready(self) -> None:
         timestamp = int(datetime.utcnow().timestamp())
         msg = {
             "type":"mate.ready",
             "message": {"readyTimeUTCSeconds": timestamp, "round": self.round_number}
         }
-        await aws_sns_sqs_publish(self, data=msg, topic="dev-field-fresh-api-sns")
-        print('requested orders')   
+        await self.publish(msg, topic=API_TOPIC)
+        logger.info("orders requested", extra=fields(round=self.round_number))
 
@@ -1,4 +1,8 @@
+import asyncio
+import uuid
+import aiohttp
 import requests
+from typing import List
 from ffengine.data import OrderSet, BuyOrder, SellOrder
 from ffengine.simulation import TestCase
 
@@ -144,3 +148,191 @@ class APITester:
 
             
 
+
+
+#==============================================================================================================
+# Async bulk seeding
+#==============================================================================================================
+
+RETRY_STATUS = {429, 500, 502, 503, 504}
+IDEMPOTENT_METHODS = {"GET", "HEAD", "OPTIONS", "PUT", "DELETE"}
+IDEMPOTENCY_HEADER = "Idempotency-Key"
+
+
+class AsyncAPITester:
+    '''Async counterpart of `APITester` for seeding large test batches.
+
+    All requests share one pooled aiohttp session, at most `concurrency` are in flight, and failed requests
+    (connection errors, timeouts, 429/5xx) are retried with exponential backoff. `fill_test_data` creates one proxy
+    per agent and sends orders in bulk, `orders_per_request` per `buyProducts`/`sellProducts` array.
+
+    A POST that failed may still have been processed, so POSTs are only retried on 429 (rejected before processing),
+    unless `idempotent_posts`: every POST then carries an Idempotency-Key header, the same on all its attempts, and is
+    retried like the other methods. Only enable it against an API that deduplicates by that key (`_stubapi.py` does).
+
+    usage:
+        async with AsyncAPITester(config) as api:
+            await api.signin()
+            await api.fill_test_data(orderset)
+    '''
+
+    def __init__(self, config: dict, concurrency: int = 16, orders_per_request: int = 50, max_retries: int = 5, backoff_seconds: float = .2,
+                 idempotent_posts: bool = False):
+        assert ("api-url" in config and "test-user" in config and "test-user-pwd" in config), "Incomplete test configuration: api-url, test-user or test-user-pwd is missing"
+
+        self.API_URL = config["api-url"]
+        self.TEST_USER = config["test-user"]
+        self.TEST_USER_PWD = config["test-user-pwd"]
+
+        self.endpoint_signin = self.API_URL + "/auth/signin"
+        self.endpoint_proxy_create = self.API_URL + "/proxy/new"
+        self.endpoint_buy_create = self.API_URL + "/orders/buy"
+        self.endpoint_sell_create = self.API_URL + "/orders/sell"
+
+        self.concurrency = concurrency
+        self.orders_per_request = orders_per_request
+        self.max_retries = max_retries
+        self.backoff_seconds = backoff_seconds
+        self.idempotent_posts = idempotent_posts
+
+        self.n_requests = 0
+        self.n_retries = 0
+
+    async def __aenter__(self):
+        self._session = aiohttp.ClientSession(connector=aiohttp.TCPConnector(limit=self.concurrency))
+        self._semaphore = asyncio.Semaphore(self.concurrency)
+        self._proxies = {} # agent -> task creating its proxy, shared by every order of the agent
+
+        products = await self._request("GET", self.API_URL + "/products")
+        self.products = {i: d['id'] for i, d in enumerate(products['products'])}
+        return self
+
+    async def __aexit__(self, *exc):
+        await self._session.close()
+
+    async def _request(self, method: str, url: str, **kwargs) -> dict:
+        retry_any = method in IDEMPOTENT_METHODS
+        if method == "POST" and self.idempotent_posts:
+            kwargs["headers"] = {**kwargs.get("headers", {}), IDEMPOTENCY_HEADER: str(uuid.uuid4())}
+            retry_any = True
+
+        for attempt in range(self.max_retries + 1):
+            async with self._semaphore:
+                self.n_requests += 1
+                try:
+                    async with self._session.request(method, url, **kwargs) as response:
+                        if response.status == SUCCESS_STATUS:
+                            return await response.json()
+                        if response.status not in RETRY_STATUS or not (retry_any or response.status == 429):
+                            raise AssertionError(f"{method} {url} failed: {response.status} {await response.text()}")
+                except (aiohttp.ClientConnectionError, asyncio.TimeoutError):
+                    if attempt == self.max_retries or not retry_any:
+                        raise
+
+            if attempt == self.max_retries:
+                raise AssertionError(f"{method} {url} failed after {self.max_retries} retries")
+
+            # back off outside the semaphore so the slot goes to another request
+            self.n_retries += 1
+            await asyncio.sleep(self.backoff_seconds * 2**attempt)
+
+    def _auth(self) -> dict:
+        return {'Authorization': f'Bearer {self.test_userToken}'}
+
+    async def signin(self):
+        signin_resp = await self._request("POST", self.endpoint_signin, json={
+            "email": self.TEST_USER,
+            "password": self.TEST_USER_PWD
+        })
+
+        self.test_userToken = signin_resp['cognitoJWT']['access_token']
+        self.test_userId = signin_resp['user']['profileId']
+
+    async def create_proxy(self, proxy_name: str, lat: float, lon: float) -> str:
+        create_proxy_resp = await self._request("POST", self.endpoint_proxy_create, json={
+            "userId": self.test_userId,
+            "name": proxy_name,
+            "streetAddress": "TEST",
+            "city": "TEST",
+            "province": "TEST",
+            "country": "TEST",
+            "postalCode": "TEST",
+            "lat": lat,
+            "long": lon
+        })
+
+        return create_proxy_resp["id"]
+
+    def get_proxy(self, agent_id: str, lat: float, lon: float, side: str) -> asyncio.Task:
+        '''the proxy of an agent, created once no matter how many of its orders ask for it concurrently'''
+        if (side, agent_id) not in self._proxies:
+            self._proxies[side, agent_id] = asyncio.ensure_future(self.create_proxy("TEST-" + agent_id, lat, lon))
+        return self._proxies[side, agent_id]
+
+    async def create_buy_orders(self, proxy_id: str, buyorders: List[BuyOrder]) -> List[str]:
+        response = await self._request("POST", self.endpoint_buy_create, json={
+            "proxyId": proxy_id,
+            "buyProducts": [{
+                "earliestDate": timestamp_convert(buyorder.time_activation),
+                "latestDate": timestamp_convert(buyorder.time_expiry),
+                "maxPriceCents": buyorder.max_price_cents,
+                "volume": buyorder.quantity,
+                "productId": self.products[buyorder.int_product_id]
+            } for buyorder in buyorders]
+        }, headers=self._auth())
+
+        return [p["id"] for p in response['buyProducts']]
+
+    async def create_sell_orders(self, proxy_id: str, sellorders: List[SellOrder]) -> List[str]:
+        response = await self._request("POST", self.endpoint_sell_create, json={
+            "proxyId": proxy_id,
+            "sellProducts": [{
+                "earliestDate": timestamp_convert(sellorder.time_activation),
+                "latestDate": timestamp_convert(sellorder.time_expiry),
+                "minPriceCents": sellorder.min_price_cents,
+                "volume": sellorder.quantity,
+                "productId": self.products[sellorder.int_product_id],
+                "serviceRadius": sellorder.service_range
+            } for sellorder in sellorders]
+        }, headers=self._auth())
+
+        return [p["id"] for p in response['sellProducts']]
+
+    async def _fill_agent(self, orders: list, agent_id: str, create_orders):
+        '''create (or reuse) the proxy of one agent, then its orders in bulk requests'''
+        side = 'buy' if isinstance(orders[0], BuyOrder) else 'sell'
+        proxy_id = await self.get_proxy(agent_id, orders[0].lat, orders[0].long, side)
+
+        async def fill_chunk(chunk):
+            order_ids = await create_orders(proxy_id, chunk)
+            assert len(order_ids) == len(chunk), "API did not create every order of the request"
+
+            for order, order_id in zip(chunk, order_ids):
+                if isinstance(order, BuyOrder):
+                    order.buyer_id = proxy_id
+                else:
+                    order.seller_id = proxy_id
+                order.product_id = self.products[order.int_product_id]
+                order.order_id = order_id
+
+        await asyncio.gather(*(
+            fill_chunk(orders[i:i+self.orders_per_request]) for i in range(0, len(orders), self.orders_per_request)
+        ))
+
+    async def fill_test_data(self, orderset: OrderSet):
+        '''same result as `APITester.fill_test_data`: creates the orderset's agents and orders in the API and
+        updates the orders with the API ids'''
+        n_products = len(self.products)
+
+        buyers, sellers = {}, {}
+        for buyorder in orderset.iter_buy_orders():
+            assert buyorder.int_product_id < n_products, "Bad test case, cannot use more products than there are in DB. Add test products to DB or use test case with less products"
+            buyers.setdefault(buyorder.buyer_id, []).append(buyorder)
+        for sellorder in orderset.iter_sell_orders():
+            assert sellorder.int_product_id < n_products, "Bad test case, cannot use more products than there are in DB. Add test products to DB or use test case with less products"
+            sellers.setdefault(sellorder.seller_id, []).append(sellorder)
+
+        await asyncio.gather(
+            *(self._fill_agent(orders, agent, self.create_buy_orders) for agent, orders in buyers.items()),
+            *(self._fill_agent(orders, agent, self.create_sell_orders) for agent, orders in sellers.items()),
+        )
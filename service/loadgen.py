@@ -0,0 +1,172 @@
+## End-to-end load generator for MatchingEngineService, without AWS or the FieldFresh API
+# run from the repo root: `python -m service.loadgen --rounds 5 --buyers 100 --sellers 100 --products 5 --rate 5000 --chunk 200`
+#
+# Every round replays a TestCase OrderSet as order-created messages through a LocalBus into the service, at `--rate`
+# orders per second and `--chunk` orders per message (1 = the single order protocol, >1 = `orders.batch`), and
+# reports ingest throughput, time to first match and end-to-end round latency percentiles.
+
+import argparse
+import asyncio
+import json
+import time
+from typing import Dict, List
+
+import numpy as np
+
+from ffengine.data import OrderSet, BuyOrder
+from ffengine.simulation import TestCase
+
+from ._msgclasses import PROTOCOL_VERSION, ORDER_BATCH_TYPE
+from ._delta import MATCH_DELTA_TYPE
+from ._localbus import LocalBus, LocalMatchingEngineService
+from .app import ORDERS_TOPIC, API_TOPIC
+
+
+def make_testcase(size_I: int, size_J: int, size_K: int, random_seed: int) -> TestCase:
+    I, J, K = list(range(size_I)), list(range(size_J)), list(range(size_K))
+    return TestCase(
+        size_I=size_I, size_J=size_J, size_K=size_K,
+        Q_K={k: 1/size_K for k in K}, P_K={k: 100 + 50*k for k in K},
+        D_scap_p={0: .7, 1: .3}, D_dcap_p={0: 1},
+        s_bounds=lambda c: (1,10) if c == 0 else (10, 20),
+        d_bounds=lambda c: (3, 7),
+        s_subsize={i: size_K for i in I},
+        lb_fn= lambda c, p: p - 10,
+        ub_fn= lambda c, p: p + 10,
+        dist_bounds= (3, 10),
+        unit_tcost=1,
+        random_seed=random_seed
+    )
+
+
+def order_message(order) -> dict:
+    '''an order in the API's order-created shape (see `parse_order`)'''
+    info = {
+        "id": order.order_id,
+        "productId": order.product_id,
+        "volume": order.quantity,
+        "earliestDate": {"seconds": order.time_activation},
+        "latestDate": {"seconds": order.time_expiry},
+        "lat": order.lat,
+        "long": order.long,
+    }
+    if isinstance(order, BuyOrder):
+        info.update(proxyId=order.buyer_id, maxPriceCents=order.max_price_cents)
+        return {"type": "buyOrder.created", "message": info}
+
+    info.update(proxyId=order.seller_id, minPriceCents=order.min_price_cents, serviceRadius=order.service_range)
+    return {"type": "sellOrder.created", "message": info}
+
+
+def batch_messages(orderset: OrderSet, batch_id: str, chunk: int, allow_partial_fill: bool = False) -> List[dict]:
+    '''the messages for one batch, buy orders first then sell orders like the API sends them'''
+    totals = {"buyOrder.created": orderset.n_buy_orders, "sellOrder.created": orderset.n_sell_orders}
+    orders = [order_message(o) for o in orderset.iter_buy_orders()] + [order_message(o) for o in orderset.iter_sell_orders()]
+
+    if chunk <= 1:
+        return [{"type": m["type"], "message": {"totalMessageCount": totals[m["type"]], "batchId": batch_id, "allowPartialFill": allow_partial_fill, "message": m["message"]}} for m in orders]
+
+    return [
+        {"version": PROTOCOL_VERSION, "type": ORDER_BATCH_TYPE, "message": {
+            "totalBuyOrders": totals["buyOrder.created"], "totalSellOrders": totals["sellOrder.created"],
+            "batchId": batch_id, "allowPartialFill": allow_partial_fill, "messages": orders[i:i+chunk]
+        }}
+        for i in range(0, len(orders), chunk)
+    ]
+
+
+class MatchCollector:
+    '''API side subscriber: timestamps the match messages of every batch'''
+
+    def __init__(self):
+        self.first_match: Dict[str, float] = {}
+        self.last_match: Dict[str, float] = {}
+        self.n_matches: Dict[str, int] = {}
+        self.n_messages: Dict[str, int] = {}
+
+    async def __call__(self, payload: str):
+        data = json.loads(payload)
+        if data["type"] not in ("mate.match.batch", MATCH_DELTA_TYPE):
+            return
+
+        batch_id, now = data["message"]["batchId"], time.perf_counter()
+        self.first_match.setdefault(batch_id, now)
+        self.last_match[batch_id] = now
+        self.n_messages[batch_id] = self.n_messages.get(batch_id, 0) + 1
+        # full rounds count matches, delta rounds count changes
+        self.n_matches[batch_id] = self.n_matches.get(batch_id, 0) + len(data["message"].get("matches", data["message"].get("changes", [])))
+
+
+async def run_round(bus: LocalBus, messages: List[dict], rate: float) -> dict:
+    '''send `messages` at `rate` orders/s, wait for the round to be matched and published'''
+    n_orders = sum(len(m["message"].get("messages", [None])) for m in messages)
+    sent = 0
+
+    start = time.perf_counter()
+    for m in messages:
+        await bus.publish(None, data=m, topic=ORDERS_TOPIC)
+        sent += len(m["message"].get("messages", [None]))
+
+        # pace to the target rate
+        ahead = sent / rate - (time.perf_counter() - start)
+        if ahead > 0:
+            await asyncio.sleep(ahead)
+        else:
+            await asyncio.sleep(0)
+    last_sent = time.perf_counter()
+
+    await bus.drain()
+    return {"start": start, "last_sent": last_sent, "n_orders": n_orders}
+
+
+def percentiles(values: List[float]) -> str:
+    p50, p90, p99 = np.percentile(values, [50, 90, 99])
+    return f"p50 {p50*1000:9.1f}ms   p90 {p90*1000:9.1f}ms   p99 {p99*1000:9.1f}ms"
+
+
+async def main(args):
+    bus = LocalBus()
+    service = LocalMatchingEngineService(bus)
+    service.MODEL_CONFIG = {"unit_tcost": args.unit_tcost}
+    service.MATCH_BATCH_SIZE = args.match_batch_size
+    service.PUBLISH_DELTAS = args.deltas
+
+    collector = MatchCollector()
+    bus.subscribe(API_TOPIC, collector)
+
+    ingest, first_match, round_latency = [], [], []
+    for r in range(args.rounds):
+        batch_id = f"loadgen-{r}"
+        orderset = make_testcase(args.sellers, args.buyers, args.products, random_seed=0 if args.fixed_book else r).order_set
+        messages = batch_messages(orderset, batch_id, args.chunk, args.partial_fill)
+
+        stats = await run_round(bus, messages, args.rate)
+        if batch_id not in collector.last_match:
+            print(f"round {r}: no matches published for {stats['n_orders']} orders")
+            continue
+
+        ingest.append(stats["n_orders"] / (stats["last_sent"] - stats["start"]))
+        first_match.append(collector.first_match[batch_id] - stats["last_sent"])
+        round_latency.append(collector.last_match[batch_id] - stats["start"])
+        print(f"round {r}: {stats['n_orders']} orders, {len(messages)} messages, {collector.n_matches[batch_id]} {'changes' if args.deltas else 'matches'} in {collector.n_messages[batch_id]} messages")
+
+    if round_latency:
+        print(f"\ningest throughput   {np.mean(ingest):12.1f} orders/s")
+        print(f"time to first match {percentiles(first_match)}")
+        print(f"round latency       {percentiles(round_latency)}")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser(prog="python -m service.loadgen")
+    parser.add_argument("--rounds", type=int, default=5)
+    parser.add_argument("--buyers", type=int, default=20)
+    parser.add_argument("--sellers", type=int, default=20)
+    parser.add_argument("--products", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=1000, help="orders per second")
+    parser.add_argument("--chunk", type=int, default=1, help="orders per message, 1 sends the single order protocol")
+    parser.add_argument("--unit-tcost", type=float, default=1)
+    parser.add_argument("--match-batch-size", type=int, default=100)
+    parser.add_argument("--partial-fill", action="store_true", help="mark the batches as allowing partial fills")
+    parser.add_argument("--deltas", action="store_true", help="publish match deltas between rounds instead of every match")
+    parser.add_argument("--fixed-book", action="store_true", help="resend the same orders every round (a stable book)")
+    asyncio.run(main(parser.parse_args()))
@@ -8,5 +8,10 @@ setup(
     version='0.1.0',
     description='matching engine for field fresh',
     install_requires = deps,
+    # optional speedups and formats, each import is guarded: `pip install .[fast,arrow]`
+    extras_require = {
+        'fast': ['orjson>=3.4', 'ortools>=9.4'], # message decoding (service, ffengine.stream), min-cost flow (MinCostFlowEngine)
+        'arrow': ['pyarrow>=3.0'], # MatchSet.to_arrow
+    },
     packages=find_packages(exclude=['service', 'tests'])
 )
\ No newline at end of file
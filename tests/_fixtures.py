@@ -0,0 +1,21 @@
+## Small random OrderSets for the tests, kept tiny so they solve under a size limited gurobi licence
+
+from ffengine.simulation import TestCase
+
+
+def make_testcase(size_I: int, size_J: int, size_K: int, random_seed: int = 0) -> TestCase:
+    '''`size_I` sellers and `size_J` buyers over `size_K` products, prices around 100 + 50*k'''
+    I, J, K = list(range(size_I)), list(range(size_J)), list(range(size_K))
+    return TestCase(
+        size_I=size_I, size_J=size_J, size_K=size_K,
+        Q_K={k: 1/size_K for k in K}, P_K={k: 100 + 50*k for k in K},
+        D_scap_p={0: .7, 1: .3}, D_dcap_p={0: 1},
+        s_bounds=lambda c: (1,10) if c == 0 else (10, 20),
+        d_bounds=lambda c: (3, 7),
+        s_subsize={i: size_K for i in I},
+        lb_fn= lambda c, p: p - 10,
+        ub_fn= lambda c, p: p + 10,
+        dist_bounds= (3, 10),
+        unit_tcost=1,
+        random_seed=random_seed
+    )
@@ -0,0 +1,102 @@
+## Distance mode benchmark: the float32 chord screen ("screened") against the float64 haversine ("exact")
+# run from the repo root: `PYTHONPATH=. python tests/bench_distance.py [--orders 2000] [--products 3] [--repeat 5]`
+#
+# accuracy: the measured float32 chord error against the bound the screen relies on, and whether both modes of
+#           `feasible_pairs` give the same pairs and distances
+# throughput: U x V range check alone, then `feasible_pairs` in both modes, on a city sized and a country sized area
+# No solver is needed.
+
+import argparse
+import time
+
+import numpy as np
+
+from ffengine.optim._utils import (
+    EARTH_RADIUS_KM, CHORD_ABS_ERROR, CHORD_REL_ERROR,
+    distance_matrix, feasible_pairs, maybe_in_range, range_chord, unit_vectors,
+)
+
+AREAS = {
+    # name: (center lat, center long, half width in degrees, service range bounds km)
+    "city": (52.52, 13.40, 0.3, (2, 20)),
+    "country": (51.0, 10.0, 4.0, (20, 200)),
+}
+
+
+def random_columns(n: int, n_products: int, area: str, rng: np.random.Generator):
+    lat0, long0, width, (r_lo, r_hi) = AREAS[area]
+    def side(price_col):
+        return {
+            "lat": lat0 + rng.uniform(-width, width, n),
+            "long": long0 + rng.uniform(-width, width, n),
+            "int_product_id": rng.integers(0, n_products, n),
+            "time_activation": rng.integers(0, 50, n),
+            "time_expiry": rng.integers(50, 100, n),
+            price_col: rng.integers(100, 300, n),
+        }
+    buys, sells = side("max_price_cents"), side("min_price_cents")
+    sells["service_range"] = rng.uniform(r_lo, r_hi, n)
+    return buys, sells
+
+
+def best_of(fn, repeat: int) -> float:
+    times = []
+    for _ in range(repeat):
+        start = time.perf_counter()
+        fn()
+        times.append(time.perf_counter() - start)
+    return min(times)
+
+
+def chord_error(buys, sells, n: int = 1000) -> tuple:
+    '''largest |float32 chord - float64 chord| and the smallest margin left by the bound, over n x n pairs'''
+    a32, b32 = unit_vectors(buys["lat"][:n], buys["long"][:n]), unit_vectors(sells["lat"][:n], sells["long"][:n])
+    a64, b64 = unit_vectors(buys["lat"][:n], buys["long"][:n], np.float64), unit_vectors(sells["lat"][:n], sells["long"][:n], np.float64)
+
+    c32 = np.sqrt(sum((a32[:, i, None] - b32[None, :, i])**2 for i in range(3)).astype(np.float64))
+    c64 = np.sqrt(sum((a64[:, i, None] - b64[None, :, i])**2 for i in range(3)))
+    err = np.abs(c32 - c64)
+    bound = CHORD_ABS_ERROR + CHORD_REL_ERROR * c64
+    return err.max(), (bound - err).min(), bound.max()
+
+
+def main(args):
+    rng = np.random.default_rng(args.seed)
+
+    for area in AREAS:
+        buys, sells = random_columns(args.orders, args.products, area, rng)
+        print(f"{area}: {args.orders} buy x {args.orders} sell orders, {args.products} products")
+
+        max_err, min_margin, max_bound = chord_error(buys, sells)
+        print(f"  float32 chord error  max {max_err * EARTH_RADIUS_KM * 1e6:8.3f} mm, bound up to {max_bound * EARTH_RADIUS_KM * 1e6:.3f} mm, "
+              f"{'bound holds' if min_margin >= 0 else 'BOUND VIOLATED'}")
+
+        # the range check alone, every pair
+        exact = lambda: distance_matrix(buys["lat"], buys["long"], sells["lat"], sells["long"]) <= sells["service_range"][None, :]
+        screen = lambda: maybe_in_range(buys["lat"], buys["long"], sells["lat"], sells["long"], sells["service_range"])
+        in_range, maybe = exact(), screen()
+        assert not (in_range & ~maybe).any(), "the screen dropped a pair within range"
+        boundary = (maybe & ~in_range).sum()
+        t_exact, t_screen = best_of(exact, args.repeat), best_of(screen, args.repeat)
+        n_pairs = args.orders**2
+        print(f"  range check          exact {n_pairs / t_exact / 1e6:7.1f} Mpairs/s   screen {n_pairs / t_screen / 1e6:7.1f} Mpairs/s   x{t_exact / t_screen:.2f}, "
+              f"{boundary} of {in_range.sum()} screened pairs were out of range (re-checked exactly)")
+
+        # feasible_pairs end to end
+        u1, v1, d1 = feasible_pairs(buys, sells, "exact")
+        u2, v2, d2 = feasible_pairs(buys, sells, "screened")
+        same_pairs = np.array_equal(u1, u2) and np.array_equal(v1, v2)
+        max_d = np.abs(d1 - d2).max() if same_pairs and len(d1) else 0.
+        t_exact = best_of(lambda: feasible_pairs(buys, sells, "exact"), args.repeat)
+        t_screen = best_of(lambda: feasible_pairs(buys, sells, "screened"), args.repeat)
+        print(f"  feasible_pairs       exact {t_exact * 1e3:8.2f} ms   screened {t_screen * 1e3:8.2f} ms   x{t_exact / t_screen:.2f}, "
+              f"{len(u1)} pairs, {'same pairs' if same_pairs else 'DIFFERENT PAIRS'}, max distance difference {max_d:.2e} km")
+
+
+if __name__ == "__main__":
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=2000, help="buy and sell orders each")
+    parser.add_argument("--products", type=int, default=3)
+    parser.add_argument("--repeat", type=int, default=5)
+    parser.add_argument("--seed", type=int, default=0)
+    main(parser.parse_args())
@@ -0,0 +1,72 @@
+## Partial fill benchmark: MinCostFlowEngine against OMMEngine on TestCase data
+# run from the repo root: `PYTHONPATH=. python tests/bench_flow.py [--size 10] [--products 3] [--seeds 4]`
+#
+# OMM fills buy orders all or nothing, the flow engine may fill them partially, so the objectives are not the same
+# problem's: the table shows both (recomputed from the matches), the time each took and the share of demand filled.
+# Keep --size small with a size limited gurobi license.
+
+import argparse
+import time
+
+from ffengine.simulation import TestCase
+from ffengine.optim import OMMEngine, MinCostFlowEngine
+from ffengine.optim import _flow
+from ffengine.replay import matchset_objective
+
+
+def make_testcase(size: int, n_products: int, random_seed: int) -> TestCase:
+    I, J, K = list(range(size)), list(range(size)), list(range(n_products))
+    return TestCase(
+        size_I=size, size_J=size, size_K=n_products,
+        Q_K={k: 1/n_products for k in K}, P_K={k: [5, 2, 1][k % 3] for k in K},
+        D_scap_p={0: .7, 1: .3}, D_dcap_p={0: 1},
+        s_bounds=lambda c: (1,10) if c == 0 else (10, 20),
+        d_bounds=lambda c: (3, 7),
+        s_subsize={i: n_products for i in I},
+        lb_fn= lambda k, i: i - int(i > 1),
+        ub_fn= lambda c, p: p + 1,
+        dist_bounds= (3, 10),
+        unit_tcost=1,
+        random_seed=random_seed
+    )
+
+
+def run(engine) -> float:
+    start = time.perf_counter()
+    engine.construct_params()
+    engine.match()
+    engine.get_matches()
+    return time.perf_counter() - start
+
+
+def filled(matchset, orderset) -> float:
+    demand = sum(o.quantity for o in orderset.iter_buy_orders())
+    return sum(m.quantity for m in matchset.iter_matches()) / demand if demand else 0.
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--size', type=int, default=10, help='buyers and sellers')
+    parser.add_argument('--products', type=int, default=3)
+    parser.add_argument('--unit-tcost', type=float, default=1)
+    parser.add_argument('--seeds', type=int, default=4)
+    args = parser.parse_args()
+
+    print(f"flow solver: {'ortools' if _flow.min_cost_flow is not None else 'gurobi simplex'}\n")
+    print(f"{'seed':>4}{'pairs':>7}{'OMM obj':>10}{'flow obj':>10}{'OMM s':>8}{'flow s':>8}{'speedup':>9}{'OMM fill':>10}{'flow fill':>11}")
+    for seed in range(args.seeds):
+        orderset = make_testcase(args.size, args.products, seed).order_set
+
+        omm = OMMEngine(orderset, unit_tcost=args.unit_tcost)
+        t_omm = run(omm)
+        flow = MinCostFlowEngine(orderset, unit_tcost=args.unit_tcost)
+        t_flow = run(flow)
+
+        print(f"{seed:>4}{len(flow._pair_u) + flow.n_pruned:>7}"
+              f"{matchset_objective(omm.matchset, args.unit_tcost):>10.1f}{matchset_objective(flow.matchset, args.unit_tcost):>10.1f}"
+              f"{t_omm:>8.3f}{t_flow:>8.3f}{t_omm / t_flow:>8.1f}x"
+              f"{filled(omm.matchset, orderset):>10.1%}{filled(flow.matchset, orderset):>11.1%}")
+
+
+if __name__ == '__main__':
+    main()
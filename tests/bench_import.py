@@ -0,0 +1,51 @@
+## Import time benchmark: cold start cost of the modules a matching worker or CLI imports
+# run from the repo root: `PYTHONPATH=. python tests/bench_import.py [--repeat N]`
+#
+# Every import runs in a fresh interpreter. Reported times are the median wall time of `python -c "import <module>"`
+# minus an empty interpreter start, and the heavy dependencies that ended up loaded by the import.
+
+import argparse
+import statistics
+import subprocess
+import sys
+import time
+
+MODULES = [
+    'ffengine.data',
+    'ffengine.optim',
+    'ffengine.optim.engines',
+    'ffengine.simulation',
+    'ffengine.replay',
+]
+
+HEAVY = ['gurobipy', 'matplotlib', 'seaborn', 'pandas', 'debugpy']
+
+REPORT = "import sys; print(','.join(m for m in {heavy} if m in sys.modules))"
+
+
+def timed_run(code: str) -> float:
+    start = time.perf_counter()
+    subprocess.run([sys.executable, '-c', code], check=True, stdout=subprocess.DEVNULL)
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--repeat', type=int, default=5)
+    args = parser.parse_args()
+
+    baseline = statistics.median(timed_run('pass') for _ in range(args.repeat))
+    print(f"interpreter start: {baseline*1000:.1f}ms\n")
+    print(f"{'module':<28}{'import (ms)':>12}   heavy dependencies loaded")
+
+    for module in MODULES:
+        t = statistics.median(timed_run(f'import {module}') for _ in range(args.repeat)) - baseline
+        loaded = subprocess.run(
+            [sys.executable, '-c', f'import {module}; ' + REPORT.format(heavy=HEAVY)],
+            check=True, capture_output=True, text=True
+        ).stdout.strip()
+        print(f"{module:<28}{t*1000:>12.1f}   {loaded or '-'}")
+
+
+if __name__ == '__main__':
+    main()
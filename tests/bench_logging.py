@@ -0,0 +1,108 @@
+## Logging overhead benchmark: service ingest throughput with the service's logs written in the event loop or by the
+## background writer, unsampled or sampled
+# run from the repo root: `PYTHONPATH=. python tests/bench_logging.py [--orders 20000] [--batch-orders 300] [--chunk 1] [--log-file /tmp/mate.log]`
+#
+# Order messages go through a LocalBus into the service as fast as it takes them, spread over batches of
+# ~--batch-orders orders. The batch totals are one order more than what is sent, so no batch completes and only
+# ingestion (parsing, adding the orders, logging) is timed. Modes, from the old behaviour to the default:
+#
+#   sync-debug     every record formatted and written on the event loop (what `print` per order did)
+#   queue-debug    every record, formatted and written by the writer thread
+#   queue-sampled  DEBUG, with 1% of "order received" / "orders received" / "orders added" / "batch progress"
+#   queue-info     INFO, the default: per order records are not even created
+#
+# "drain" is the time the writer needed after the last message to empty its queue.
+#
+# Writing to a local file is buffered and cheap, what stalls the event loop are writes that block: a pipe to a slow
+# reader, a terminal, a container log driver. --write-latency-us makes every write block (sleeping, so without the
+# GIL) that long to model them. With one core and no blocking, the writer thread only competes with the event loop.
+
+import argparse
+import asyncio
+import logging
+import time
+
+from service._logging import setup_logging
+from service._localbus import LocalBus, LocalMatchingEngineService
+from service.app import ORDERS_TOPIC
+from service.loadgen import make_testcase, batch_messages
+
+SAMPLE = "order received=0.01,orders received=0.01,orders added=0.01,batch progress=0.01"
+MODES = {
+    "sync-debug": dict(level="DEBUG", sync=True),
+    "queue-debug": dict(level="DEBUG", sync=False),
+    "queue-sampled": dict(level="DEBUG", sync=False, sample=SAMPLE),
+    "queue-info": dict(level="INFO", sync=False),
+}
+
+
+class SlowStream:
+    '''a file whose writes block for `latency` seconds'''
+
+    def __init__(self, f, latency: float):
+        self.f, self.latency = f, latency
+
+    def write(self, data: str):
+        if self.latency:
+            time.sleep(self.latency)
+        return self.f.write(data)
+
+    def flush(self):
+        self.f.flush()
+
+
+def make_messages(n_orders: int, batch_orders: int, chunk: int, prefix: str) -> list:
+    size = max(2, batch_orders // 6) # TestCase orders: ~ size buyers and size sellers x 3 products
+    orderset = make_testcase(size, size, 3, random_seed=0).order_set
+    n_batches = max(1, round(n_orders / len(orderset)))
+    messages = [m for b in range(n_batches) for m in batch_messages(orderset, f"{prefix}-{b}", chunk)]
+    for m in messages:
+        # never complete: no solving in the measurement
+        if "totalMessageCount" in m["message"]:
+            m["message"]["totalMessageCount"] += 1
+        else:
+            m["message"]["totalBuyOrders"] += 1
+    return messages
+
+
+async def ingest(messages: list) -> float:
+    bus = LocalBus()
+    LocalMatchingEngineService(bus)
+    start = time.perf_counter()
+    for m in messages:
+        await bus.publish(None, data=m, topic=ORDERS_TOPIC)
+        await asyncio.sleep(0)
+    await bus.drain()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--orders", type=int, default=20000)
+    parser.add_argument("--batch-orders", type=int, default=300, help="orders per batch")
+    parser.add_argument("--chunk", type=int, default=1, help="orders per message, 1 = the single order protocol")
+    parser.add_argument("--log-file", default="/tmp/mate-bench.log")
+    parser.add_argument("--modes", nargs="+", default=list(MODES), choices=list(MODES))
+    parser.add_argument("--write-latency-us", type=float, default=0, help="blocking time of every log write")
+    parser.add_argument("--queue-size", type=int, default=1_000_000, help="large enough that no record is dropped")
+    args = parser.parse_args()
+
+    print(f"{'mode':<16}{'orders':>8}{'orders/s':>12}{'drain ms':>10}{'log MB':>8}")
+    for r, mode in enumerate(args.modes):
+        messages = make_messages(args.orders, args.batch_orders, args.chunk, f"bench-{r}")
+        n_orders = sum(len(m["message"].get("messages", [None])) for m in messages)
+
+        with open(args.log_file, "w") as f:
+            log_setup = setup_logging(fmt="json", stream=SlowStream(f, args.write_latency_us * 1e-6), queue_size=args.queue_size, **MODES[mode])
+            seconds = asyncio.run(ingest(messages))
+            start = time.perf_counter()
+            log_setup.stop()
+            drain = time.perf_counter() - start
+            size = f.tell()
+        print(f"{mode:<16}{n_orders:>8}{n_orders / seconds:>12.0f}{drain * 1e3:>10.1f}{size / 2**20:>8.1f}")
+
+    logging.getLogger("mate").handlers.clear()
+
+
+if __name__ == "__main__":
+    main()
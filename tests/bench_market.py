@@ -0,0 +1,60 @@
+## Multi-round benchmark: engines on the same simulated market, orders arriving, carrying over and expiring
+# run from the repo root: `PYTHONPATH=. python tests/bench_market.py [--rounds 20] [--agents 10] [--rate 0.1] [--engines OMMEngine ...]`
+#
+# Every engine sees the same arrivals (same seed), so fill rates only differ where the engines' matches do and the
+# book diverges. OMMEngine and LPRoundingEngine rebuild their model from a snapshot of the book every round,
+# IncrementalOMMEngine updates one model from the book's churn. Keep --agents and --rate small with a size limited
+# gurobi license.
+
+import argparse
+
+from ffengine.simulation import MarketSimulation
+from ffengine import optim
+
+
+def make_simulation(n_agents: int, n_products: int, rate: float, round_seconds: int, random_seed: int) -> MarketSimulation:
+    I, K = list(range(n_agents)), list(range(n_products))
+    return MarketSimulation(
+        size_I=n_agents, size_J=n_agents, size_K=n_products,
+        Q_K={k: 1/n_products for k in K}, P_K={k: [5, 2, 1][k % 3] for k in K},
+        D_scap_p={0: .7, 1: .3}, D_dcap_p={0: 1},
+        s_bounds=lambda c: (1,10) if c == 0 else (10, 20),
+        d_bounds=lambda c: (3, 7),
+        s_subsize={i: n_products for i in I},
+        lb_fn= lambda k, i: i - int(i > 1),
+        ub_fn= lambda c, p: p + 1,
+        dist_bounds= (3, 10),
+        unit_tcost=1,
+        buy_rate=rate, sell_rate=0.8 * rate, round_seconds=round_seconds, window_bounds=(round_seconds, 5 * round_seconds),
+        random_seed=random_seed
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--rounds", type=int, default=20)
+    parser.add_argument("--agents", type=int, default=10, help="buyers and sellers each")
+    parser.add_argument("--products", type=int, default=3)
+    parser.add_argument("--rate", type=float, default=0.1, help="buy orders per second, sell orders arrive at 0.8x")
+    parser.add_argument("--round-seconds", type=int, default=60)
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--engines", nargs="+", default=["OMMEngine", "IncrementalOMMEngine", "LPRoundingEngine"])
+    parser.add_argument("--verbose", action="store_true", help="print every round")
+    args = parser.parse_args()
+
+    summaries = []
+    for name in args.engines:
+        simulation = make_simulation(args.agents, args.products, args.rate, args.round_seconds, args.seed)
+        report = simulation.run(getattr(optim, name), n_rounds=args.rounds)
+        if args.verbose:
+            print(report.format())
+        summaries.append(report.summary())
+
+    print(f"{'engine':<22}{'buy fill':>9}{'expired':>8}{'book':>7}{'p50 ms':>9}{'p95 ms':>9}{'orders/s':>10}")
+    for s in summaries:
+        print(f"{s['engine']:<22}{s['buy_fill_rate']:>9.1%}{s['expired_buy']:>8}{s['mean_book_orders']:>7.1f}"
+              f"{s['latency_p50_s'] * 1e3:>9.1f}{s['latency_p95_s'] * 1e3:>9.1f}{s['throughput']:>10.0f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,89 @@
+## Sharding benchmark: how much objective ShardedEngine gives up against one OMM over the whole OrderSet, and how long each takes
+# run from the repo root: `PYTHONPATH=. python tests/bench_sharding.py [--sites 24] [--width-km 400] [--target 16 32] [--workers 2]`
+#
+# Orders are spread uniformly over a `--width-km` square so that shards are actually geographic (TestCase puts
+# everything around one point). Keep the sizes small with a size limited gurobi license.
+
+import argparse
+import time
+
+import numpy as np
+
+from ffengine.data import OrderSet, BuyOrder, SellOrder
+from ffengine.optim import OMMEngine, ShardedEngine, ProcessPoolTransport
+from ffengine.replay import matchset_objective
+
+
+def make_orderset(n_sites: int, width_km: float, n_products: int, service_range: float, random_seed: int) -> OrderSet:
+    '''one buy and one sell order per site, uniformly spread over a square around (45, 0)'''
+    rng = np.random.default_rng(random_seed)
+    deg = width_km / 111.2
+    orderset = OrderSet()
+
+    for i in range(n_sites):
+        lat, long = 45 + rng.uniform(0, deg), rng.uniform(0, deg) / np.cos(np.radians(45))
+        product, price = int(rng.integers(n_products)), int(rng.integers(90, 110))
+        orderset.add_buy_order(BuyOrder(
+            order_id=f"b{i}", buyer_id=f"buyer{i}", product_id=f"p{product}",
+            max_price_cents=price + int(rng.integers(0, 30)), quantity=int(rng.integers(1, 5)),
+            time_activation=0, time_expiry=10, lat=lat, long=long
+        ))
+
+        lat, long = 45 + rng.uniform(0, deg), rng.uniform(0, deg) / np.cos(np.radians(45))
+        product = int(rng.integers(n_products))
+        orderset.add_sell_order(SellOrder(
+            order_id=f"s{i}", seller_id=f"seller{i}", product_id=f"p{product}",
+            min_price_cents=price - int(rng.integers(0, 30)), quantity=int(rng.integers(2, 10)),
+            time_activation=0, time_expiry=10, lat=lat, long=long, service_range=service_range
+        ))
+
+    return orderset
+
+
+def run(engine) -> float:
+    start = time.perf_counter()
+    engine.construct_params()
+    engine.match()
+    engine.get_matches()
+    return time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument('--sites', type=int, default=24)
+    parser.add_argument('--width-km', type=float, default=400)
+    parser.add_argument('--products', type=int, default=3)
+    parser.add_argument('--service-range', type=float, default=60)
+    parser.add_argument('--unit-tcost', type=float, default=0.1)
+    parser.add_argument('--target', type=int, nargs='+', default=[16, 32])
+    parser.add_argument('--workers', type=int, default=0, help='worker processes, 0 solves the shards in this process')
+    parser.add_argument('--seeds', type=int, default=3)
+    args = parser.parse_args()
+
+    transport = ProcessPoolTransport(args.workers) if args.workers else None
+
+    print(f"{'seed':>4}{'target':>8}{'shards':>8}{'boundary':>10}{'OMM obj':>12}{'sharded obj':>13}{'gap %':>8}{'OMM s':>8}{'sharded s':>11}")
+    for seed in range(args.seeds):
+        orderset = make_orderset(args.sites, args.width_km, args.products, args.service_range, seed)
+
+        full = OMMEngine(orderset, unit_tcost=args.unit_tcost)
+        t_full = run(full)
+
+        for target in args.target:
+            sharded = ShardedEngine(orderset, unit_tcost=args.unit_tcost, target_orders=target, transport=transport)
+            t_sharded = run(sharded)
+
+            # recompute from the matches, so the gap does not rely on the engines' own bookkeeping
+            obj_full = matchset_objective(full.matchset, args.unit_tcost)
+            obj_sharded = matchset_objective(sharded.matchset, args.unit_tcost)
+            gap = 100 * (obj_full - obj_sharded) / obj_full if obj_full else 0.
+
+            print(f"{seed:>4}{target:>8}{sharded.stats['n_shards']:>8}{sharded.stats['n_boundary_sells']:>10}"
+                  f"{obj_full:>12.1f}{obj_sharded:>13.1f}{gap:>8.2f}{t_full:>8.2f}{t_sharded:>11.2f}")
+
+    if transport is not None:
+        transport.close()
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,107 @@
+## Shard transfer benchmark: what handing one shard to a worker process costs, per task, in bytes and latency
+# run from the repo root: `PYTHONPATH=. python tests/bench_shm.py [--sites 2000 8000] [--target 400] [--workers 2]`
+#
+#   orderset   a pickled sub OrderSet per shard (ShardedEngine without shared memory), the worker builds its columns
+#   params     the shard's OMM `_params` dicts pickled (U*V tuple keys), what shipping built parameters would cost
+#   shm        one SharedArrays block for the whole OrderSet, the task is its handle and a shard number, the worker
+#              attaches and copies its shard's rows out (ShardedEngine with shared memory)
+#
+# Latency is submit to result through a ProcessPoolExecutor with one task in flight (median), solving is left out
+# so only the transfer is measured. "unpack" is the part of it the worker spends turning the task into columns: the
+# columns of the sub OrderSet, or the copy of the shard's rows out of the block. Every mode but params then builds the
+# shard's OMM parameters in the worker, that cost is reported per shard as "build params". No solver is needed.
+
+import argparse
+import pickle
+import statistics
+import time
+from concurrent.futures import ProcessPoolExecutor
+
+from bench_sharding import make_orderset
+from ffengine.data.orders import IdIndex
+from ffengine.optim import OMMEngine
+from ffengine.optim._sharding import GridPartitioner, build_suborderset, share_shards, _read_shard
+
+
+# each returns the seconds it spent unpacking its task
+def receive_orderset(orderset) -> float:
+    start = time.perf_counter()
+    orderset.get_buy_columns(), orderset.get_sell_columns()
+    return time.perf_counter() - start
+
+def receive_params(params) -> float:
+    return 0.
+
+def receive_shm(task) -> float:
+    handle, shard = task
+    arrays, shm = handle.attach()
+    try:
+        start = time.perf_counter()
+        _read_shard(arrays, shard)
+        return time.perf_counter() - start
+    finally:
+        del arrays
+        shm.close()
+
+
+def measure(executor, fn, tasks) -> dict:
+    sizes = [len(pickle.dumps(t)) for t in tasks]
+    latencies, unpack = [], []
+    for task in tasks:
+        start = time.perf_counter()
+        unpack.append(executor.submit(fn, task).result())
+        latencies.append(time.perf_counter() - start)
+    return {"bytes": statistics.mean(sizes), "latency": statistics.median(latencies), "unpack": statistics.median(unpack)}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sites", type=int, nargs="+", default=[2000, 8000], help="buy and sell orders each")
+    parser.add_argument("--width-km", type=float, default=400)
+    parser.add_argument("--service-range", type=float, default=30)
+    parser.add_argument("--target", type=int, default=400, help="orders per shard")
+    parser.add_argument("--workers", type=int, default=2)
+    parser.add_argument("--max-shards", type=int, default=20, help="shards measured per mode")
+    args = parser.parse_args()
+
+    with ProcessPoolExecutor(max_workers=args.workers) as executor:
+        executor.submit(len, []).result() # start the workers outside the measurements
+
+        for n_sites in args.sites:
+            orderset = make_orderset(n_sites, args.width_km, 3, args.service_range, 0)
+            part = GridPartitioner(args.service_range, args.target).partition(orderset)
+            shard_buys, shard_sells = IdIndex.from_keys(part["buy_shard"]), IdIndex.from_keys(part["sell_shard"])
+            shards = range(min(part["n_shards"], args.max_shards))
+
+            subs = [build_suborderset(orderset, shard_buys.get(s).tolist(), shard_sells.get(s).tolist())[0] for s in shards]
+            params, build_times = [], []
+            for sub in subs:
+                matcher = OMMEngine(sub, unit_tcost=1)
+                start = time.perf_counter()
+                matcher.construct_params()
+                build_times.append(time.perf_counter() - start)
+                params.append(matcher._params)
+
+            start = time.perf_counter()
+            shared = share_shards(orderset, shard_buys, shard_sells, part["n_shards"])
+            share_time = time.perf_counter() - start
+
+            try:
+                results = {
+                    "orderset": measure(executor, receive_orderset, subs),
+                    "params": measure(executor, receive_params, params),
+                    "shm": measure(executor, receive_shm, [(shared.handle, s) for s in shards]),
+                }
+            finally:
+                shared.close()
+
+            print(f"{2 * n_sites} orders, {part['n_shards']} shards of ~{2 * n_sites / part['n_shards']:.0f} orders "
+                  f"(shared block {shared.nbytes / 2**20:.2f} MiB, written once in {share_time * 1e3:.1f} ms)")
+            for mode, r in results.items():
+                print(f"  {mode:<10}{r['bytes'] / 1024:>12.1f} KiB/task{r['latency'] * 1e3:>10.2f} ms/task"
+                      f"{r['unpack'] * 1e3:>10.2f} ms unpack")
+            print(f"  build params{statistics.median(build_times) * 1e3:>10.2f} ms/shard in the worker (orderset and shm modes)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,121 @@
+## OrderBook: churn between rounds (adds, removals, expiry) and carrying matched orders over, and the incremental
+# engine on top of it against a fresh OMM of the same book
+
+from dataclasses import replace
+
+import pytest
+
+from ffengine.data import MatchSet
+from ffengine.data.book import OrderBook
+from ffengine.data.matches import Match
+from _fixtures import make_testcase
+
+
+def make_book():
+    source = make_testcase(4, 4, 2, random_seed=0).order_set
+    book = OrderBook()
+    for u in source.iter_buy_orders():
+        book.add_buy_order(replace(u))
+    for v in source.iter_sell_orders():
+        book.add_sell_order(replace(v))
+    return source, book
+
+
+def test_churn():
+    source, book = make_book()
+    changes = book.pop_changes()
+    assert changes["added_buy"] == set(range(source.n_buy_orders)) and changes["added_sell"] == set(range(source.n_sell_orders))
+    assert book.pop_changes() == {"added_buy": set(), "added_sell": set(), "removed_buy": set(), "removed_sell": set(), "changed_sell": set()}
+
+    # removed after the consumer saw it: logged. Added and removed within one round: never reaches the consumer
+    first = book.get_buy_order(0)
+    book.remove_order(first.order_id)
+    extra = replace(source.get_buy_order(1), order_id="extra")
+    book.add_buy_order(extra)
+    book.remove_order("extra")
+    changes = book.pop_changes()
+    assert changes["removed_buy"] == {0} and changes["added_buy"] == set()
+    assert first.order_id not in book and len(book) == source.total_orders - 1
+
+    # int ids are never reused
+    book.add_buy_order(replace(first))
+    assert book[first.order_id].int_order_id == source.n_buy_orders + 1
+
+
+def test_expire():
+    source, book = make_book()
+    book.pop_changes()
+    now = sorted(o.time_expiry for o in book.iter_buy_orders())[1] + 1 # the two buy orders expiring first, at least
+
+    expired = book.expire(now)
+    assert expired and all(o.time_expiry < now for o in expired)
+    assert all(o.time_expiry >= now for o in [*book.iter_buy_orders(), *book.iter_sell_orders()])
+    assert len(book) == source.total_orders - len(expired)
+    assert book.expire(now) == [] # the heap entries of removed orders are skipped
+
+
+def test_apply_matches():
+    _, book = make_book()
+    book.pop_changes()
+    buy, sell = book.get_buy_order(0), next(v for v in book.iter_sell_orders() if v.quantity > book.get_buy_order(0).quantity)
+    other = book.get_buy_order(1)
+
+    matches = MatchSet()
+    matches.add_match(Match(buy_order=buy, sell_order=sell, price_cents=100, quantity=buy.quantity))
+    book.apply_matches(matches)
+
+    # the buy order is filled and leaves, the sell order carries its remaining quantity into the next round
+    assert buy.order_id not in book and other.order_id in book
+    assert book[sell.order_id].quantity == sell.quantity - buy.quantity
+    assert next(matches.iter_matches()).sell_order.quantity == sell.quantity # matches keep the order as matched
+    changes = book.pop_changes()
+    assert changes["removed_buy"] == {buy.int_order_id} and changes["changed_sell"] == {sell.int_order_id}
+
+    # a fully used sell order leaves too
+    matches = MatchSet()
+    remaining = book[sell.order_id]
+    matches.add_match(Match(buy_order=other, sell_order=remaining, price_cents=100, quantity=remaining.quantity))
+    book.apply_matches(matches)
+    assert sell.order_id not in book and book.pop_changes()["removed_sell"] == {sell.int_order_id}
+
+    snapshot = book.to_orderset()
+    assert snapshot.total_orders == len(book)
+    assert {o.order_id for o in snapshot.iter_sell_orders()} == {o.order_id for o in book.iter_sell_orders()}
+
+
+def seller_profit(matches, unit_tcost):
+    '''the OMM objective of a matching: revenue minus the transaction cost of every pair used'''
+    from ffengine.optim._utils import distance
+    return sum(
+        m.price_cents * m.quantity - unit_tcost * distance((m.buy_order.lat, m.buy_order.long), (m.sell_order.lat, m.sell_order.long))
+        for m in matches.iter_matches()
+    )
+
+
+def test_incremental_engine_matches_fresh_omm():
+    pytest.importorskip("gurobipy")
+    from ffengine.optim.engines import OMMEngine, IncrementalOMMEngine
+
+    book = OrderBook()
+    engine = IncrementalOMMEngine(book, unit_tcost=1)
+    for r in range(4):
+        # churn: a few new orders of both sides every round, and one old buy order cancelled
+        arrivals = make_testcase(3, 3, 2, random_seed=r).order_set
+        for u in arrivals.iter_buy_orders():
+            book.add_buy_order(replace(u, order_id=f"r{r}-{u.order_id}"))
+        for v in arrivals.iter_sell_orders():
+            book.add_sell_order(replace(v, order_id=f"r{r}-{v.order_id}"))
+        if r > 1:
+            book.remove_order(next(book.iter_buy_orders()).order_id)
+
+        fresh = OMMEngine(book.to_orderset(), unit_tcost=1)
+        fresh.construct_params()
+        fresh.match()
+        expected = seller_profit(fresh.get_matches(), 1)
+
+        engine.construct_params()
+        engine.match()
+        matches = engine.get_matches()
+        assert matches.n_matches and seller_profit(matches, 1) == pytest.approx(expected), f"round {r}"
+
+        book.apply_matches(matches)
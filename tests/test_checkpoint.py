@@ -0,0 +1,93 @@
+## Checkpoint log of in-flight batches: v1 totals across META records, torn records, restore through the service
+
+import asyncio
+import json
+import os
+from dataclasses import replace
+
+from ffengine.data.messages import parse_orders_message
+from service._checkpoint import BatchCheckpoint, read_log
+from service._localbus import LocalBus, LocalMatchingEngineService
+from service.app import API_TOPIC
+from service.loadgen import batch_messages
+from _fixtures import make_testcase
+
+
+def interleaved_v1_chunks(batch_id):
+    '''(orders, batch_info) of a v1 batch whose buy and sell messages alternate'''
+    orderset = make_testcase(4, 4, 2, random_seed=0).order_set
+    messages = batch_messages(orderset, batch_id, chunk=1)
+    buys, sells = messages[:orderset.n_buy_orders], messages[orderset.n_buy_orders:]
+    interleaved = [m for pair in zip(buys, sells) for m in pair] + buys[len(sells):] + sells[len(buys):]
+    return orderset, [parse_orders_message(m) for m in interleaved]
+
+
+def write_log(root, batch_id, chunks):
+    checkpoint = BatchCheckpoint(root)
+    for orders, batch_info in chunks:
+        checkpoint.append(batch_id, batch_info, [o for _, o in orders])
+    checkpoint.close()
+    return os.path.join(root, f"{batch_id}.ckpt")
+
+
+def test_v1_totals_merge(tmp_path):
+    orderset, chunks = interleaved_v1_chunks("b1")
+    batch_info, orders = read_log(write_log(str(tmp_path), "b1", chunks))
+
+    # every v1 META only has its own side's total, the restored batch needs both
+    assert batch_info["totalOrders"] == {"buyOrder.created": orderset.n_buy_orders, "sellOrder.created": orderset.n_sell_orders}
+    assert [o.order_id for _, o in orders] == [o.order_id for chunk, _ in chunks for _, o in chunk]
+
+
+def test_torn_record(tmp_path):
+    _, chunks = interleaved_v1_chunks("b1")
+    path = write_log(str(tmp_path), "b1", chunks)
+    _, orders = read_log(path)
+
+    with open(path, "r+b") as f:
+        f.truncate(os.path.getsize(path) - 5) # a crash in the middle of the last record
+    _, torn = read_log(path)
+    assert [o.order_id for _, o in torn] == [o.order_id for _, o in orders[:-1]]
+
+
+def test_bad_chunk_is_skipped(tmp_path, caplog):
+    _, chunks = interleaved_v1_chunks("b1")
+    (_, first), batch_info = chunks[0][0][0], chunks[0][1]
+    bad = replace(first, order_id="bad", quantity=2**64) # does not fit the record's int64
+
+    checkpoint = BatchCheckpoint(str(tmp_path))
+    checkpoint.append("b1", batch_info, [bad])
+    checkpoint.append("b1", batch_info, [first]) # the writer is still there
+    checkpoint.close()
+
+    _, orders = read_log(str(tmp_path / "b1.ckpt"))
+    assert [o.order_id for _, o in orders] == [first.order_id]
+    assert "chunk skipped" in caplog.text
+
+
+def test_restore_completes_batch(tmp_path):
+    orderset, chunks = interleaved_v1_chunks("b1")
+    write_log(str(tmp_path), "b1", chunks[:-1]) # the service went down before the last order
+
+    async def run():
+        bus = LocalBus()
+        published = []
+        async def collect(payload):
+            published.append(json.loads(payload))
+        bus.subscribe(API_TOPIC, collect)
+
+        service = LocalMatchingEngineService(bus)
+        service.checkpoint = BatchCheckpoint(str(tmp_path))
+        await service._start_service()
+        assert "b1" in service.ordersets # restored, still waiting for the last order
+
+        orders, batch_info = chunks[-1]
+        await service.handle_orders(orders, batch_info)
+        await bus.drain()
+        await service._stop_service()
+        return service, published
+
+    service, published = asyncio.run(run())
+    assert "b1" not in service.ordersets
+    assert any(m["message"].get("batchId") == "b1" for m in published)
+    assert not os.path.exists(os.path.join(str(tmp_path), "b1.ckpt")) # discarded once the matches are out
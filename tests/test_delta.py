@@ -0,0 +1,30 @@
+## Delta publishing: the changes between a market's published matches and the next round's
+
+from service._delta import PublishedMatches
+
+
+def record(buy, sell, volume, price=100.):
+    return {"matchId": 0, "buyOrder": buy, "sellOrder": sell, "volume": volume, "priceCents": price}
+
+
+def ops(changes):
+    return sorted((c["op"], c["buyOrder"], c["sellOrder"]) for c in changes)
+
+
+def test_update():
+    published = PublishedMatches()
+    first = [record("b1", "s1", 3), record("b2", "s1", 2), record("b3", "s2", 1)]
+    assert ops(published.update(first)) == [("new", "b1", "s1"), ("new", "b2", "s1"), ("new", "b3", "s2")]
+
+    # b1-s1 same, b2-s1 new volume, b3-s2 new price, b3-s1 gone to another seller
+    second = [record("b1", "s1", 3), record("b2", "s1", 4), record("b3", "s2", 1, price=110.), record("b4", "s2", 1)]
+    changes = published.update(second)
+    assert ops(changes) == [("changed", "b2", "s1"), ("changed", "b3", "s2"), ("new", "b4", "s2")]
+    assert next(c for c in changes if c["buyOrder"] == "b2")["volume"] == 4
+
+    changes = published.update([record("b1", "s1", 3)])
+    assert ops(changes) == [("cancelled", "b2", "s1"), ("cancelled", "b3", "s2"), ("cancelled", "b4", "s2")]
+    assert set(next(iter(changes))) == {"op", "buyOrder", "sellOrder"} # cancellations only name the pair
+    assert len(published) == 1
+
+    assert published.update([record("b1", "s1", 3)]) == [] # nothing to publish
@@ -0,0 +1,58 @@
+## AsyncAPITester against the stub API: retries, and no order created twice by a retried POST
+
+import asyncio
+
+import pytest
+from aiohttp import web
+
+from service._stubapi import StubAPI
+from service.ffapi import AsyncAPITester
+from _fixtures import make_testcase
+
+
+def seed(stub: StubAPI, orderset, **kwargs):
+    '''fill `orderset` into `stub` through a local server, returns the tester'''
+    async def run():
+        runner = web.AppRunner(stub.app())
+        await runner.setup()
+        site = web.TCPSite(runner, "127.0.0.1", 0)
+        await site.start()
+        port = runner.addresses[0][1]
+        config = {"api-url": f"http://127.0.0.1:{port}", "test-user": "test@example.com", "test-user-pwd": "pwd"}
+        try:
+            async with AsyncAPITester(config, orders_per_request=3, backoff_seconds=0, **kwargs) as api:
+                await api.signin()
+                await api.fill_test_data(orderset)
+                return api
+        finally:
+            await runner.cleanup()
+
+    return asyncio.run(run())
+
+
+def test_fill_test_data():
+    orderset = make_testcase(4, 4, 2, random_seed=0).order_set
+    stub = StubAPI(n_products=2)
+    seed(stub, orderset)
+
+    assert len(stub.buy_orders) == orderset.n_buy_orders and len(stub.sell_orders) == orderset.n_sell_orders
+    assert set(o.order_id for o in orderset.iter_buy_orders()) == set(stub.buy_orders)
+
+
+def test_lost_responses_with_idempotency_keys():
+    orderset = make_testcase(4, 4, 2, random_seed=0).order_set
+    stub = StubAPI(n_products=2, fail_every=3, fail_after=True) # every third request is handled, then answered 503
+    api = seed(stub, orderset, idempotent_posts=True)
+
+    assert api.n_retries > 0
+    assert len(stub.buy_orders) == orderset.n_buy_orders and len(stub.sell_orders) == orderset.n_sell_orders
+    assert set(o.order_id for o in orderset.iter_sell_orders()) == set(stub.sell_orders)
+
+
+def test_posts_are_not_retried_without_idempotency_keys():
+    orderset = make_testcase(4, 4, 2, random_seed=0).order_set
+    stub = StubAPI(n_products=2, fail_every=3, fail_after=True)
+    with pytest.raises(AssertionError, match="503"):
+        seed(stub, orderset)
+    # nothing was sent twice: every stored order came from one request
+    assert len(stub.buy_orders) <= orderset.n_buy_orders and len(stub.sell_orders) <= orderset.n_sell_orders
@@ -0,0 +1,61 @@
+## Secondary indexes of OrderSet: by product, agent and activation time bucket, kept as orders are added
+
+import numpy as np
+
+from ffengine.data.orders import IdIndex, time_bucket
+from ffengine.data.storage import save_orderset, load_orderset
+from _fixtures import make_testcase
+
+
+def test_id_index():
+    index = IdIndex()
+    for i, key in enumerate("abacabaaa"):
+        index.add(key, i)
+    assert index.get("a").tolist() == [0, 2, 4, 6, 7, 8] # past the first resize
+    assert index.get("c").tolist() == [3] and index.get("z").tolist() == []
+    assert sorted(index.keys()) == ["a", "b", "c"] and len(index) == 3
+
+    bulk = IdIndex.from_keys(np.array(list("abacabaaa")))
+    assert all(bulk.get(k).tolist() == index.get(k).tolist() for k in "abcz")
+
+
+def scan(orders, attr, key=lambda x: x):
+    '''the index built by hand: key -> int order ids'''
+    by_key = {}
+    for o in orders:
+        by_key.setdefault(key(getattr(o, attr)), []).append(o.int_order_id)
+    return by_key
+
+
+def check_indexes(orderset):
+    buys, sells = list(orderset.iter_buy_orders()), list(orderset.iter_sell_orders())
+    for k, ids in scan(buys, "int_product_id").items():
+        assert orderset.get_buy_ids_by_product(k).tolist() == ids
+    for k, ids in scan(sells, "int_product_id").items():
+        assert orderset.get_sell_ids_by_product(k).tolist() == ids
+    for a, ids in scan(buys, "int_buyer_id").items():
+        assert orderset.get_buy_ids_by_agent(a).tolist() == ids
+    for a, ids in scan(sells, "int_seller_id").items():
+        assert orderset.get_sell_ids_by_agent(a).tolist() == ids
+    for b, ids in scan(buys, "time_activation", time_bucket).items():
+        assert orderset.get_buy_ids_by_time_bucket(b).tolist() == ids
+    for b, ids in scan(sells, "time_activation", time_bucket).items():
+        assert orderset.get_sell_ids_by_time_bucket(b).tolist() == ids
+
+    products = list(orderset.iter_products())
+    assert [k for k, _, _ in products] == sorted(set(scan(buys, "int_product_id")) & set(scan(sells, "int_product_id")))
+    for k, u, v in products:
+        assert u.tolist() == orderset.get_buy_ids_by_product(k).tolist() and v.tolist() == orderset.get_sell_ids_by_product(k).tolist()
+
+
+def test_orderset_indexes():
+    orderset = make_testcase(6, 5, 3, random_seed=0).order_set
+    check_indexes(orderset)
+
+
+def test_mapped_orderset_indexes(tmp_path):
+    orderset = make_testcase(6, 5, 3, random_seed=0).order_set
+    save_orderset(orderset, str(tmp_path / "orderset"))
+    loaded = load_orderset(str(tmp_path / "orderset"))
+    check_indexes(loaded) # bulk built from the columns
+    assert loaded.get_buy_ids_by_product(1).tolist() == orderset.get_buy_ids_by_product(1).tolist()
@@ -0,0 +1,25 @@
+## Service logging: sampling stays exact when records come from several threads
+
+import logging
+import threading
+
+from service._logging import SamplingFilter
+
+
+def test_sampling_from_threads():
+    sampler = SamplingFilter({"order received": 0.1})
+    kept = []
+
+    def log_many():
+        record = logging.LogRecord("mate.ingest", logging.DEBUG, __file__, 0, "order received", None, None)
+        kept.append(sum(sampler.filter(record) for _ in range(10_000)))
+
+    threads = [threading.Thread(target=log_many) for _ in range(8)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+    assert sum(kept) == 8 * 10_000 // 10
+
+    warning = logging.LogRecord("mate.ingest", logging.WARNING, __file__, 0, "order received", None, None)
+    assert all(sampler.filter(warning) for _ in range(10)) # never sampled
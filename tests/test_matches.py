@@ -0,0 +1,40 @@
+## Columnar MatchSet: bulk exports agree with the per-match `Match` views, single and bulk adds mix
+
+import json
+from dataclasses import replace
+
+import pytest
+
+from ffengine.data import MatchSet
+from ffengine.data.matches import Match
+from _fixtures import make_testcase
+
+
+def make_matches():
+    orderset = make_testcase(5, 4, 3, random_seed=0).order_set
+    matches = MatchSet.from_arrays(orderset, [0, 2], [1, 1], [120., 130.], [2, 3])
+    # a single match of an order as it was when matched, e.g. before an OrderBook changed its quantity
+    sell = replace(orderset.get_sell_order(3), quantity=1)
+    matches.add_match(Match(buy_order=orderset.get_buy_order(4), sell_order=sell, price_cents=95., quantity=1))
+    matches.add_matches([1], [0], [110.], [4])
+    return orderset, matches
+
+
+def test_bulk_exports_match_views():
+    orderset, matches = make_matches()
+    records = [m.to_dict() for m in matches.iter_matches()]
+
+    assert matches.n_matches == 4 and [r["matchId"] for r in records] == [0, 1, 2, 3]
+    assert matches.to_records() == records
+    assert json.loads(matches.to_json()) == records
+    assert [r["buyOrder"] for r in records] == [orderset.get_buy_order(u).order_id for u in (0, 2, 4, 1)]
+    assert list(matches.iter_matches())[2].sell_order.quantity == 1 # kept as matched
+    assert matches.to_columns()["quantity"].tolist() == [2, 3, 1, 4]
+
+
+def test_to_arrow():
+    pytest.importorskip("pyarrow")
+    _, matches = make_matches()
+    table = matches.to_arrow()
+    assert table.num_rows == matches.n_matches
+    assert table.column("buy_order_id").to_pylist() == [r["buyOrder"] for r in matches.to_records()]
@@ -0,0 +1,70 @@
+## IncrementalParams against OMMEngine.construct_params, whatever the order and chunking the orders arrive in
+
+import random
+
+import pytest
+
+from ffengine.data import OrderSet, BuyOrder
+from ffengine.optim import IncrementalParams, OMMEngine
+from _fixtures import make_testcase
+
+
+def arrivals(orderset, chunk, seed):
+    '''the orders of `orderset` shuffled, buy and sell mixed, in chunks of `chunk`'''
+    orders = list(orderset.iter_buy_orders()) + list(orderset.iter_sell_orders())
+    random.Random(seed).shuffle(orders)
+    return [orders[i:i+chunk] for i in range(0, len(orders), chunk)]
+
+
+@pytest.mark.parametrize("chunk", [1, 3, 100])
+def test_incremental_params_equal_construct_params(chunk):
+    source = make_testcase(6, 6, 3, random_seed=1).order_set
+
+    incremental = IncrementalParams(OrderSet(), unit_tcost=5)
+    for orders in arrivals(source, chunk, seed=chunk):
+        if chunk == 1:
+            incremental.add_buy_order(orders[0]) if isinstance(orders[0], BuyOrder) else incremental.add_sell_order(orders[0])
+        else:
+            assert incremental.add_orders(orders) == []
+    built = incremental.params
+
+    # the same orders in the same int ids, built at once
+    matcher = OMMEngine(incremental.orderset, unit_tcost=5)
+    matcher.construct_params()
+    expected = matcher._params
+
+    for name in ("BUYORDERS", "SELLORDERS", "p_u", "p_v", "q_u", "q_v"):
+        assert built[name] == expected[name]
+
+    buy_products = incremental.orderset.get_buy_columns()["int_product_id"]
+    sell_products = incremental.orderset.get_sell_columns()["int_product_id"]
+    assert any(expected["f_uv"].values())
+    for (u, v), feasible in expected["f_uv"].items():
+        assert built["f_uv"][u, v] == feasible
+        if buy_products[u] == sell_products[v]:
+            assert built["c_uv"][u, v] == pytest.approx(expected["c_uv"][u, v])
+        else:
+            assert (u, v) not in built["c_uv"] # other products are never compared
+
+
+def test_duplicates_are_rejected():
+    source = make_testcase(3, 3, 2, random_seed=0).order_set
+    incremental = IncrementalParams(OrderSet())
+    orders = list(source.iter_buy_orders())
+    assert incremental.add_orders(orders) == []
+    assert len(incremental.add_orders(orders[:2])) == 2
+    assert incremental.params["BUYORDERS"] == range(len(orders))
+
+
+def test_same_solution():
+    source = make_testcase(4, 4, 2, random_seed=2).order_set
+    incremental = IncrementalParams(OrderSet(), unit_tcost=1)
+    incremental.add_orders(o for chunk in arrivals(source, 5, seed=0) for o in chunk)
+
+    objectives = []
+    for params in (incremental, None):
+        matcher = OMMEngine(incremental.orderset, unit_tcost=1, params=params)
+        matcher.construct_params()
+        matcher.match()
+        objectives.append(matcher.objective)
+    assert objectives[0] == pytest.approx(objectives[1])
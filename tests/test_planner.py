@@ -0,0 +1,59 @@
+## EnginePlanner: the first strategy that fits the budgets, and a cost model calibrated from its decision log
+
+import json
+
+import pytest
+
+from ffengine.optim import EnginePlanner
+from ffengine.optim._planner import calibrate
+from _fixtures import make_testcase
+
+
+@pytest.fixture
+def orderset():
+    return make_testcase(20, 20, 2, random_seed=0).order_set
+
+
+def test_estimate(orderset):
+    est = EnginePlanner(sample_pairs=10**6).estimate(orderset) # small enough to check every pair
+    assert (est.n_buy, est.n_sell) == (orderset.n_buy_orders, orderset.n_sell_orders)
+    assert est.dense_vars == 2 * est.n_buy * est.n_sell + est.n_buy
+    assert 0 <= est.feasible_pairs <= est.same_product_pairs <= est.n_buy * est.n_sell
+    assert est.sparse_vars <= est.dense_vars and est.spread_km > 0
+
+
+def test_plan(orderset):
+    plan = EnginePlanner().plan(orderset)
+    assert (plan.strategy, plan.engine) == ("dense", "OMMEngine")
+    assert plan.model_vars == plan.estimate.dense_vars
+
+    # over the dense cap: shards of 10 orders
+    plan = EnginePlanner(dense_max_vars=100, shard_orders=10).plan(orderset)
+    assert (plan.strategy, plan.engine, plan.engine_kwargs) == ("sharded", "ShardedEngine", {"target_orders": 10})
+    est, n = plan.estimate, -(-orderset.total_orders // 10)
+    assert plan.model_vars == pytest.approx(n * (2 * (est.n_buy / n) * (est.n_sell / n) + est.n_buy / n))
+
+    # shards over the cap too, or too few orders to shard: the heuristic
+    plan = EnginePlanner(dense_max_vars=10, shard_orders=10).plan(orderset)
+    assert plan.strategy == "lp_rounding" and "falling back" in plan.reason
+    plan = EnginePlanner(latency_budget_s=0).plan(orderset)
+    assert plan.strategy == "lp_rounding" and "too small to shard" in plan.reason
+
+    plan = EnginePlanner().plan(orderset, allow_partial_fill=True)
+    assert (plan.strategy, plan.engine) == ("flow", "MinCostFlowEngine")
+
+
+def test_record_and_calibrate(orderset, tmp_path):
+    log_path = str(tmp_path / "decisions" / "log.jsonl")
+    planner = EnginePlanner(log_path=log_path)
+    plan = planner.plan(orderset)
+    for seconds in (1., 2., 6.):
+        planner.record("b/1", plan, {"construct_params": seconds / 2, "match": seconds / 2}, objective=1., n_matches=3)
+
+    with open(log_path) as f:
+        lines = [json.loads(line) for line in f]
+    assert len(lines) == 3 and lines[0]["strategy"] == "dense" and lines[0]["realized"]["n_matches"] == 3
+
+    # the median of 1, 2 and 6 seconds over the same model
+    assert calibrate(log_path) == {"dense": pytest.approx(2. / plan.model_vars)}
+    EnginePlanner().record("b", plan, {}) # no log: nothing to do
@@ -0,0 +1,84 @@
+## StageProfiler: one artifact per profiled stage and batch, stages it is not asked for run unprofiled
+
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+
+import pytest
+
+from ffengine.profiling import StageProfiler, run_stage
+
+
+def work(n=20_000):
+    return sum(i * i for i in range(n))
+
+
+def test_cprofile_artifacts(tmp_path):
+    profiler = StageProfiler(str(tmp_path), stages=["match"], memory=True)
+    assert run_stage(profiler, "b/1", "match", work) == work() # the stage's result goes through
+    assert run_stage(profiler, "b/1", "get_matches", work) == work()
+
+    # batch ids are file names: the separator is replaced
+    assert sorted(os.listdir(tmp_path)) == ["b_1.match.mem.txt", "b_1.match.prof", "b_1.match.tracemalloc"]
+    stats = pstats.Stats(str(tmp_path / "b_1.match.prof"))
+    assert any(func[2] == "work" for func in stats.stats)
+    assert (tmp_path / "b_1.match.mem.txt").read_text().startswith("match of batch b/1:")
+    tracemalloc.Snapshot.load(str(tmp_path / "b_1.match.tracemalloc"))
+    assert not tracemalloc.is_tracing() # stopped again, it was not tracing before
+
+
+def test_concurrent_memory_stages(tmp_path):
+    profiler = StageProfiler(str(tmp_path), stages=["match"], memory=True)
+    entered, errors = threading.Event(), []
+
+    def stage(batch_id, seconds):
+        def fn():
+            entered.set()
+            time.sleep(seconds)
+            return work()
+        try:
+            profiler.run(batch_id, "match", fn)
+        except Exception as e:
+            errors.append(e)
+
+    # b starts while a traces and outlasts it: a's stop must not end b's tracing
+    a = threading.Thread(target=stage, args=("a", .05))
+    a.start()
+    entered.wait(5)
+    b = threading.Thread(target=stage, args=("b", .2))
+    b.start()
+    a.join(5), b.join(5)
+
+    assert errors == []
+    assert {"a.match.mem.txt", "b.match.mem.txt"} <= set(os.listdir(tmp_path))
+    assert not tracemalloc.is_tracing()
+
+
+def test_sample_artifacts(tmp_path):
+    profiler = StageProfiler(str(tmp_path), mode="sample", interval=0.001)
+    run_stage(profiler, 7, "construct_params", lambda: work(2_000_000))
+
+    lines = (tmp_path / "7.construct_params.folded").read_text().splitlines()
+    assert lines and all(line.rsplit(" ", 1)[1].isdigit() for line in lines)
+    assert any("work (" in line for line in lines)
+
+
+def test_stage_errors_still_write(tmp_path):
+    profiler = StageProfiler(str(tmp_path))
+    with pytest.raises(ZeroDivisionError):
+        profiler.run("b", "match", lambda: 1 / 0)
+    assert os.listdir(tmp_path) == ["b.match.prof"]
+
+
+def test_from_env(monkeypatch, tmp_path):
+    monkeypatch.delenv("FFENGINE_PROFILE", raising=False)
+    assert StageProfiler.from_env() is None
+    assert run_stage(None, "b", "match", work) == work()
+
+    monkeypatch.setenv("FFENGINE_PROFILE", "sample")
+    monkeypatch.setenv("FFENGINE_PROFILE_STAGES", "match, get_matches")
+    monkeypatch.setenv("FFENGINE_PROFILE_DIR", str(tmp_path))
+    profiler = StageProfiler.from_env()
+    assert (profiler.mode, profiler.stages, profiler.out_dir, profiler.memory) == ("sample", {"match", "get_matches"}, str(tmp_path), False)
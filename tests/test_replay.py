@@ -0,0 +1,28 @@
+## Batch recordings: one directory per batch under the recording root, whatever the batch id
+
+import os
+
+import pytest
+
+from ffengine.replay import BatchRecorder, list_batches, load_batch
+from _fixtures import make_testcase
+
+
+def test_batch_ids_stay_under_root(tmp_path):
+    root = str(tmp_path / "records")
+    orderset = make_testcase(3, 3, 2, random_seed=0).order_set
+    recorder = BatchRecorder(root)
+
+    for batch_id in ("b1", "a/b", "../escaped"):
+        path = recorder.record(batch_id, orderset, {"unit_tcost": 1}, {"match": .1})
+        assert os.path.dirname(path) == root
+
+    assert list_batches(root) == [".._escaped", "a_b", "b1"]
+    assert not os.path.exists(str(tmp_path / "escaped"))
+
+    record = load_batch(root, "a/b")
+    assert record["batch_id"] == "a/b" and record["orderset"].total_orders == orderset.total_orders
+
+    for batch_id in ("..", "."):
+        with pytest.raises(ValueError, match="cannot name"):
+            recorder.record(batch_id, orderset, {}, {})
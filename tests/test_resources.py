@@ -0,0 +1,51 @@
+## SolverPool: concurrent solves share the threads, environments are started without holding up other solves
+
+import threading
+from contextlib import ExitStack
+
+import pytest
+
+from ffengine.optim._resources import SolverPool
+
+
+def test_threads_never_exceed_total():
+    pool = SolverPool(max_concurrent=4, total_threads=4, vars_per_thread=10)
+    with ExitStack() as stack:
+        # the first solve is alone and big enough for every thread, later ones get what is left, at least one
+        threads = [stack.enter_context(pool.solve_slot(n_vars=10**6, env="env"))[1] for _ in range(3)]
+        assert threads == [4, 1, 1] and pool.n_threads == 6
+
+    assert (pool.n_active, pool.n_threads) == (0, 0)
+    with pool.solve_slot(n_vars=10**6, env="env") as (_, first), pool.solve_slot(n_vars=15, env="env") as (_, second):
+        assert (first, second) == (4, 1)
+        with pool.solve_slot(n_vars=10**6, env="env") as (_, third):
+            assert third == 1
+
+
+def test_released_when_the_env_fails():
+    pool = SolverPool(max_concurrent=1, total_threads=2)
+    pool._new_env = lambda: 1 / 0
+    with pytest.raises(ZeroDivisionError):
+        with pool.solve_slot(n_vars=10):
+            pass
+    assert (pool.n_active, pool.n_threads) == (0, 0)
+    with pool.solve_slot(n_vars=10, env="env") as (env, threads): # the slot was given back
+        assert threads == 1
+
+
+def test_envs_start_outside_the_lock():
+    pool = SolverPool(max_concurrent=2, total_threads=2)
+    started, overlap = threading.Barrier(2, timeout=5), []
+
+    def new_env():
+        started.wait() # both solves start an environment at once
+        overlap.append(True)
+        return object()
+    pool._new_env = new_env
+
+    workers = [threading.Thread(target=lambda: pool.release_env(pool.acquire_env())) for _ in range(2)]
+    for w in workers:
+        w.start()
+    for w in workers:
+        w.join(5)
+    assert overlap == [True, True] and pool.n_envs == 2 and len(pool._idle_envs) == 2
@@ -0,0 +1,41 @@
+## MatchingEngineService on a LocalBus: a solved batch is published in messages of MATCH_BATCH_SIZE matches
+
+import asyncio
+import json
+import math
+
+import pytest
+
+from ffengine.data.messages import parse_orders_message
+from service._localbus import LocalBus, LocalMatchingEngineService
+from service.app import API_TOPIC
+from service.loadgen import batch_messages
+from _fixtures import make_testcase
+
+
+def test_match_messages():
+    pytest.importorskip("gurobipy")
+    orderset = make_testcase(10, 10, 1, random_seed=0).order_set
+
+    async def run():
+        bus = LocalBus()
+        published = []
+        async def collect(payload):
+            published.append(json.loads(payload))
+        bus.subscribe(API_TOPIC, collect)
+
+        service = LocalMatchingEngineService(bus)
+        await service._start_service()
+        for message in batch_messages(orderset, "b1", chunk=4):
+            await service.handle_orders(*parse_orders_message(message))
+        await bus.drain()
+        await service._stop_service()
+        return service, [m["message"] for m in published if m["type"] == "mate.match.batch"]
+
+    service, messages = asyncio.run(run())
+    total = messages[0]["totalMatches"]
+    assert total > service.MATCH_BATCH_SIZE # more than one message
+    assert len(messages) == math.ceil(total / service.MATCH_BATCH_SIZE)
+    assert [m["messageSize"] for m in messages] == [len(m["matches"]) for m in messages]
+    assert all(len(m["matches"]) == service.MATCH_BATCH_SIZE for m in messages[:-1])
+    assert sum(len(m["matches"]) for m in messages) == total
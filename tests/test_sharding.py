@@ -0,0 +1,31 @@
+## GridPartitioner cells: service regions across the antimeridian reach the cells on the other side
+
+import numpy as np
+import pytest
+
+from ffengine.optim._sharding import GridPartitioner
+
+
+@pytest.mark.parametrize("lat", [0., 45., -70.])
+def test_cells_in_range_wraps_antimeridian(lat):
+    grid = GridPartitioner(cell_km=50, target_orders=100)
+    i, j = grid.cells([lat, lat], [179.9, -179.9])
+    touched = set(grid.cells_in_range(lat, 179.9, 30))
+
+    assert (int(i[0]), int(j[0])) in touched
+    assert (int(i[1]), int(j[1])) in touched # 20ish km east, across the antimeridian
+    assert (int(i[0]), int(j[0])) in set(grid.cells_in_range(lat, -179.9, 30)) # and back
+
+    n_cols = grid._band_columns(np.array([i for i, _ in touched]))
+    assert all(0 <= j < n for (_, j), n in zip(touched, n_cols))
+
+
+def test_antimeridian_columns():
+    grid = GridPartitioner(cell_km=500, target_orders=100)
+    lat = np.linspace(-89, 89, 50)
+    i, j = grid.cells(np.concatenate([lat, lat]), np.concatenate([np.full(50, -180.), np.full(50, 180.)]))
+    n_cols = grid._band_columns(i)
+
+    assert (j >= 0).all() and (j < n_cols).all()
+    assert (j[:50] == 0).all()
+    assert ((j[50:] == 0) | (j[50:] == n_cols[50:] - 1)).all() # the same meridian: its own cell or the neighbour across it
@@ -0,0 +1,69 @@
+## Shared memory shard transport: workers attach to the creator's blocks without touching its resource tracker registration
+
+import os
+import subprocess
+import sys
+import textwrap
+
+import pytest
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+
+def run_script(tmp_path, script: str) -> subprocess.CompletedProcess:
+    '''in a fresh interpreter: the resource tracker is a separate process that reports on the stderr it inherited.
+    From a file, spawned workers import its functions from there'''
+    path = tmp_path / "script.py"
+    path.write_text(textwrap.dedent(script))
+    env = {**os.environ, "PYTHONPATH": os.pathsep.join([ROOT, os.path.join(ROOT, "tests")])}
+    return subprocess.run([sys.executable, str(path)], env=env, capture_output=True, text=True, timeout=120)
+
+
+# workers started before (early) or after the first block exists, the latter share the creator's tracker
+@pytest.mark.parametrize("method", ["fork", "spawn", "forkserver"])
+@pytest.mark.parametrize("early", [False, True])
+def test_attach(tmp_path, method, early):
+    result = run_script(tmp_path, f'''
+        import multiprocessing
+        from concurrent.futures import ProcessPoolExecutor
+        import numpy as np
+        from ffengine.optim._shm import SharedArrays
+
+        def total(handle):
+            arrays, shm = handle.attach()
+            try:
+                return float(arrays["x"].sum())
+            finally:
+                del arrays
+                shm.close()
+
+        if __name__ == "__main__":
+            with ProcessPoolExecutor(2, mp_context=multiprocessing.get_context("{method}")) as executor:
+                if {early}:
+                    executor.submit(int).result()
+                with SharedArrays({{"x": np.arange(10.)}}) as shared:
+                    print(list(executor.map(total, [shared.handle] * 4)))
+    ''')
+    assert result.returncode == 0, result.stderr
+    assert result.stdout.strip() == "[45.0, 45.0, 45.0, 45.0]"
+    assert result.stderr == ""
+
+
+def test_sharded_engine_two_workers(tmp_path):
+    pytest.importorskip("gurobipy")
+    result = run_script(tmp_path, '''
+        from ffengine.optim._sharding import ShardedEngine, ProcessPoolTransport
+        from _fixtures import make_testcase
+
+        if __name__ == "__main__":
+            transport = ProcessPoolTransport(max_workers=2)
+            try:
+                engine = ShardedEngine(make_testcase(8, 8, 2, random_seed=0).order_set, target_orders=6, cell_km=1, transport=transport)
+                engine.construct_params()
+                engine.match()
+                assert engine.shared_memory and engine.stats["n_shards"] > 1
+            finally:
+                transport.close()
+    ''')
+    assert result.returncode == 0, result.stderr
+    assert result.stderr == ""
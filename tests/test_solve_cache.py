@@ -0,0 +1,46 @@
+## Solve cache in the service: a repeated batch is answered from the cache, without planning or building an engine
+
+import asyncio
+import json
+
+from ffengine.optim import SolveCache, EnginePlanner
+from service._localbus import LocalBus, LocalMatchingEngineService
+from service.app import API_TOPIC, ORDERS_TOPIC
+from service.loadgen import batch_messages
+from _fixtures import make_testcase
+
+
+def test_repeat_batch_hits_cache():
+    orderset = make_testcase(4, 4, 2, random_seed=0).order_set
+
+    async def run():
+        bus = LocalBus()
+        published = {}
+        async def collect(payload):
+            data = json.loads(payload)
+            if data["type"] == "mate.match.batch":
+                published.setdefault(data["message"]["batchId"], []).extend(data["message"]["matches"])
+        bus.subscribe(API_TOPIC, collect)
+
+        service = LocalMatchingEngineService(bus)
+        service.SOLVE_CACHE = SolveCache()
+        service.PLANNER = EnginePlanner()
+        engines = []
+        make_engine = service.PLANNER.make_engine
+        service.PLANNER.make_engine = lambda *args, **kwargs: engines.append(make_engine(*args, **kwargs)) or engines[-1]
+
+        stats = []
+        for batch_id in ("r0", "r1"): # same orders, another batch id
+            for m in batch_messages(orderset, batch_id, chunk=4):
+                await bus.publish(None, data=m, topic=ORDERS_TOPIC)
+            await bus.drain()
+            stats.append(service.SOLVE_CACHE.stats())
+        return published, stats, engines
+
+    published, stats, engines = asyncio.run(run())
+    assert (stats[0]["hits"], stats[0]["misses"]) == (0, 1)
+    assert (stats[1]["hits"], stats[1]["misses"]) == (1, 1)
+    assert len(engines) == 1 # the hit built no engine
+    assert published["r0"]
+    key = lambda m: (m["buyOrder"], m["sellOrder"], m["volume"])
+    assert sorted(map(key, published["r0"])) == sorted(map(key, published["r1"]))
@@ -0,0 +1,47 @@
+## Columnar on-disk format: OrderSets and MatchSets round-trip through save/load, memory mapped or not
+
+import numpy as np
+import pytest
+
+from ffengine.data import MatchSet
+from ffengine.data.matches import Match
+from ffengine.data.storage import save_orderset, load_orderset, save_matchset, load_matchset
+from _fixtures import make_testcase
+
+
+def order_dicts(orderset):
+    return [vars(o) for o in orderset.iter_buy_orders()], [vars(o) for o in orderset.iter_sell_orders()]
+
+
+def match_dicts(matchset):
+    return [m.to_dict() for m in matchset.iter_matches()]
+
+
+@pytest.mark.parametrize("mmap", [True, False])
+def test_roundtrip(tmp_path, mmap):
+    orderset = make_testcase(5, 4, 3, random_seed=0).order_set
+    matches = MatchSet()
+    for u, v, price, quantity in ((0, 1, 120., 2), (2, 1, 130., 3), (4, 3, 95., 1)):
+        matches.add_match(Match(buy_order=orderset.get_buy_order(u), sell_order=orderset.get_sell_order(v), price_cents=price, quantity=quantity))
+
+    save_orderset(orderset, str(tmp_path / "orderset"))
+    save_matchset(matches, str(tmp_path / "matches"))
+    loaded = load_orderset(str(tmp_path / "orderset"), mmap=mmap)
+    loaded_matches = load_matchset(str(tmp_path / "matches"), loaded, mmap=mmap)
+
+    assert (loaded.n_buy_orders, loaded.n_sell_orders) == (orderset.n_buy_orders, orderset.n_sell_orders)
+    for col, arr in orderset.get_buy_columns().items():
+        assert np.array_equal(loaded.get_buy_columns()[col], arr), col
+    assert loaded.get_sell_order(2) == orderset.get_sell_order(2)
+    assert loaded[orderset.get_buy_order(3).order_id].int_order_id == 3
+    assert order_dicts(loaded) == order_dicts(orderset)
+
+    assert loaded_matches.n_matches == 3
+    assert match_dicts(loaded_matches) == match_dicts(matches)
+
+
+def test_wrong_format(tmp_path):
+    orderset = make_testcase(2, 2, 1, random_seed=0).order_set
+    save_orderset(orderset, str(tmp_path / "orderset"))
+    with pytest.raises(AssertionError, match="is not a saved"):
+        load_matchset(str(tmp_path / "orderset"), orderset)
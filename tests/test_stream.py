@@ -0,0 +1,74 @@
+## ffengine.stream: grouping messages into batches, eviction of open batches, late and malformed messages
+
+import json
+
+from ffengine.stream import group_batches, parse_messages
+from service.loadgen import batch_messages
+from _fixtures import make_testcase
+
+
+def new_stats():
+    return {"bad_lines": 0, "duplicates": 0, "late": 0, "complete": 0, "incomplete": 0, "matches": 0, "errors": 0}
+
+
+def lines(messages):
+    return [json.dumps(m) + "\n" for m in messages]
+
+
+def test_groups_interleaved_batches():
+    a, b = make_testcase(3, 3, 2, random_seed=0).order_set, make_testcase(4, 3, 2, random_seed=1).order_set
+    ma, mb = batch_messages(a, "a", chunk=1), batch_messages(b, "b", chunk=4, allow_partial_fill=True)
+    messages = [m for pair in zip(ma, mb) for m in pair] + ma[len(mb):] + mb[len(ma):]
+
+    # an order update is not an order, in a v1 message or inside a v2 one
+    updated = {**ma[0], "type": "buyOrder.updated"}
+    in_batch = {**mb[0], "message": {**mb[0]["message"], "messages": [{**mb[0]["message"]["messages"][0], "type": "buyOrder.updated"}]}}
+
+    stats = new_stats()
+    batches = list(group_batches(parse_messages(lines([updated, in_batch] + messages) + ["not json\n"], stats), stats))
+
+    assert [(batch_id, complete) for batch_id, _, _, complete in batches] == [("b", True), ("a", True)]
+    (_, sb, partial_b, _), (_, sa, partial_a, _) = batches
+    assert (sa.n_buy_orders, sa.n_sell_orders, partial_a) == (a.n_buy_orders, a.n_sell_orders, False)
+    assert (sb.n_buy_orders, sb.n_sell_orders, partial_b) == (b.n_buy_orders, b.n_sell_orders, True)
+    assert stats["complete"] == 2 and stats["bad_lines"] == 3
+
+
+def test_duplicates_and_late_messages():
+    a = make_testcase(3, 3, 2, random_seed=0).order_set
+    messages = batch_messages(a, "a", chunk=1)
+    stats = new_stats()
+    # a redelivered message while the batch is open, then one after it closed
+    batches = list(group_batches(parse_messages(lines(messages[:1] + messages + messages[-1:]), stats), stats))
+
+    assert len(batches) == 1 and batches[0][3]
+    assert stats["duplicates"] == 1 and stats["late"] == 1
+
+
+def test_eviction():
+    a, b = make_testcase(3, 3, 2, random_seed=0).order_set, make_testcase(3, 3, 2, random_seed=1).order_set
+    ma, mb = batch_messages(a, "a", chunk=1), batch_messages(b, "b", chunk=1)
+    # a is still open when b starts: with room for one open batch a is evicted, its remaining messages are late
+    messages = ma[:2] + mb + ma[2:]
+
+    for incomplete, expected in (("drop", [("b", True)]), ("solve", [("a", False), ("b", True)])):
+        stats = new_stats()
+        batches = list(group_batches(parse_messages(lines(messages), stats), stats, max_open_batches=1, incomplete=incomplete))
+        assert [(batch_id, complete) for batch_id, _, _, complete in batches] == expected
+        assert stats["incomplete"] == 1 and stats["late"] == len(ma) - 2
+
+    # the same with an order budget of one batch: b's orders push the open orders over it, a is the oldest
+    stats = new_stats()
+    batches = list(group_batches(parse_messages(lines(messages), stats), stats, max_open_orders=len(mb)))
+    assert [(batch_id, complete) for batch_id, _, _, complete in batches] == [("b", True)]
+    assert stats["incomplete"] == 1
+
+
+def test_leftover_batches():
+    a = make_testcase(3, 3, 2, random_seed=0).order_set
+    messages = batch_messages(a, "a", chunk=1)[:-1] # never completes
+    for incomplete, n in (("drop", 0), ("solve", 1)):
+        stats = new_stats()
+        batches = list(group_batches(parse_messages(lines(messages), stats), stats, incomplete=incomplete))
+        assert len(batches) == n and stats["incomplete"] == 1
+    assert batches[0][1].total_orders == len(messages)
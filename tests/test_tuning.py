@@ -0,0 +1,42 @@
+## ffengine.tuning: the parameter grid, picking the best setting per size class, and the profile it writes
+
+import pytest
+
+from ffengine.optim._tuning import SolverProfile
+from ffengine.tuning import grid, select
+
+
+def test_grid():
+    points = grid({"MIPFocus": [0, 1], "Cuts": [-1, 0, 2]})
+    assert points[0] == {} and len(points) == 1 + 2 * 3
+    assert {"Cuts": 2, "MIPFocus": 1} in points
+    assert grid({}) == [{}]
+
+
+def run(instance, params, objective, runtime):
+    return {"instance": instance, "params": params, "objective": objective, "runtime": runtime}
+
+
+def test_select():
+    fast = {"MIPFocus": 1}
+    results = [
+        run("a", {}, 10., 2.), run("b", {}, 5., 4.),
+        run("a", fast, 10., 1.), run("b", fast, 5., 1.),
+        # faster still, but misses the best objective of b: counted as twice the time limit there
+        run("a", {"MIPGap": .1}, 10., .1), run("b", {"MIPGap": .1}, 4., .1),
+        {**run("a", {"Cuts": 0}, None, None), "error": "no solution"},
+    ]
+    best = select(results, time_limit=10., tolerance=1e-4)
+    assert best["params"] == fast and best["n_instances"] == 2
+    assert best["score"] == pytest.approx(1.) and best["score"] < best["baseline_score"]
+
+    # a tie goes to the defaults
+    assert select([run("a", {}, 1., 1.), run("a", fast, 1., 1.)], None, 1e-4)["params"] == {}
+
+
+def test_profile(tmp_path):
+    profile = SolverProfile([{"max_vars": None, "params": {"Heuristics": .2}}, {"max_vars": 100, "params": {"MIPFocus": 1}}])
+    profile.save(str(tmp_path / "profile.json"))
+    loaded = SolverProfile.load(str(tmp_path / "profile.json"))
+    assert loaded.params_for(100) == {"MIPFocus": 1}
+    assert loaded.params_for(101) == {"Heuristics": .2}